@@ -16,7 +16,7 @@ def main():
             return
         # process shared argument across all functions
         command = int(sys.argv[1])
-        if command in [1, 2, 3, 4]:
+        if command in [1, 2, 3, 4, 7]:
             vehicle_config_file = sys.argv[2]
             aptg_config_file = sys.argv[3]
             with open(vehicle_config_file) as f:
@@ -25,7 +25,7 @@ def main():
             with open(aptg_config_file) as f:
                 aptg_config = yaml.load(f)
             aptg = APTG(av, aptg_config)
-        elif command in [5]:
+        elif command in [5, 6, 8]:
             aptg = load_object(sys.argv[2])
         else:
             print_help()
@@ -39,10 +39,16 @@ def main():
             trace_trajectory_at_phi_alpha(aptg, rad(float(sys.argv[4])), rad(float(sys.argv[5])))
         elif command == 3 and arg_count == 3:
             trace_trajectory_at_phi(aptg, rad(float(sys.argv[4])))
-        elif command == 4 and arg_count == 2:
-            build_aptg(aptg)
+        elif command == 4 and arg_count in [2, 3]:
+            build_aptg(aptg, parse_phi_bins(sys.argv[4]) if arg_count == 3 else None)
         elif command == 5 and arg_count == 3:
             plot_ptg_obstacle_grid(aptg, rad(float(sys.argv[3])), rad(float(sys.argv[4])))
+        elif command == 6 and arg_count in [2, 3]:
+            compact_aptg(aptg, sys.argv[3], int(sys.argv[4]) if arg_count == 3 else 8)
+        elif command == 7 and arg_count == 2:
+            print_phi_bins(aptg)
+        elif command == 8 and arg_count == 1:
+            print_memory_report(aptg)
         else:
             print_help()
     except:
@@ -118,7 +124,7 @@ def plot_ptg_obstacle_grid(aptg: APTG, init_phi: float, alpha: float):
     fig, ax = plt.subplots()
     for x in range(ptg.obstacle_grid.cell_count_x):
         for y in range(ptg.obstacle_grid.cell_count_y):
-            cell = ptg.obstacle_grid.cells[x, y]
+            cell = ptg.obstacle_grid.cell_by_idx(x, y)
             if cell is None:
                 continue
             for kd_pair in cell:
@@ -128,10 +134,50 @@ def plot_ptg_obstacle_grid(aptg: APTG, init_phi: float, alpha: float):
     plt.show()
 
 
-def build_aptg(aptg: APTG):
+def shard_dir(aptg: APTG) -> str:
+    return './jar/{0}_shards'.format(aptg.name)
+
+
+def parse_phi_bins(text: str) -> list:
+    # e.g. '0-3,7' -> [0, 1, 2, 3, 7]
+    phi_bins = []
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        phi_bins.extend(range(int(first), int(last if last else first) + 1))
+    return phi_bins
+
+
+def build_aptg(aptg: APTG, phi_bins: list = None):
+    # each phi bin is saved to a shard as soon as it is built, a rerun skips the saved ones
     print('building APTG, this will take a while!')
-    aptg.build()
+    aptg.build_shards(shard_dir(aptg), phi_bins)
+    missing = aptg.missing_shards(shard_dir(aptg))
+    if len(missing) > 0:
+        print('Phi bins {0} are not built yet, the APTG is assembled once all the shards are in {1}'.format(
+            missing, shard_dir(aptg)))
+        return
+    aptg.assemble(shard_dir(aptg))
     aptg.dump('./jar/{0}.pkl'.format(aptg.name))
+    print('APTG saved to ./jar/{0}.pkl'.format(aptg.name))
+
+
+def print_phi_bins(aptg: APTG):
+    missing = aptg.missing_shards(shard_dir(aptg))
+    for phi_bin, phi in enumerate(aptg.phi_bins()):
+        print('{0:4d}: phi_init = {1:6.1f}  {2}'.format(phi_bin, deg(phi), 'missing' if phi_bin in missing else
+                                                           aptg.shard_file(shard_dir(aptg), phi_bin)))
+
+
+def compact_aptg(aptg: APTG, file_name: str, distance_bits: int):
+    aptg.compact(distance_bits)
+    aptg.dump(file_name)
+    print('APTG saved to {0}, obstacle grids distances quantized on {1} bits'.format(file_name, distance_bits))
+
+
+def print_memory_report(aptg: APTG):
+    report = aptg.memory_report()
+    for component, size in report.items():
+        print('{0:>16}: {1:10.2f} MB'.format(component, size / 1024. ** 2))
 
 
 def print_help():
@@ -163,11 +209,14 @@ def print_help():
     print('       3: Initial articulation angle(phi) in deg')
     print('     Example: python aptg_runner.py 3 ./config/vehicle.yaml ./config/fwd_captg.yaml 0')
     print()
-    print('  4: Build an APTG and save it to a file')
+    print('  4: Build an APTG and save it to a file. Each phi bin is saved to ./jar/[APTG name]_shards as soon as it')
+    print('     is built and skipped by the next runs, so an interrupted build can be resumed. The APTG is saved once')
+    print('     all the bins are built. Bins can be built on several machines and the shards copied to one of them')
     print('     Arguments:')
     print('       1: Vehicle configuration file')
     print('       2: APTG configuration file')
-    print('     Example: python aptg_runner.py 4 ./config/vehicle.yaml ./config/fwd_captg.yaml')
+    print('       3: (optional) Phi bins to build, eg. 0-3,7 (see command 7). Default all')
+    print('     Example: python aptg_runner.py 4 ./config/vehicle.yaml ./config/fwd_captg.yaml 0-10')
     print()
     print('  5: Plot ptg obstacle grid from a prebuilt APTG pickle file')
     print('     Arguments:')
@@ -175,6 +224,24 @@ def print_help():
     print('       2: Initial articulation angle(phi) in deg')
     print('       3: Steering angle(alpha) in deg')
     print('     Example: python aptg_runner.py 5 ./jar/fwd_captg.pkl -30 15')
+    print()
+    print('  6: Compact the obstacle grids of a prebuilt APTG pickle file (quantized and compressed distances)')
+    print('     Arguments:')
+    print('       1: APTG pickle file')
+    print('       2: Output APTG pickle file')
+    print('       3: (optional) Bits per distance, 8 or 16. Default 8')
+    print('     Example: python aptg_runner.py 6 ./jar/fwd_captg.pkl ./jar/fwd_captg_8bit.pkl 8')
+    print()
+    print('  7: List the phi bins of an APTG and their built shards (see command 4)')
+    print('     Arguments:')
+    print('       1: Vehicle configuration file')
+    print('       2: APTG configuration file')
+    print('     Example: python aptg_runner.py 7 ./config/vehicle.yaml ./config/fwd_captg.yaml')
+    print()
+    print('  8: Print the memory used by a prebuilt APTG pickle file, by component')
+    print('     Arguments:')
+    print('       1: APTG pickle file')
+    print('     Example: python aptg_runner.py 8 ./jar/fwd_captg.pkl')
 
 
 if __name__ == "__main__":
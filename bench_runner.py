@@ -0,0 +1,93 @@
+import sys, traceback
+from prrt import benchmark
+
+
+def main():
+    try:
+        # if no arguments were passed print help
+        if len(sys.argv) == 1:
+            print_help()
+            return
+        command = int(sys.argv[1])
+        arg_count = len(sys.argv) - 2  # remove file name and command number
+
+        # process commands
+        if command == 1 and arg_count in [2, 3]:
+            baseline_file = sys.argv[4] if arg_count == 3 else None
+            if not run_planner_benchmark(sys.argv[2], sys.argv[3], baseline_file):
+                sys.exit(1)
+        elif command == 2 and arg_count in [2, 3]:
+            baseline_file = sys.argv[4] if arg_count == 3 else None
+            if not run_build_benchmark(sys.argv[2], sys.argv[3], baseline_file):
+                sys.exit(1)
+        else:
+            print_help()
+    except SystemExit:
+        raise
+    except:
+        print()
+        print('Error! Make sure to follow usage guidelines shown below')
+        print('Error details:')
+        print(traceback.print_exc())
+        print_help()
+
+
+def run_planner_benchmark(suite_file: str, results_file: str, baseline_file: str = None) -> bool:
+    results = benchmark.run_planner_benchmark(suite_file)
+    benchmark.save_results(results, results_file)
+    benchmark.print_summary(results)
+    print('Results saved to {0}'.format(results_file))
+    if baseline_file is None:
+        return True
+    suite = benchmark.load_suite(suite_file)
+    regressions = benchmark.compare_to_baseline(results, benchmark.load_results(baseline_file),
+                                                suite.get('tolerance', 0.25))
+    for regression in regressions:
+        print('REGRESSION: {0}'.format(regression))
+    if len(regressions) == 0:
+        print('No regressions against {0}'.format(baseline_file))
+    return len(regressions) == 0
+
+
+def run_build_benchmark(suite_file: str, results_file: str, baseline_file: str = None) -> bool:
+    results = benchmark.run_build_benchmark(suite_file)
+    benchmark.save_results(results, results_file)
+    benchmark.print_build_summary(results)
+    print('Results saved to {0}'.format(results_file))
+    if baseline_file is None:
+        return True
+    suite = benchmark.load_build_suite(suite_file)
+    regressions = benchmark.compare_to_baseline(results, benchmark.load_results(baseline_file),
+                                                suite.get('tolerance', 0.25), benchmark.BUILD_REGRESSION_METRICS)
+    for regression in regressions:
+        print('REGRESSION: {0}'.format(regression))
+    if len(regressions) == 0:
+        print('No regressions against {0}'.format(baseline_file))
+    return len(regressions) == 0
+
+
+def print_help():
+    print()
+    print('Benchmark Runner!')
+    print('Usage:')
+    print('Run: python bench_runner.py [command number] [arg1] [arg2] .... ')
+    print()
+    print('Commands:')
+    print('  1: Run the planner benchmark suite (fixed scenarios and seeds) and save the results as json')
+    print('     Arguments:')
+    print('       1: benchmark suite configuration file')
+    print('       2: results json file')
+    print('       3: (optional) baseline results json file, exits with status 1 on regressions')
+    print('     Example: python bench_runner.py 1 ./config/benchmark.yaml ./out/bench.json ./out/baseline.json')
+    print()
+    print('  2: Run the APTG build benchmark suite: time, peak memory, objects count and pickled size of each')
+    print('     build phase, memory report of the built APTGs. Results saved as json')
+    print('     Arguments:')
+    print('       1: build benchmark suite configuration file')
+    print('       2: results json file')
+    print('       3: (optional) baseline results json file, exits with status 1 on regressions')
+    print('     Example: python bench_runner.py 2 ./config/aptg_benchmark.yaml ./out/build.json ./out/build_base.json')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+import sys, traceback
+from prrt import golden
+import prrt.kernels as kernels
+
+
+def main():
+    try:
+        # if no arguments were passed print help
+        if len(sys.argv) == 1:
+            print_help()
+            return
+        command = int(sys.argv[1])
+        arg_count = len(sys.argv) - 2  # remove file name and command number
+
+        # process commands
+        if command == 1 and arg_count == 2:
+            record(sys.argv[2], sys.argv[3])
+        elif command == 2 and arg_count == 2:
+            if not compare(sys.argv[2], sys.argv[3]):
+                sys.exit(1)
+        else:
+            print_help()
+    except SystemExit:
+        raise
+    except:
+        print()
+        print('Error! Make sure to follow usage guidelines shown below')
+        print('Error details:')
+        print(traceback.print_exc())
+        print_help()
+
+
+def golden_file(golden_dir: str, case: dict) -> str:
+    return os.path.join(golden_dir, '{0}.npz'.format(case['name']))
+
+
+def record(suite_file: str, golden_dir: str):
+    suite = golden.load_suite(suite_file)
+    print('Kernels backend: {0}'.format(kernels.backend()))
+    os.makedirs(golden_dir, exist_ok=True)
+    for case in suite['cases']:
+        golden.record(suite, case, golden_file(golden_dir, case))
+        print('{0}: golden outputs saved to {1}'.format(case['name'], golden_file(golden_dir, case)))
+
+
+def compare(suite_file: str, golden_dir: str) -> bool:
+    suite = golden.load_suite(suite_file)
+    print('Kernels backend: {0}'.format(kernels.backend()))
+    same = True
+    for case in suite['cases']:
+        differences = golden.compare(suite, case, golden_file(golden_dir, case))
+        for difference in differences:
+            print('{0}: {1}'.format(case['name'], difference))
+        if len(differences) == 0:
+            print('{0}: same as {1}'.format(case['name'], golden_file(golden_dir, case)))
+        same = same and len(differences) == 0
+    return same
+
+
+def print_help():
+    print()
+    print('Golden Runner!')
+    print('Usage:')
+    print('Run: python golden_runner.py [command number] [arg1] [arg2] .... ')
+    print()
+    print('Commands:')
+    print('  1: Record the golden outputs of the APTG build and planner kernels, one file per suite case')
+    print('     Arguments:')
+    print('       1: golden suite configuration file')
+    print('       2: golden files directory')
+    print('     Example: python golden_runner.py 1 ./config/golden.yaml ./out/golden')
+    print()
+    print('  2: Compare the current implementation to the golden outputs, exits with status 1 on differences')
+    print('     beyond the suite tolerances')
+    print('     Arguments:')
+    print('       1: golden suite configuration file')
+    print('       2: golden files directory')
+    print('     Example: python golden_runner.py 2 ./config/golden.yaml ./out/golden')
+    print()
+    print('The kernels backend is selected with the PRRT_KERNELS environment variable: auto (default), numba or numpy')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import sys, traceback
+from prrt import eventlog
+
+
+def main():
+    try:
+        # if no arguments were passed print help
+        if len(sys.argv) == 1:
+            print_help()
+            return
+        command = int(sys.argv[1])
+        arg_count = len(sys.argv) - 2  # remove file name and command number
+
+        # process commands
+        if command == 1 and arg_count == 1:
+            header, records = eventlog.read_event_log(sys.argv[2])
+            eventlog.print_event_log_summary(header, records)
+        elif command == 2 and arg_count in [2, 3]:
+            header, records = eventlog.read_event_log(sys.argv[2])
+            step = int(sys.argv[4]) if arg_count == 3 else 50
+            frames = eventlog.render_tree_growth(header, records, sys.argv[3], step)
+            print('Saved {0} tree growth frames'.format(frames))
+        else:
+            print_help()
+    except:
+        print()
+        print('Error! Make sure to follow usage guidelines shown below')
+        print('Error details:')
+        print(traceback.print_exc())
+        print_help()
+
+
+def print_help():
+    print()
+    print('Event Log Runner!')
+    print('Usage:')
+    print('Run: python log_runner.py [command number] [arg1] [arg2] .... ')
+    print()
+    print('Commands:')
+    print('  1: Print a summary of a tree growth event log (see event_log_file in planner.yaml)')
+    print('     Arguments:')
+    print('       1: event log file')
+    print('     Example: python log_runner.py 1 ./out/events.bin')
+    print('  2: Plot the tree growth, one frame every n iterations')
+    print('     Arguments:')
+    print('       1: event log file')
+    print('       2: frames location, name will be post-fixed with the frame number')
+    print('       3: (optional) iterations per frame, default 50')
+    print('     Example: python log_runner.py 2 ./out/events.bin ./out/growth 50')
+
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,7 @@ def main():
             with open(planner_config_file) as f:
                 planner_config = yaml.load(f)
             #planner = Planner(planner_config)
-        else:
+        elif command != 3:
             print_help()
             return
         arg_count = len(sys.argv) - 2  # remove file name and command number
@@ -55,6 +55,9 @@ def main():
                                   solving_time)
             print("Finish, building statistics")
             del planner
+        elif command == 3 and arg_count in [2, 3]:
+            tile_size = int(sys.argv[4]) if arg_count == 3 else 256
+            convert_map(sys.argv[2], sys.argv[3], tile_size)
 
         else:
             print_help()
@@ -87,6 +90,13 @@ def statistics_to_csv(file_name='.\out\stats.csv',
 
     print('Dumping solution to csv file done')
 
+def convert_map(png_file: str, tiled_file: str, tile_size: int):
+    from prrt.tiledmap import convert_png_to_tiled_map
+    header = convert_png_to_tiled_map(png_file, tiled_file, tile_size)
+    print('Saved {0}: {1}x{2} cells, {3}x{4} tiles of {5}x{5} cells'.format(tiled_file, header['width'],
+                                                                        header['height'], header['tiles_x'],
+                                                                        header['tiles_y'], tile_size))
+
 def print_help():
     print()
     print('Planner Runner!')
@@ -103,6 +113,12 @@ def print_help():
     print('       1: planner configuration file')
     print('       2: number of iterations')
     print('     Example: python planner_runner.py 2 ./config/planner.yaml 100')
+    print('  3: Convert a png map to a tiled map (.tmap), memory mapped by the planner when used as world_map_file')
+    print('     Arguments:')
+    print('       1: png map file')
+    print('       2: tiled map file')
+    print('       3: (optional) tile size in cells, multiple of 8 (default 256)')
+    print('     Example: python planner_runner.py 3 ./maps/lot.png ./maps/lot.tmap')
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,337 @@
+import contextlib
+import copy
+import gc
+import io
+import json
+import multiprocessing
+import pickle
+import platform
+import sys
+import time
+from typing import List
+import numpy as np
+import yaml
+
+# Metrics compared against the baseline and whether larger values are better
+REGRESSION_METRICS = {'success_rate': True,
+                      'time_to_first_solution': False,
+                      'iterations_per_second': True,
+                      'nodes_per_second': True,
+                      'path_length': False,
+                      'peak_memory_mb': False,
+                      'cold_start_time': False}
+
+# Same for the APTG build benchmark
+BUILD_REGRESSION_METRICS = {'build_time_per_ptg': False,
+                            'peak_memory_mb': False,
+                            'pickled_size_mb': False}
+
+# PTG.build() steps, timed separately by the APTG build benchmark
+BUILD_PHASES = ('build_cpoints', 'build_obstacle_grid', 'build_cpoints_grid', 'build_inverse_table')
+
+
+def peak_memory_mb() -> float:
+    """
+    Peak resident set size of the current process in MB (nan if not available on this platform),
+    since the process start or the last reset_peak_memory()
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024. ** 2 if sys.platform == 'darwin' else peak / 1024.
+
+
+def reset_peak_memory() -> bool:
+    """
+    Resets the peak resident set size to the current one (Linux only)
+    :return: False if not supported, peak_memory_mb() then keeps reporting the peak since the process start
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def load_suite(suite_file: str) -> dict:
+    with open(suite_file) as f:
+        suite = yaml.safe_load(f)
+    with open(suite['planner_config']) as f:
+        suite['base_config'] = yaml.safe_load(f)
+    return suite
+
+
+def scenario_config(suite: dict, scenario: dict, seed: int) -> dict:
+    """
+    Builds the planner configuration of a single run: the base planner configuration overridden by the
+    suite overrides, the scenario fields and the seed. File outputs and plots are disabled.
+    """
+    config = copy.deepcopy(suite['base_config'])
+    config.update(suite.get('overrides') or {})
+    config.update({key: value for key, value in scenario.items() if key != 'name'})
+    config['seed'] = seed
+    config['csv_out_file'] = ''
+    config['plot_tree_file'] = ''
+    config['plot_solution'] = ''
+    config['debug_tree_state'] = 0
+    return config
+
+
+def run_planner_once(config: dict) -> dict:
+    """
+    Solves a single planner query and returns its metrics. Meant to run in a fresh process
+    so the reported peak memory belongs to this run only. The cold start time covers what a fresh
+    planning worker pays before its first iteration: the planner import and loading the APTGs and the map.
+    """
+    start = time.perf_counter()
+    from prrt.planner import Planner
+    import prrt.kernels as kernels
+    planner = Planner(config)
+    # the planner is chatty, keep its output out of the benchmark report
+    with contextlib.redirect_stdout(io.StringIO()):
+        planner.setup()
+        cold_start_time = time.perf_counter() - start
+        result = planner.solve()
+        success, iterations, nodes, path_length, distance_to_target, solving_time = planner.getResults()
+    return {'seed': config['seed'],
+            'success': bool(success),
+            'iterations': iterations,
+            'nodes': nodes,
+            'path_length': path_length if success else None,
+            'distance_to_target': distance_to_target,
+            'solving_time': solving_time,
+            'first_solution_time': result.first_solution_time if success else None,
+            'cold_start_time': cold_start_time,
+            'matplotlib_loaded': 'matplotlib' in sys.modules,
+            'peak_memory_mb': peak_memory_mb(),
+            'kernels_backend': kernels.backend()}
+
+
+def summarize_runs(runs: List[dict]) -> dict:
+    solved = [run for run in runs if run['success']]
+    total_time = sum(run['solving_time'] for run in runs)
+
+    def mean(values):
+        values = [v for v in values if v is not None]
+        return float(np.mean(values)) if len(values) > 0 else None
+
+    return {'runs_count': len(runs),
+            'success_rate': len(solved) / len(runs),
+            'time_to_first_solution': mean([run['first_solution_time'] for run in solved]),
+            'iterations_per_second': sum(run['iterations'] for run in runs) / total_time,
+            'nodes_per_second': sum(run['nodes'] for run in runs) / total_time,
+            'path_length': mean([run['path_length'] for run in solved]),
+            'distance_to_target': mean([run['distance_to_target'] for run in runs]),
+            'peak_memory_mb': max(run['peak_memory_mb'] for run in runs),
+            'cold_start_time': mean([run['cold_start_time'] for run in runs]),
+            'kernels_backend': ','.join(sorted(set(run.get('kernels_backend', '-') for run in runs)))}
+
+
+def run_planner_benchmark(suite_file: str) -> dict:
+    """
+    Runs every scenario of the benchmark suite once per seed, each run in a fresh process
+    """
+    suite = load_suite(suite_file)
+    results = {'suite': suite_file,
+               'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'python': platform.python_version(),
+               'machine': platform.machine(),
+               'scenarios': {}}
+    for scenario in suite['scenarios']:
+        runs = []
+        for seed in suite['seeds']:
+            config = scenario_config(suite, scenario, seed)
+            with multiprocessing.Pool(processes=1, maxtasksperchild=1) as pool:
+                run = pool.apply(run_planner_once, (config,))
+            print('{0} seed={1}: success={2}, nodes={3}, time={4:.2f}s'.format(scenario['name'], seed,
+                                                                            run['success'], run['nodes'],
+                                                                            run['solving_time']))
+            runs.append(run)
+        summary = summarize_runs(runs)
+        summary['runs'] = runs
+        results['scenarios'][scenario['name']] = summary
+    return results
+
+
+def load_build_suite(suite_file: str) -> dict:
+    with open(suite_file) as f:
+        suite = yaml.safe_load(f)
+    with open(suite['vehicle_config']) as f:
+        suite['vehicle'] = yaml.safe_load(f)
+    suite['aptg_configs'] = []
+    for aptg_file in suite['aptgs']:
+        with open(aptg_file) as f:
+            suite['aptg_configs'].append(yaml.safe_load(f))
+    return suite
+
+
+def build_phi_bins(phi_bins_count: int, ptgs_per_run: int) -> List[int]:
+    """
+    The ptgs_per_run phi bins around phi = 0 (all of them if ptgs_per_run is 0)
+    """
+    if ptgs_per_run <= 0 or ptgs_per_run >= phi_bins_count:
+        return list(range(phi_bins_count))
+    first = (phi_bins_count - ptgs_per_run) // 2
+    return list(range(first, first + ptgs_per_run))
+
+
+def run_build_once(vehicle_config: dict, aptg_config: dict, ptgs_per_run: int) -> dict:
+    """
+    Builds the ptgs of an APTG phase by phase and returns the metrics of each phase. Meant to run in a fresh
+    process, as run_planner_once. Phase times exclude the measurements (pickling, objects count).
+    """
+    from prrt.ptg import APTG
+    from prrt.vehicle import ArticulatedVehicleFactory
+    import prrt.kernels as kernels
+    aptg = APTG(ArticulatedVehicleFactory.build_av(vehicle_config), aptg_config)
+    phis = aptg.phi_bins()
+    phases = {phase: {'time': 0., 'peak_memory_mb': 0., 'objects': 0, 'pickled_size_mb': 0.}
+              for phase in BUILD_PHASES}
+    peak_memory_reset = True
+    with contextlib.redirect_stdout(io.StringIO()):
+        for phi_bin in build_phi_bins(len(phis), ptgs_per_run):
+            ptg = aptg.new_ptg(phis[phi_bin])
+            pickled_size = len(pickle.dumps(ptg, pickle.HIGHEST_PROTOCOL))
+            for phase in BUILD_PHASES:
+                if phase == 'build_inverse_table' and ptg.closed_form_inverse:
+                    continue  # as in PTG.build
+                objects_count = len(gc.get_objects())
+                peak_memory_reset = reset_peak_memory() and peak_memory_reset
+                start = time.perf_counter()
+                getattr(ptg, phase)()
+                metrics = phases[phase]
+                metrics['time'] += time.perf_counter() - start
+                metrics['peak_memory_mb'] = max(metrics['peak_memory_mb'], peak_memory_mb())
+                metrics['objects'] += len(gc.get_objects()) - objects_count
+                size = len(pickle.dumps(ptg, pickle.HIGHEST_PROTOCOL))
+                metrics['pickled_size_mb'] += (size - pickled_size) / 1024. ** 2
+                pickled_size = size
+            aptg.ptgs.append(ptg)
+    return {'phi_bins_count': len(phis),
+            'ptgs_built': len(aptg.ptgs),
+            'cpoints_count': sum(len(cpoints_at_k) for ptg in aptg.ptgs for cpoints_at_k in ptg.cpoints),
+            'obstacle_grid_pairs': sum(len(ptg.obstacle_grid.rows()[1]) for ptg in aptg.ptgs),
+            'phases': phases,
+            'peak_memory_reset': peak_memory_reset,
+            'kernels_backend': kernels.backend(),
+            'pickled_size_mb': len(pickle.dumps(aptg, pickle.HIGHEST_PROTOCOL)) / 1024. ** 2,
+            'memory_report': aptg.memory_report()}
+
+
+def run_build_benchmark(suite_file: str) -> dict:
+    """
+    Builds every APTG of the build benchmark suite at each resolution, each build in a fresh process
+    """
+    suite = load_build_suite(suite_file)
+    results = {'suite': suite_file,
+               'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'python': platform.python_version(),
+               'machine': platform.machine(),
+               'scenarios': {}}
+    for aptg_config in suite['aptg_configs']:
+        for resolution in suite['resolutions']:
+            config = copy.deepcopy(aptg_config)
+            config.update(resolution.get('overrides') or {})
+            name = '{0}/{1}'.format(aptg_config['name'], resolution['name'])
+            with multiprocessing.Pool(processes=1, maxtasksperchild=1) as pool:
+                run = pool.apply(run_build_once, (suite['vehicle'], config, suite.get('ptgs_per_run', 1)))
+            build_time = sum(phase['time'] for phase in run['phases'].values())
+            run['build_time'] = build_time
+            run['build_time_per_ptg'] = build_time / run['ptgs_built']
+            run['peak_memory_mb'] = max(phase['peak_memory_mb'] for phase in run['phases'].values())
+            print('{0}: {1} ptgs built in {2:.2f}s'.format(name, run['ptgs_built'], build_time))
+            results['scenarios'][name] = run
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float = 0.25,
+                        metrics: dict = REGRESSION_METRICS) -> List[str]:
+    """
+    Compares benchmark results to a saved baseline.
+    :param tolerance: allowed relative degradation of each metric (0.25 = 25%)
+    :param metrics: compared metrics and whether larger values are better, see REGRESSION_METRICS
+    :return: list of regressions, empty if none
+    """
+    regressions = []
+    for name, base_summary in baseline['scenarios'].items():
+        summary = results['scenarios'].get(name)
+        if summary is None:
+            regressions.append('{0}: scenario missing from results'.format(name))
+            continue
+        for metric, higher_is_better in metrics.items():
+            base_value = base_summary.get(metric)
+            value = summary.get(metric)
+            if base_value is None or np.isnan(base_value):
+                continue
+            if value is None:
+                regressions.append('{0}: {1} not available (baseline {2:.4g})'.format(name, metric, base_value))
+                continue
+            if metric == 'success_rate':
+                regressed = value < base_value - tolerance
+            elif higher_is_better:
+                regressed = value < base_value * (1. - tolerance)
+            else:
+                regressed = value > base_value * (1. + tolerance)
+            if regressed:
+                regressions.append('{0}: {1} regressed from {2:.4g} to {3:.4g}'.format(name, metric, base_value,
+                                                                                     value))
+    return regressions
+
+
+def save_results(results: dict, file_name: str):
+    with open(file_name, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(file_name: str) -> dict:
+    with open(file_name) as f:
+        return json.load(f)
+
+
+def print_summary(results: dict):
+    print()
+    print('{0:<20}{1:>10}{2:>12}{3:>12}{4:>12}{5:>12}{6:>12}{7:>12}{8:>10}'.format('scenario', 'success',
+                                                                                'time(s)', 'iter/s', 'nodes/s',
+                                                                                'length(m)', 'peak(MB)',
+                                                                                'start(s)', 'kernels'))
+    for name, summary in results['scenarios'].items():
+        def fmt(value):
+            return '{0:>12.2f}'.format(value) if value is not None else '{0:>12}'.format('-')
+
+        print('{0:<20}{1:>10.2f}'.format(name, summary['success_rate']) + fmt(summary['time_to_first_solution']) +
+              fmt(summary['iterations_per_second']) + fmt(summary['nodes_per_second']) +
+              fmt(summary['path_length']) + fmt(summary['peak_memory_mb']) + fmt(summary.get('cold_start_time')) +
+              '{0:>10}'.format(summary.get('kernels_backend', '-')))
+
+
+def print_build_summary(results: dict):
+    print()
+    print('{0:<28}{1:>6}{2:>12}{3:>12}{4:>12}{5:>10}'.format('aptg', 'ptgs', 'time(s)', 'peak(MB)', 'pickle(MB)',
+                                                            'kernels') +
+          ''.join('{0:>22}'.format(phase) for phase in BUILD_PHASES))
+    for name, run in results['scenarios'].items():
+        phases = ''.join('{0:>10.2f}s {1:>8.1f}MB'.format(run['phases'][phase]['time'],
+                                                         run['phases'][phase]['peak_memory_mb'])
+                         for phase in BUILD_PHASES)
+        print('{0:<28}{1:>6}{2:>12.2f}{3:>12.1f}{4:>12.2f}{5:>10}'.format(name, run['ptgs_built'], run['build_time'],
+                                                                         run['peak_memory_mb'],
+                                                                         run['pickled_size_mb'],
+                                                                         run.get('kernels_backend', '-')) +
+              phases)
+    print()
+    components = [key for key in next(iter(results['scenarios'].values()))['memory_report']]
+    print('{0:<28}'.format('memory report (MB)') + ''.join('{0:>15}'.format(key) for key in components))
+    for name, run in results['scenarios'].items():
+        print('{0:<28}'.format(name) + ''.join('{0:>15.2f}'.format(run['memory_report'][key] / 1024. ** 2)
+                                               for key in components))
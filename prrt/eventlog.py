@@ -0,0 +1,219 @@
+import json
+import queue
+import struct
+import threading
+import numpy as np
+from prrt.primitive import PoseR2S2
+
+# File layout: MAGIC, header length (uint32), json header, then fixed size records (see RECORD)
+MAGIC = b'PRRTLOG1'
+HEADER_LENGTH = struct.Struct('<I')
+
+# Event types
+SAMPLE = 1  # random pose drawn: x, y, theta
+NODE_INSERTED = 2  # node_id, parent_id, ptg, k, d of the edge from the parent and x, y, theta, phi of the node
+REJECTED_UNREACHABLE = 3  # parent_id, ptg, k, d: trajectory k of the ptg is shorter than d
+REJECTED_DUPLICATE = 4  # parent_id, ptg, k, d, x, y, theta: new pose too close to an existing node
+COLLISION = 5  # parent_id, ptg, k, d: obstacle at distance d along trajectory k, x, y, theta: targeted pose
+GOAL_REACHED = 6  # node_id
+NODE_PRUNED = 7  # node_id, parent_id and x, y, theta, phi of a node removed from the tree (pruned or colliding)
+
+EVENT_NAMES = {SAMPLE: 'sample',
+               NODE_INSERTED: 'node_inserted',
+               REJECTED_UNREACHABLE: 'rejected_unreachable',
+               REJECTED_DUPLICATE: 'rejected_duplicate',
+               COLLISION: 'collision',
+               GOAL_REACHED: 'goal_reached',
+               NODE_PRUNED: 'node_pruned'}
+
+# event type, iteration, node id, parent id, ptg index, k, d, x, y, theta, phi
+RECORD = struct.Struct('<BIiihhfffff')
+RECORD_DTYPE = np.dtype([('event', '<u1'), ('iteration', '<u4'), ('node_id', '<i4'), ('parent_id', '<i4'),
+                         ('ptg', '<i2'), ('k', '<i2'), ('d', '<f4'), ('x', '<f4'), ('y', '<f4'), ('theta', '<f4'),
+                         ('phi', '<f4')])
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+
+class EventLog(object):
+    """
+    Append-only binary log of the tree growth events. Records are packed into an in memory buffer,
+    full buffers are handed over to a writer thread so the solve loop never waits on the disk.
+    The header is json: ptg names (indexed by the records ptg field) and the problem definition.
+    """
+    enabled = True
+
+    def __init__(self, file_name: str, header: dict, buffer_size=1 << 16):
+        self.file_name = file_name
+        self.buffer_size = buffer_size
+        self._buffer = bytearray()
+        self._queue = queue.Queue()
+        self._file = open(file_name, 'wb')
+        header_bytes = json.dumps(header).encode('utf-8')
+        self._file.write(MAGIC + HEADER_LENGTH.pack(len(header_bytes)) + header_bytes)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                break
+            self._file.write(chunk)
+        self._file.close()
+
+    def _append(self, event: int, iteration: int, node_id=-1, parent_id=-1, ptg=-1, k=-1, d=0., x=0., y=0.,
+                theta=0., phi=0.):
+        self._buffer += RECORD.pack(event, iteration, node_id, parent_id, ptg, k, d, x, y, theta, phi)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def sample(self, iteration: int, pose: PoseR2S2):
+        self._append(SAMPLE, iteration, x=pose.x, y=pose.y, theta=pose.theta)
+
+    def node_inserted(self, iteration: int, node, ptg: int, k: int, d: float):
+        pose = node.pose
+        self._append(NODE_INSERTED, iteration, node.id, node.parent.id, ptg, k, d, pose.x, pose.y, pose.theta,
+                     pose.phi)
+
+    def rejected_unreachable(self, iteration: int, parent_id: int, ptg: int, k: int, d: float):
+        self._append(REJECTED_UNREACHABLE, iteration, parent_id=parent_id, ptg=ptg, k=k, d=d)
+
+    def rejected_duplicate(self, iteration: int, parent_id: int, ptg: int, k: int, d: float, pose: PoseR2S2):
+        self._append(REJECTED_DUPLICATE, iteration, parent_id=parent_id, ptg=ptg, k=k, d=d, x=pose.x, y=pose.y,
+                     theta=pose.theta)
+
+    def collision(self, iteration: int, parent_id: int, ptg: int, k: int, d_free: float, target: PoseR2S2):
+        self._append(COLLISION, iteration, parent_id=parent_id, ptg=ptg, k=k, d=d_free, x=target.x, y=target.y,
+                     theta=target.theta)
+
+    def goal_reached(self, iteration: int, node_id: int):
+        self._append(GOAL_REACHED, iteration, node_id)
+
+    def node_pruned(self, iteration: int, node):
+        pose = node.pose
+        self._append(NODE_PRUNED, iteration, node.id, node.parent.id, x=pose.x, y=pose.y, theta=pose.theta,
+                     phi=pose.phi)
+
+    def flush(self):
+        if len(self._buffer) > 0:
+            self._queue.put(bytes(self._buffer))
+            self._buffer = bytearray()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._writer.join()
+
+
+class NullEventLog(EventLog):
+    """
+    Event log used when logging is disabled, all the calls are no-ops
+    """
+    enabled = False
+
+    def __init__(self):
+        pass
+
+    def _append(self, event: int, iteration: int, node_id=-1, parent_id=-1, ptg=-1, k=-1, d=0., x=0., y=0.,
+                theta=0., phi=0.):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def read_event_log(file_name: str) -> (dict, np.ndarray):
+    """
+    :return: the log header and the records as a numpy structured array (see RECORD_DTYPE)
+    """
+    with open(file_name, 'rb') as f:
+        data = f.read()
+    assert data[:len(MAGIC)] == MAGIC, '{0} is not a tree growth event log'.format(file_name)
+    offset = len(MAGIC)
+    header_length, = HEADER_LENGTH.unpack_from(data, offset)
+    offset += HEADER_LENGTH.size
+    header = json.loads(data[offset:offset + header_length].decode('utf-8'))
+    offset += header_length
+    # a run killed mid-write may leave a partial record at the end
+    records_count = (len(data) - offset) // RECORD.size
+    records = np.frombuffer(data, RECORD_DTYPE, records_count, offset)
+    return header, records
+
+
+def summarize_event_log(header: dict, records: np.ndarray) -> dict:
+    """
+    Event counts, overall and per ptg, and the number of tree nodes after each iteration
+    """
+    summary = {'iterations': int(records['iteration'].max()) if len(records) > 0 else 0, 'events': {},
+               'per_ptg': {}}
+    for event, name in EVENT_NAMES.items():
+        summary['events'][name] = int(np.count_nonzero(records['event'] == event))
+    for ptg, ptg_name in enumerate(header['ptgs']):
+        ptg_records = records[records['ptg'] == ptg]
+        counts = {EVENT_NAMES[event]: int(np.count_nonzero(ptg_records['event'] == event))
+                  for event in (NODE_INSERTED, REJECTED_UNREACHABLE, REJECTED_DUPLICATE, COLLISION)}
+        if sum(counts.values()) > 0:
+            summary['per_ptg'][ptg_name] = counts
+    changes = records[(records['event'] == NODE_INSERTED) | (records['event'] == NODE_PRUNED)]
+    nodes = 1 + np.cumsum(np.where(changes['event'] == NODE_INSERTED, 1, -1))
+    summary['nodes_per_iteration'] = np.stack([changes['iteration'], nodes]).T.tolist()
+    return summary
+
+
+def print_event_log_summary(header: dict, records: np.ndarray):
+    summary = summarize_event_log(header, records)
+    print('Map {0}, init {1}, goal {2}'.format(header['map_file'], header['init_pose'], header['goal_pose']))
+    print('{0} iterations, {1} records'.format(summary['iterations'], len(records)))
+    for name, count in summary['events'].items():
+        print('  {0:<24}{1:>10d}'.format(name, count))
+    print('Per PTG:')
+    for ptg_name, counts in summary['per_ptg'].items():
+        print('  {0}: '.format(ptg_name) + ', '.join('{0}={1}'.format(name, count) for name, count in counts.items()))
+
+
+def render_tree_growth(header: dict, records: np.ndarray, file_name: str, step=50):
+    """
+    Plots the tree every step iterations ({file_name}0000.png, ...): nodes and links so far, and the
+    rejected targets of the last step iterations (collisions in red, duplicates in orange)
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+    from prrt.grid import WorldGrid
+    import prrt.visualization as visualization
+    world = WorldGrid.from_file(header['map_file'], header['world_width'], header['world_height'])
+    goal = PoseR2S2.from_dict(header['goal_pose'])
+    fig, ax = visualization.setup_world_axes(world, goal, header['goal_dist_tolerance'])
+    positions = {0: (header['init_pose']['x'], header['init_pose']['y'])}  # root node id is 0
+    links = {}  # node id -> link from its parent
+    links_collection = LineCollection([], colors='c', linewidths=0.5)
+    ax.add_collection(links_collection)
+    nodes_scatter = ax.scatter([], [], marker='x', c='b', linewidths=1.)
+    collision_scatter = ax.scatter([], [], marker='.', c='r')
+    duplicate_scatter = ax.scatter([], [], marker='.', c='orange')
+    last_iteration = int(records['iteration'].max()) if len(records) > 0 else 0
+    frame = 0
+    for first in range(0, last_iteration + 1, step):
+        in_step = records[(records['iteration'] >= first) & (records['iteration'] < first + step)]
+        for record in in_step[(in_step['event'] == NODE_INSERTED) | (in_step['event'] == NODE_PRUNED)]:
+            node_id = int(record['node_id'])
+            if record['event'] == NODE_PRUNED:
+                # nodes of a reused tree may have been inserted by a previous solve
+                positions.pop(node_id, None)
+                links.pop(node_id, None)
+                continue
+            positions[node_id] = (record['x'], record['y'])
+            links[node_id] = (positions[int(record['parent_id'])], (record['x'], record['y']))
+        links_collection.set_segments(list(links.values()))
+        nodes_scatter.set_offsets(np.array(list(positions.values())))
+        collisions = in_step[in_step['event'] == COLLISION]
+        collision_scatter.set_offsets(np.stack([collisions['x'], collisions['y']]).T)
+        duplicates = in_step[in_step['event'] == REJECTED_DUPLICATE]
+        duplicate_scatter.set_offsets(np.stack([duplicates['x'], duplicates['y']]).T)
+        ax.set_title('iterations {0}-{1}, {2} nodes'.format(first, first + step - 1, len(positions)))
+        fig.savefig('{0}{1:04d}.png'.format(file_name, frame), dpi=150)
+        frame += 1
+    plt.close(fig)
+    return frame
@@ -0,0 +1,239 @@
+import contextlib
+import copy
+import io
+import json
+from typing import List
+import numpy as np
+import yaml
+from prrt.grid import WorldGrid
+from prrt.planner import Node, Tree
+from prrt.primitive import PoseR2S2
+from prrt.ptg import APTG
+from prrt.shortcut import transform_toTP_obstacles_all
+from prrt.vehicle import ArticulatedVehicleFactory
+
+# Golden outputs of the APTG build and of the planner kernels (build_cpoints, build_obstacle_grid, inverse_WS2TP,
+# transform_toTP_obstacles and get_aptg_nearest_node), recorded on fixed configurations and maps. Any other
+# implementation of these kernels is then compared against them with explicit tolerances.
+
+# Largest absolute difference accepted per output, overridden by the 'tolerances' of the suite
+DEFAULT_TOLERANCES = {'cpoints': 1e-9,
+                      'obstacle_grid': 1e-9,
+                      'inverse_d': 1e-9,
+                      'tp_obstacles': 1e-9,
+                      'nearest_d': 1e-9}
+
+CPOINTS_COLUMNS = ('ptg', 'k', 'n', 'd', 'x', 'y', 'theta', 'phi', 'v', 'w')
+
+
+def load_suite(suite_file: str) -> dict:
+    with open(suite_file) as f:
+        suite = yaml.safe_load(f)
+    with open(suite['vehicle_config']) as f:
+        suite['vehicle'] = yaml.safe_load(f)
+    tolerances = dict(DEFAULT_TOLERANCES)
+    tolerances.update(suite.get('tolerances') or {})
+    suite['tolerances'] = tolerances
+    return suite
+
+
+def build_case(suite: dict, case: dict) -> (APTG, WorldGrid):
+    with open(case['aptg_config']) as f:
+        aptg_config = yaml.safe_load(f)
+    aptg_config.update(copy.deepcopy(case.get('overrides') or {}))
+    aptg = APTG(ArticulatedVehicleFactory.build_av(suite['vehicle']), aptg_config)
+    # the build is chatty, keep its output out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        aptg.build()
+    world = WorldGrid.from_file(case['world_map_file'], case['world_width'], case['world_height'])
+    world.build_obstacle_buffer()
+    return aptg, world
+
+
+def record_inputs(aptg: APTG, world: WorldGrid, samples: int, seed: int) -> dict:
+    """
+    Random queries, saved with the golden outputs so that the comparison does not depend on the random generator
+    """
+    rng = np.random.RandomState(seed)
+    grid_size = aptg.ptgs[0].distance_ref
+    phi_max = aptg.vehicle.phi_max
+
+    def world_poses(count: int) -> np.ndarray:
+        # over free cells only, poses within the obstacles would all be at 0 free distance
+        x = np.empty(0)
+        y = np.empty(0)
+        while len(x) < count:
+            x_new, y_new = rng.uniform(0., world.width, count), rng.uniform(0., world.height, count)
+            free = ~world.points_occupied(x_new, y_new)
+            x, y = np.concatenate((x, x_new[free])), np.concatenate((y, y_new[free]))
+        return np.column_stack((x[:count], y[:count], rng.uniform(-np.pi, np.pi, count),
+                                rng.uniform(-phi_max, phi_max, count)))
+
+    # half of the inverse_WS2TP queries near the cpoints (mostly exact), the others anywhere around the ptg
+    ptg_indices = rng.randint(0, len(aptg.ptgs), samples)
+    near = samples // 2
+    cpoints = [aptg.ptgs[i].cpoints[rng.randint(len(aptg.ptgs[i].cpoints))] for i in ptg_indices[:near]]
+    cpoints = [cpoints_at_k[rng.randint(len(cpoints_at_k))] for cpoints_at_k in cpoints]
+    x = np.concatenate(([c.x for c in cpoints], rng.uniform(-1.2 * grid_size, 1.2 * grid_size, samples - near)))
+    y = np.concatenate(([c.y for c in cpoints], rng.uniform(-1.2 * grid_size, 1.2 * grid_size, samples - near)))
+    x[:near] += rng.normal(0., 0.1, near)
+    y[:near] += rng.normal(0., 0.1, near)
+    return {'inverse_inputs': np.column_stack((ptg_indices, x, y, rng.uniform(-np.pi, np.pi, samples))),
+            'tp_inputs': np.column_stack((rng.randint(0, len(aptg.ptgs), samples), world_poses(samples)[:, :3])),
+            'tree_poses': world_poses(samples),
+            'query_poses': world_poses(max(1, samples // 5))}
+
+
+def compute_outputs(aptg: APTG, world: WorldGrid, inputs: dict, obs_R: float) -> dict:
+    """
+    Outputs of the current implementation of the kernels for the given inputs (see record_inputs)
+    :param obs_R: obstacles range as a multiple of grid_size, see the planner configuration
+    """
+    cpoints = []
+    obstacle_grid = []
+    for i, ptg in enumerate(aptg.ptgs):
+        for k, cpoints_at_k in enumerate(ptg.cpoints):
+            cpoints.extend((i, k, c.n, c.d, c.x, c.y, c.theta, c.phi, c.v, c.w) for c in cpoints_at_k)
+        k_ptr, cells, values, scale = ptg.obstacle_grid.rows()
+        ks = np.repeat(np.arange(len(k_ptr) - 1), np.diff(k_ptr))
+        obstacle_grid.append(np.column_stack((np.full(len(cells), i), ks, cells, values * scale)))
+    inverse = []
+    for i, x, y, theta in inputs['inverse_inputs']:
+        ptg = aptg.ptgs[int(i)]
+        is_exact, k, d = ptg.inverse_WS2TP(PoseR2S2(x, y, theta))
+        inverse.append((is_exact, k, d))
+    tp_obstacles = []
+    for i, x, y, theta in inputs['tp_inputs']:
+        ptg = aptg.ptgs[int(i)]
+        max_dist = obs_R * ptg.distance_ref
+        obstacles_rel = world.transform_point_cloud(PoseR2S2(x, y, theta), max_dist)
+        tp_obstacles.append(transform_toTP_obstacles_all(ptg, obstacles_rel, max_dist))
+    tree = Tree(PoseR2S2(*inputs['tree_poses'][0]))
+    for pose in inputs['tree_poses'][1:]:
+        tree.nodes.append(Node(None, PoseR2S2(*pose)))
+    index = {id(node): i for i, node in enumerate(tree.nodes)}
+    nearest = []
+    for pose in inputs['query_poses']:
+        _, node, d = tree.get_aptg_nearest_node(Node(None, PoseR2S2(*pose)), aptg)
+        nearest.append((index[id(node)] if node is not None else -1, d))
+    return {'cpoints': np.array(cpoints, dtype=float).reshape(-1, len(CPOINTS_COLUMNS)),
+            'obstacle_grid': np.concatenate(obstacle_grid),
+            'inverse': np.array(inverse, dtype=float).reshape(-1, 3),
+            'tp_obstacles': np.array(tp_obstacles, dtype=float),
+            'nearest': np.array(nearest, dtype=float).reshape(-1, 2)}
+
+
+def record(suite: dict, case: dict, file_name: str):
+    aptg, world = build_case(suite, case)
+    inputs = record_inputs(aptg, world, case.get('samples', 500), case.get('seed', 0))
+    outputs = compute_outputs(aptg, world, inputs, case.get('obs_R', 2.5))
+    meta = {'case': case, 'fingerprint': aptg.build_fingerprint()}
+    np.savez_compressed(file_name, meta=json.dumps(meta), **inputs, **outputs)
+
+
+def compare(suite: dict, case: dict, file_name: str) -> List[str]:
+    """
+    Recomputes the outputs of the golden file with the current implementation
+    :return: summary of the differences beyond the suite tolerances, empty if none
+    """
+    golden = np.load(file_name)
+    meta = json.loads(str(golden['meta']))
+    aptg, world = build_case(suite, case)
+    if meta['fingerprint'] != aptg.build_fingerprint() or meta['case'] != case:
+        raise ValueError('{0} was recorded for another configuration, record it again'.format(file_name))
+    outputs = compute_outputs(aptg, world, {key: golden[key] for key in
+                                            ('inverse_inputs', 'tp_inputs', 'tree_poses', 'query_poses')},
+                              case.get('obs_R', 2.5))
+    tolerances = suite['tolerances']
+    return (compare_cpoints(golden['cpoints'], outputs['cpoints'], tolerances['cpoints']) +
+            compare_obstacle_grids(golden['obstacle_grid'], outputs['obstacle_grid'], tolerances['obstacle_grid']) +
+            compare_inverse(golden['inverse'], outputs['inverse'], tolerances['inverse_d']) +
+            compare_values('tp_obstacles', golden['tp_obstacles'], outputs['tp_obstacles'],
+                           tolerances['tp_obstacles']) +
+            compare_nearest(golden['nearest'], outputs['nearest'], tolerances['nearest_d']))
+
+
+def compare_values(name: str, expected: np.ndarray, actual: np.ndarray, tolerance: float) -> List[str]:
+    if expected.shape != actual.shape:
+        return ['{0}: shape {1} instead of {2}'.format(name, actual.shape, expected.shape)]
+    with np.errstate(invalid='ignore'):
+        error = np.abs(expected - actual)
+    error[np.isnan(error)] = np.inf  # nan on one side only
+    error[(expected == actual) | (np.isnan(expected) & np.isnan(actual))] = 0.  # same infinite or nan values
+    bad = np.argwhere(error > tolerance)
+    if len(bad) == 0:
+        return []
+    return ['{0}: {1} of {2} values differ by more than {3:g} (max {4:.3g}), first at {5}'.format(
+        name, len(bad), expected.size, tolerance, error.max(), tuple(bad[0]))]
+
+
+def compare_cpoints(expected: np.ndarray, actual: np.ndarray, tolerance: float) -> List[str]:
+    """
+    Rows are CPOINTS_COLUMNS, each trajectory (ptg, k) must have the same cpoints count
+    """
+    expected_counts = _group_counts(expected, 2)
+    actual_counts = _group_counts(actual, 2)
+    if expected_counts != actual_counts:
+        differing = sorted(key for key in set(expected_counts) | set(actual_counts)
+                           if expected_counts.get(key) != actual_counts.get(key))
+        return ['cpoints: {0} trajectories have a different cpoints count, first (ptg, k) {1}: {2} instead of '
+                '{3}'.format(len(differing), differing[0], actual_counts.get(differing[0], 0),
+                             expected_counts.get(differing[0], 0))]
+    return [message for column in range(2, len(CPOINTS_COLUMNS)) for message in
+            compare_values('cpoints.{0}'.format(CPOINTS_COLUMNS[column]), expected[:, column], actual[:, column],
+                           tolerance)]
+
+
+def compare_obstacle_grids(expected: np.ndarray, actual: np.ndarray, tolerance: float) -> List[str]:
+    """
+    Rows are (ptg, k, cell, d), the cells must be the same, the distances within tolerance
+    """
+    expected_d = {tuple(row[:3]): row[3] for row in expected.tolist()}
+    actual_d = {tuple(row[:3]): row[3] for row in actual.tolist()}
+    messages = []
+    missing = sorted(set(expected_d) - set(actual_d))
+    extra = sorted(set(actual_d) - set(expected_d))
+    if len(missing) > 0:
+        messages.append('obstacle_grid: {0} (ptg, k, cell) missing, first {1}'.format(len(missing), missing[0]))
+    if len(extra) > 0:
+        messages.append('obstacle_grid: {0} (ptg, k, cell) not expected, first {1}'.format(len(extra), extra[0]))
+    differing = sorted((abs(expected_d[key] - actual_d[key]), key) for key in set(expected_d) & set(actual_d)
+                       if abs(expected_d[key] - actual_d[key]) > tolerance)
+    if len(differing) > 0:
+        ptgs = sorted(set(int(key[0]) for _, key in differing))
+        messages.append('obstacle_grid: {0} of {1} cells differ by more than {2:g} (max {3:.3g} at (ptg, k, cell) '
+                        '{4}), in ptgs {5}'.format(len(differing), len(expected_d), tolerance, differing[-1][0],
+                                                   differing[-1][1], ptgs))
+    return messages
+
+
+def compare_inverse(expected: np.ndarray, actual: np.ndarray, tolerance: float) -> List[str]:
+    """
+    Rows are (is_exact, k, d), is_exact and k must be the same, d within tolerance
+    """
+    if expected.shape != actual.shape:
+        return ['inverse: shape {0} instead of {1}'.format(actual.shape, expected.shape)]
+    messages = []
+    for column, name in ((0, 'is_exact'), (1, 'k')):
+        bad = np.flatnonzero(expected[:, column] != actual[:, column])
+        if len(bad) > 0:
+            messages.append('inverse.{0}: {1} of {2} queries differ, first query {3}'.format(name, len(bad),
+                                                                                          len(expected), bad[0]))
+    return messages + compare_values('inverse.d', expected[:, 2], actual[:, 2], tolerance)
+
+
+def compare_nearest(expected: np.ndarray, actual: np.ndarray, tolerance: float) -> List[str]:
+    """
+    Rows are (node index, d). A different node is accepted if at the same distance (ties)
+    """
+    messages = compare_values('nearest.d', expected[:, 1], actual[:, 1], tolerance)
+    if len(messages) == 0:
+        different_nodes = np.count_nonzero(expected[:, 0] != actual[:, 0])
+        if different_nodes > 0:
+            print('nearest: {0} ties resolved to another node'.format(different_nodes))
+    return messages
+
+
+def _group_counts(rows: np.ndarray, key_columns: int) -> dict:
+    keys, counts = np.unique(rows[:, :key_columns], axis=0, return_counts=True)
+    return {tuple(key): count for key, count in zip(keys.tolist(), counts.tolist())}
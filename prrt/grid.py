@@ -1,17 +1,23 @@
 import random
+import itertools
+import time
+import zlib
 from abc import ABCMeta
+from collections import OrderedDict
 from pathlib import Path
 from typing import List
-import matplotlib.image as mpimg
 import numpy as np
+import prrt.kernels as kernels
 from prrt.helper import INT_MAX
-from prrt.primitive import PoseR2S2, PointR2
+from prrt.png import read_png
+from prrt.primitive import PoseR2S2, PointR2, SlotsPickleMixin
 
 
-class KDPair(object):
+class KDPair(SlotsPickleMixin):
     """
     K (PTG index) <=> Distance Pair
     """
+    __slots__ = ('k', 'd')
 
     def __init__(self, k: int, d: float):
         self.k = k
@@ -84,6 +90,17 @@ class Grid(metaclass=ABCMeta):
 
 
 class ObstacleGrid(Grid):
+    """
+    Each cell holds the (k, d) pairs of the trajectories k whose vehicle shape covers the cell, d being the least
+    distance along the trajectory at which it does. Queries go through a per k CSR view of the cells (see rows),
+    built on first query: the cells must not change afterwards.
+    """
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_rows', None)
+        return state
+
     def update_cell(self, ix: int, iy: int, k: int, d: float):
         # if this is the first entry create a new pair and return
         if self.cells[ix][iy] is None:
@@ -98,6 +115,128 @@ class ObstacleGrid(Grid):
         # The entry is new for the given k
         self.cells[ix][iy].append(KDPair(k, d))
 
+    def cell_by_idx(self, ix: int, iy: int) -> List[KDPair]:
+        if 0 <= ix < self.cell_count_x and 0 <= iy < self.cell_count_y:
+            return self.cells[ix][iy]
+        return None
+
+    def build_rows(self) -> (np.ndarray, np.ndarray, np.ndarray, float):
+        """
+        :return: k_ptr, cells, values and scale: the entries of trajectory k are cells[k_ptr[k]:k_ptr[k + 1]],
+         flat cell indices (ix * cell_count_y + iy) in increasing order, with distances values[...] * scale
+        """
+        entries = [(kd_pair.k, flat, kd_pair.d) for flat, cell in enumerate(self.cells.ravel()) if cell is not None
+                   for kd_pair in cell]
+        k, cells, d = np.array(entries, dtype=float).reshape(-1, 3).T
+        order = np.lexsort((cells, k))
+        k_ptr = np.searchsorted(k[order], np.arange(int(k.max(initial=-1)) + 2))
+        return k_ptr, cells[order].astype(np.int32), d[order], 1.
+
+    def rows(self) -> (np.ndarray, np.ndarray, np.ndarray, float):
+        rows = self.__dict__.get('_rows')
+        if rows is None:
+            rows = self.__dict__.setdefault('_rows', self.build_rows())
+        return rows
+
+    def obstacles_to_cells(self, obstacles: np.ndarray, max_dist: float) -> np.ndarray:
+        """
+        :param obstacles: 2xN obstacles in the PTG frame, the ones further than max_dist in x or y are ignored
+        :return: flat indices of the distinct cells holding the obstacles
+        """
+        in_range = (np.abs(obstacles[0]) <= max_dist) & (np.abs(obstacles[1]) <= max_dist)
+        ix = (np.floor(obstacles[0, in_range] / self._resolution) + self._half_cell_count_x).astype(int)
+        iy = (np.floor(obstacles[1, in_range] / self._resolution) + self._half_cell_count_y).astype(int)
+        in_grid = (ix >= 0) & (ix < self.cell_count_x) & (iy >= 0) & (iy < self.cell_count_y)
+        return np.unique(ix[in_grid] * self.cell_count_y + iy[in_grid])
+
+    def free_distance(self, obstacles: np.ndarray, max_dist: float, k: int, d_default: float) -> float:
+        """
+        :return: distance along trajectory k to the first collision with the obstacles, d_default if none
+        """
+        k_ptr, cells, values, scale = self.rows()
+        if k + 1 >= len(k_ptr):
+            return d_default
+        cells_k = cells[k_ptr[k]:k_ptr[k + 1]]
+        query = self.obstacles_to_cells(obstacles, max_dist)
+        idx = np.minimum(np.searchsorted(cells_k, query), len(cells_k) - 1)
+        hit = idx[cells_k[idx] == query] if len(cells_k) > 0 else idx[:0]
+        if len(hit) == 0:
+            return d_default
+        return min(d_default, float(values[k_ptr[k] + hit].min()) * scale)
+
+    def free_distances(self, obstacles: np.ndarray, max_dist: float, k_count: int, d_default: float) -> np.ndarray:
+        """
+        Same as free_distance for every trajectory k < k_count at once
+        """
+        k_ptr, cells, values, scale = self.rows()
+        distances = np.full(k_count, d_default)
+        hit = np.flatnonzero(np.isin(cells, self.obstacles_to_cells(obstacles, max_dist)))
+        k = np.searchsorted(k_ptr, hit, side='right') - 1
+        np.minimum.at(distances, k, values[hit] * scale)
+        return distances
+
+
+class CompactObstacleGrid(ObstacleGrid):
+    """
+    Read only ObstacleGrid storing the rows (see ObstacleGrid.build_rows) with the distances quantized to
+    distance_bits fractions of distance_ref. Distances are rounded down so the free distances are never
+    overestimated, by less than distance_ref / (2 ** distance_bits - 1). The rows are kept zlib compressed (cell
+    indices delta encoded) and decompressed on first query, the grids of the phi never queried stay compressed.
+    """
+
+    def __init__(self, grid: ObstacleGrid, distance_ref: float, distance_bits=8):
+        assert distance_bits in (8, 16), 'distance_bits must be 8 or 16'
+        self._resolution = grid._resolution
+        self._size = grid._size
+        self._half_cell_count_x = grid._half_cell_count_x
+        self._half_cell_count_y = grid._half_cell_count_y
+        self._cell_count_x = grid.cell_count_x
+        self._cell_count_y = grid.cell_count_y
+        self.distance_ref = distance_ref
+        self.distance_bits = distance_bits
+        levels = 2 ** distance_bits - 1
+        k_ptr, cells, values, scale = grid.rows()
+        quantized = np.floor(np.clip(values * scale / distance_ref, 0., 1.) * levels)
+        # cells increase within each row, their differences are small and compress well
+        deltas = np.diff(cells, prepend=0)
+        starts = k_ptr[:-1][np.diff(k_ptr) > 0]
+        deltas[starts] = cells[starts]
+        self._packed = tuple(zlib.compress(array.astype(dtype).tobytes()) for array, dtype in zip(
+            (k_ptr, deltas, quantized), self.dtypes))
+
+    @property
+    def dtypes(self) -> tuple:
+        # of k_ptr, cell deltas and quantized distances
+        return np.int32, np.int32, np.uint8 if self.distance_bits == 8 else np.uint16
+
+    @property
+    def packed_size(self) -> int:
+        return sum(len(buffer) for buffer in self._packed)
+
+    def update_cell(self, ix: int, iy: int, k: int, d: float):
+        raise TypeError('CompactObstacleGrid is read only')
+
+    def build_rows(self) -> (np.ndarray, np.ndarray, np.ndarray, float):
+        k_ptr, deltas, quantized = (np.frombuffer(zlib.decompress(buffer), dtype=dtype)
+                                    for buffer, dtype in zip(self._packed, self.dtypes))
+        # running sum of the deltas, restarted at each row
+        totals = np.concatenate(([0], np.cumsum(deltas, dtype=np.int64)))
+        cells = (totals[1:] - np.repeat(totals[k_ptr[:-1]], np.diff(k_ptr))).astype(np.int32)
+        return k_ptr, cells, quantized, self.distance_ref / (2 ** self.distance_bits - 1)
+
+    def cell_by_idx(self, ix: int, iy: int) -> List[KDPair]:
+        if not (0 <= ix < self.cell_count_x and 0 <= iy < self.cell_count_y):
+            return None
+        k_ptr, cells, values, scale = self.rows()
+        hit = np.flatnonzero(cells == ix * self.cell_count_y + iy)
+        if len(hit) == 0:
+            return None
+        k = np.searchsorted(k_ptr, hit, side='right') - 1
+        return [KDPair(int(k_i), float(values[i]) * scale) for k_i, i in zip(k, hit)]
+
+    def cell_by_pos(self, pos: PointR2) -> List[KDPair]:
+        return self.cell_by_idx(self.x_to_ix(pos.x), self.y_to_iy(pos.y))
+
 
 class CPointsGrid(Grid):
     '''
@@ -126,15 +265,33 @@ class CPointsGrid(Grid):
         return None
 
 
+def image_to_omap(image: np.ndarray) -> np.ndarray:
+    """
+    Occupancy of the map pixels: dark pixels are obstacles
+    :param image: map image as returned by read_png
+    """
+    if image.ndim == 2:
+        return image * 3. < 1.5
+    return np.dot(image[..., :3], [1, 1, 1]) < 1.5
+
+
 class WorldGrid(object):
     """
     Holds obstacle data for world environment
     """
+    whole_map = True  # the whole occupancy map is in memory (free cells index, cost-to-go field)
+    # cost-to-go fields shared by all instances, keyed by (map, goal cell, inflation)
+    _cost_to_go_cache = OrderedDict()
+    cost_to_go_cache_size = 8
+    # unique tokens given to maps modified at run time, so they don't share cached data with the map file
+    _map_revisions = itertools.count(1)
 
     def __init__(self, map_file: str, width: float, height: float):
         file_path = Path(map_file)
         assert file_path.exists(), FileExistsError
-        self.map_32bit = mpimg.imread(map_file)
+        self.map_file = str(file_path.resolve())
+        self.map_key = self.map_file  # identifies the map content in caches
+        self.map_32bit = read_png(map_file)
         self.min_ix = 0
         self.min_iy = 0
         self.max_ix = self.map_32bit.shape[1] - 1
@@ -145,9 +302,20 @@ class WorldGrid(object):
         self.height = height
         self.x_resolution = self.width / self.iwidth
         self.y_resolution = self.height / self.iheight
-        map8bit = (np.dot(self.map_32bit[..., :3], [1, 1, 1]))
-        self.omap = (map8bit < 1.5)
+        self.omap = image_to_omap(self.map_32bit)
         self._obstacle_buffer = []  # type: List[PointR2]
+        self.free_cells = None  # type: np.ndarray
+        self.cost_to_go = None  # type: np.ndarray
+
+    @staticmethod
+    def from_file(map_file: str, width: float, height: float) -> 'WorldGrid':
+        """
+        Loads a png map, or a tiled map (see prrt.tiledmap) if the file has the tiled map extension
+        """
+        from prrt.tiledmap import TILED_MAP_EXTENSION, TiledWorldGrid
+        if Path(map_file).suffix == TILED_MAP_EXTENSION:
+            return TiledWorldGrid(map_file, width, height)
+        return WorldGrid(map_file, width, height)
 
     def x_to_ix(self, x: float) -> int:
         """
@@ -181,16 +349,172 @@ class WorldGrid(object):
         """
         return idy * self.y_resolution
 
-    def get_random_pose(self, bias_pose: PoseR2S2 = None, bias=0.05):
+    def get_random_pose(self, bias_pose: PoseR2S2 = None, bias=0.05, rng=random):
         if bias_pose is not None:
-            rand = random.uniform(0, 1)
+            rand = rng.uniform(0, 1)
             if rand <= bias:
                 return bias_pose.copy()
-        x = random.uniform(0, self.width)
-        y = random.uniform(0, self.height)
-        theta = random.uniform(-np.pi, np.pi)
+        x = rng.uniform(0, self.width)
+        y = rng.uniform(0, self.height)
+        theta = rng.uniform(-np.pi, np.pi)
         return PoseR2S2(x, y, theta)
 
+    def build_free_space_index(self):
+        """
+        Builds a flat index (row major, same as omap) of all the free cells
+        """
+        if self.free_cells is None:
+            self.free_cells = np.flatnonzero(~self.omap)
+
+    def free_cells_centers(self) -> (np.ndarray, np.ndarray):
+        """
+        :return: x and y arrays of the centers of the free cells
+        """
+        iy, ix = np.divmod(self.free_cells, self.iwidth)
+        return (ix + 0.5) * self.x_resolution, (iy + 0.5) * self.y_resolution
+
+    def get_random_free_pose(self, cells: np.ndarray = None, rng=random) -> PoseR2S2:
+        """
+        Samples a pose uniformly within the given cells
+        :param cells: flat cell indices to sample from, defaults to all the free cells
+        :param rng: random number generator (random module or a random.Random instance)
+        """
+        if cells is None:
+            cells = self.free_cells
+        iy, ix = divmod(int(cells[rng.randrange(len(cells))]), self.iwidth)
+        x = self.idx_to_x(ix) + rng.uniform(0, self.x_resolution)
+        y = self.idx_to_y(iy) + rng.uniform(0, self.y_resolution)
+        theta = rng.uniform(-np.pi, np.pi)
+        return PoseR2S2(x, y, theta)
+
+    def inflated_omap(self, radius: float) -> np.ndarray:
+        """
+        Grows the obstacles in omap by the given radius (m)
+        """
+        rx = int(np.ceil(radius / self.x_resolution))
+        ry = int(np.ceil(radius / self.y_resolution))
+        inflated = self.omap.copy()
+        for dy in range(-ry, ry + 1):
+            for dx in range(-rx, rx + 1):
+                if (dx * self.x_resolution) ** 2 + (dy * self.y_resolution) ** 2 > radius ** 2:
+                    continue
+                src = self.omap[max(0, -dy):self.iheight - max(0, dy), max(0, -dx):self.iwidth - max(0, dx)]
+                inflated[max(0, dy):self.iheight - max(0, -dy), max(0, dx):self.iwidth - max(0, -dx)] |= src
+        return inflated
+
+    def build_cost_to_go(self, goal: PoseR2S2, inflation: float = 0., deadline: float = None) -> np.ndarray:
+        """
+        Computes (or fetches from cache) the cost-to-go field from the goal cell over
+        the free cells of omap grown by the inflation radius (m). Blocked and unreachable
+        cells are set to inf.
+        :param deadline: absolute time (time.perf_counter() clock) past which the field is not computed,
+         cost_to_go is then None
+        """
+        goal_ix = min(max(self.x_to_ix(goal.x), 0), self.max_ix)
+        goal_iy = min(max(self.y_to_iy(goal.y), 0), self.max_iy)
+        key = (self.map_key, self.width, self.height, goal_ix, goal_iy, inflation)
+        cache = WorldGrid._cost_to_go_cache
+        if key in cache:
+            cache.move_to_end(key)
+        else:
+            if deadline is not None and time.perf_counter() >= deadline:
+                self.cost_to_go = None
+                return None
+            cache[key] = self._compute_cost_to_go(goal_ix, goal_iy, inflation)
+            if len(cache) > WorldGrid.cost_to_go_cache_size:
+                cache.popitem(last=False)
+        self.cost_to_go = cache[key]
+        return self.cost_to_go
+
+    def _compute_cost_to_go(self, goal_ix: int, goal_iy: int, inflation: float) -> np.ndarray:
+        blocked = self.inflated_omap(inflation)
+        blocked[goal_iy, goal_ix] = False
+        return kernels.cost_to_go(blocked, goal_ix, goal_iy, self.x_resolution, self.y_resolution)
+
+    def cost_to_go_at(self, x: float, y: float) -> float:
+        ix = self.x_to_ix(x)
+        iy = self.y_to_iy(y)
+        if ix < 0 or iy < 0 or ix > self.max_ix or iy > self.max_iy:
+            return float('inf')
+        return self.cost_to_go[iy, ix]
+
+    def region_to_idx(self, x_min: float, y_min: float, x_max: float, y_max: float) -> (int, int, int, int):
+        """
+        Maps a rectangular region (m) to the range of cells it covers, clipped to the map
+        :return: ix_min, iy_min, ix_max, iy_max (inclusive), None if the region is outside the map
+        """
+        ix_min = self.x_to_ix(x_min)
+        iy_min = self.y_to_iy(y_min)
+        ix_max = self.x_to_ix(x_max)
+        iy_max = self.y_to_iy(y_max)
+        if ix_max < max(ix_min, 0) or iy_max < max(iy_min, 0) or ix_min > self.max_ix or iy_min > self.max_iy:
+            return None
+        return max(ix_min, 0), max(iy_min, 0), min(ix_max, self.max_ix), min(iy_max, self.max_iy)
+
+    def add_obstacle_region(self, x_min: float, y_min: float, x_max: float, y_max: float) -> np.ndarray:
+        """
+        Marks a rectangular region (m) as occupied, e.g. a pallet or a parked trailer. omap and the obstacle
+        buffer are updated in place.
+        :return: 2xN array of the world coordinates of the newly occupied cells (obstacle buffer format)
+        """
+        cells = self.region_to_idx(x_min, y_min, x_max, y_max)
+        if cells is None:
+            return np.zeros((2, 0))
+        ix_min, iy_min, ix_max, iy_max = cells
+        region = self.omap[iy_min:iy_max + 1, ix_min:ix_max + 1]
+        iy, ix = np.nonzero(~region)
+        region[:] = True
+        new_obstacles = np.array([self.idx_to_x(ix + ix_min), self.idx_to_y(iy + iy_min)], dtype=float)
+        if len(self._obstacle_buffer) == 0:
+            self._obstacle_buffer = new_obstacles
+        else:
+            self._obstacle_buffer = np.hstack((self._obstacle_buffer, new_obstacles))
+        self._map_changed()
+        return new_obstacles
+
+    def remove_obstacle_region(self, x_min: float, y_min: float, x_max: float, y_max: float) -> np.ndarray:
+        """
+        Marks a rectangular region (m) as free. omap and the obstacle buffer are updated in place.
+        :return: 2xN array of the world coordinates of the freed cells (obstacle buffer format)
+        """
+        cells = self.region_to_idx(x_min, y_min, x_max, y_max)
+        if cells is None:
+            return np.zeros((2, 0))
+        ix_min, iy_min, ix_max, iy_max = cells
+        region = self.omap[iy_min:iy_max + 1, ix_min:ix_max + 1]
+        iy, ix = np.nonzero(region)
+        region[:] = False
+        freed = np.array([self.idx_to_x(ix + ix_min), self.idx_to_y(iy + iy_min)], dtype=float)
+        if len(self._obstacle_buffer) > 0:
+            buffer_ix = np.floor(self._obstacle_buffer[0] / self.x_resolution + 0.5).astype(int)
+            buffer_iy = np.floor(self._obstacle_buffer[1] / self.y_resolution + 0.5).astype(int)
+            in_region = (buffer_ix >= ix_min) & (buffer_ix <= ix_max) & (buffer_iy >= iy_min) & (buffer_iy <= iy_max)
+            self._obstacle_buffer = self._obstacle_buffer[:, ~in_region]
+        self._map_changed()
+        return freed
+
+    def _map_changed(self):
+        self.map_key = (self.map_file, next(WorldGrid._map_revisions))
+        self.cost_to_go = None
+        if self.free_cells is not None:
+            self.free_cells = np.flatnonzero(~self.omap)
+
+    def points_occupied(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Looks up the occupancy of the cells holding the given points, points outside the map (or nan) are free
+        """
+        inside = (x >= 0.) & (x < self.width) & (y >= 0.) & (y < self.height)
+        ix = np.minimum((x[inside] / self.x_resolution).astype(int), self.max_ix)
+        iy = np.minimum((y[inside] / self.y_resolution).astype(int), self.max_iy)
+        occupied = np.zeros(len(x), dtype=bool)
+        occupied[inside] = self.omap[iy, ix]
+        return occupied
+
+    @property
+    def obstacles(self) -> np.ndarray:
+        # 2xN coordinates of the occupied cells corners
+        return self._obstacle_buffer
+
     def build_obstacle_buffer(self):
         obstacles = []
         for ix in range(self.iwidth):
@@ -203,14 +527,21 @@ class WorldGrid(object):
         self._obstacle_buffer = np.reshape(obstacles, newshape=(len(obstacles) // 2, 2)).T
 
     def transform_point_cloud(self, ref_pose: PoseR2S2, max_dist):
+        return self.transform_points(self._obstacle_buffer, ref_pose, max_dist)
+
+    @staticmethod
+    def transform_points(points: np.ndarray, ref_pose: PoseR2S2, max_dist: float) -> np.ndarray:
+        """
+        Transforms the points (2xN array) within max_dist (in x and y) of ref_pose to the ref_pose frame
+        """
         inv_pose_x = -ref_pose.x * np.cos(ref_pose.theta) - ref_pose.y * np.sin(ref_pose.theta)
         inv_pose_y = ref_pose.x * np.sin(ref_pose.theta) - ref_pose.y * np.cos(ref_pose.theta)
         inv_pose_theta = - ref_pose.theta
         inv_pose = np.array([[inv_pose_x], [inv_pose_y], [inv_pose_theta]])
 
         # First get a list of obstacles within range
-        obstacles_diff = self._obstacle_buffer - np.array([[ref_pose.x], [ref_pose.y]])
-        obstacles_in_range = self._obstacle_buffer[:, (np.absolute(obstacles_diff[0, :]) < max_dist) & (
+        obstacles_diff = points - np.array([[ref_pose.x], [ref_pose.y]])
+        obstacles_in_range = points[:, (np.absolute(obstacles_diff[0, :]) < max_dist) & (
             np.absolute(obstacles_diff[1, :]) < max_dist)]
         R = np.array(
             [[np.cos(inv_pose_theta), -np.sin(inv_pose_theta)], [np.sin(inv_pose_theta), np.cos(inv_pose_theta)]])
@@ -1,5 +1,10 @@
+import glob
+import os.path
 import pickle
+import sys
+import types
 from math import fmod, pi as PI
+import numpy as np
 
 INT_MAX = 2147483647
 INT_MIN = -2147483648
@@ -25,10 +30,66 @@ def angle_distance(ang_from: float, ang_to: float) -> float:
 
 
 def save_object(obj, file_name):
-    with open(file_name, 'wb') as output:
-        pickle.dump(obj, output, pickle.HIGHEST_PROTOCOL)
+    # written to a temporary file then renamed, an interrupted dump never leaves a truncated file behind
+    temp_file_name = '{0}.{1}.tmp'.format(file_name, os.getpid())
+    try:
+        with open(temp_file_name, 'wb') as output:
+            pickle.dump(obj, output, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file_name, file_name)
+    finally:
+        if os.path.exists(temp_file_name):
+            os.remove(temp_file_name)
 
 
 def load_object(filename):
     with open(filename, 'rb') as input_file:
         return pickle.load(input_file)
+
+
+def deep_size(obj, seen: set = None) -> int:
+    """
+    Approximate memory used by obj and all the objects it references, in bytes (classes, modules and functions
+    are not counted). Objects whose id is in seen are skipped, share the seen set to measure objects having
+    common parts.
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while len(stack) > 0:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType, types.FunctionType, types.MethodType)):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, np.ndarray):
+            # getsizeof includes the data of arrays owning it, views are accounted through their base
+            if obj.base is not None:
+                stack.append(obj.base)
+            if obj.dtype == object:
+                stack.extend(obj.ravel().tolist())
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        if hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+        for cls in type(obj).__mro__:
+            slots = cls.__dict__.get('__slots__', ())
+            for name in [slots] if isinstance(slots, str) else slots:
+                if name != '__dict__' and hasattr(obj, name):
+                    stack.append(getattr(obj, name))
+    return total
+
+
+def get_unique_file_name(file_name: str, extension: str) -> str:
+    """
+    Returns file_name if no such file exists, otherwise file_name post-fixed with the next free
+    4 digits counter and the extension (e.g. solution.csv0003.csv)
+    """
+    if not os.path.exists(file_name):
+        return file_name
+    existing = glob.glob(glob.escape(file_name) + '[0-9]' * 4 + extension)
+    counters = [int(name[len(file_name):len(file_name) + 4]) for name in existing]
+    return '{0}{1:04d}{2}'.format(file_name, max(counters, default=0) + 1, extension)
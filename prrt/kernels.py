@@ -0,0 +1,383 @@
+import math
+import os
+import numpy as np
+from prrt.primitive import POLYGON_BOUNDARY_EPS, points_in_polygons
+
+# Kernels of the APTG build, planner query and cost-to-go field hot paths. Each kernel has a scalar loops version,
+# compiled with numba when it is installed, and a whole array numpy version used otherwise. Both give the same
+# results, up to the last bits of the compiled math functions (see golden_runner.py and scripts/kernels_check.py).
+# The backend is selected with set_backend or the PRRT_KERNELS environment variable: 'auto' (default, numba if
+# installed), 'numba' or 'numpy'. The loops versions are compiled on their own: they must not call other python
+# functions.
+
+BACKENDS = ('auto', 'numba', 'numpy')
+
+_requested = None  # type: str  # last set_backend name
+_backend = None  # type: str  # resolved on first use, numba is only imported then
+_implementations = {}  # type: dict  # kernel name -> function of the active backend
+
+
+def set_backend(name: str = None) -> str:
+    """
+    :param name: one of BACKENDS, defaults to the PRRT_KERNELS environment variable then 'auto'
+    :return: the active backend, 'numba' or 'numpy'
+    """
+    global _requested, _backend, _implementations
+    name = (name or os.environ.get('PRRT_KERNELS') or 'auto').lower()
+    if name not in BACKENDS:
+        raise ValueError('Unknown kernels backend {0}, expected one of {1}'.format(name, BACKENDS))
+    if name == _requested or name == _backend:
+        return _backend
+    _requested = name
+    if name in ('auto', 'numba'):
+        try:
+            import numba
+        except ImportError:
+            if name == 'numba':
+                print('numba is not installed, falling back to the numpy kernels')
+            name = 'numpy'
+        else:
+            name = 'numba'
+            # compiled on first call, cached on disk next to the module
+            _implementations = {kernel: numba.njit(cache=True)(function) for kernel, function in _LOOPS.items()}
+    if name == 'numpy':
+        _implementations = dict(_NUMPY)
+    _backend = name
+    return _backend
+
+
+def backend() -> str:
+    return _backend if _backend is not None else set_backend()
+
+
+def _kernel(name: str):
+    if _backend is None:
+        set_backend()
+    return _implementations[name]
+
+
+def polygons_min_distance(polygons: np.ndarray, d: np.ndarray, boxes: np.ndarray, resolution: float, size: float,
+                          corners_d: np.ndarray):
+    """
+    Lowers each corner (ix * resolution - size, iy * resolution - size) of corners_d to the least d of the polygons
+    containing it (see points_in_polygons). Polygon p is only tested against the corners of its box.
+    :param polygons: (polygons count, vertices count, 2) array
+    :param d: (polygons count,) distance associated to each polygon
+    :param boxes: (polygons count, 4) int array, inclusive corner index ranges ix_min, ix_max, iy_min, iy_max
+    :param corners_d: (corners count x, corners count y) float array, updated in place
+    """
+    _kernel('polygons_min_distance')(np.ascontiguousarray(polygons, dtype=float), np.asarray(d, dtype=float),
+                                     np.ascontiguousarray(boxes, dtype=np.int64), resolution, size, corners_d)
+
+
+def cptg_inverse(x: np.ndarray, y: np.ndarray, K: int, v_max: float, w_max: float, turn_radius: float,
+                 alpha_max: float, alpha_resolution: float, distance_ref: float) -> (np.ndarray, np.ndarray,
+                                                                                    np.ndarray):
+    """
+    CPTG.inverse_WS2TP of many relative positions
+    :return: is_exact, k and normalized d arrays
+    """
+    return _kernel('cptg_inverse')(np.asarray(x, dtype=float), np.asarray(y, dtype=float), K, v_max, w_max,
+                                   turn_radius, alpha_max, alpha_resolution, distance_ref)
+
+
+def first_nearest(dx: np.ndarray, dy: np.ndarray, d: np.ndarray) -> int:
+    """
+    Index of the nearest node as found by scanning the nodes in order, skipping the nodes further than the
+    nearest so far in x or y (dx, dy absolute), ties resolved to the first node. -1 if all d are infinite.
+    """
+    return int(_kernel('first_nearest')(np.asarray(dx, dtype=float), np.asarray(dy, dtype=float),
+                                        np.asarray(d, dtype=float)))
+
+
+def cost_to_go(blocked: np.ndarray, goal_ix: int, goal_iy: int, x_resolution: float, y_resolution: float) -> np.ndarray:
+    """
+    Length (m) of the shortest 8-connected path from the goal cell to each cell, through the cells not blocked
+    :param blocked: (cells count y, cells count x) bool array, the goal cell must not be blocked
+    :return: (cells count y, cells count x) float array, inf for the blocked and unreachable cells
+    """
+    return _kernel('cost_to_go')(np.ascontiguousarray(blocked, dtype=np.bool_), goal_ix, goal_iy, x_resolution,
+                                 y_resolution)
+
+
+# numpy versions
+
+def _polygons_min_distance_numpy(polygons, d, boxes, resolution, size, corners_d, chunk=32):
+    for first in range(0, len(polygons), chunk):
+        chunk_boxes = boxes[first:first + chunk]
+        ix_min, iy_min = chunk_boxes[:, 0].min(), chunk_boxes[:, 2].min()
+        ix_max, iy_max = chunk_boxes[:, 1].max(), chunk_boxes[:, 3].max()
+        if ix_max < ix_min or iy_max < iy_min:
+            continue
+        # the corners of the boxes union, each polygon only counts within its own box
+        ix, iy = np.meshgrid(np.arange(ix_min, ix_max + 1), np.arange(iy_min, iy_max + 1), indexing='ij')
+        ix = ix.ravel()
+        iy = iy.ravel()
+        inside = points_in_polygons(ix * resolution - size, iy * resolution - size, polygons[first:first + chunk])
+        inside &= (ix >= chunk_boxes[:, 0:1]) & (ix <= chunk_boxes[:, 1:2]) & \
+                  (iy >= chunk_boxes[:, 2:3]) & (iy <= chunk_boxes[:, 3:4])
+        chunk_d = np.where(inside, d[first:first + chunk, None], np.inf).min(axis=0)
+        corners_d[ix, iy] = np.minimum(corners_d[ix, iy], chunk_d)
+
+
+def _alpha_to_idx_numpy(alpha, alpha_max, alpha_resolution):
+    # PTG.alpha2idx
+    alpha = (alpha + math.pi) % (2. * math.pi) - math.pi
+    alpha = np.where(np.abs(alpha) > alpha_max, np.sign(alpha) * alpha_max, alpha)
+    return np.rint((alpha + alpha_max) / alpha_resolution).astype(np.int64)
+
+
+def _cptg_inverse_numpy(x, y, K, v_max, w_max, turn_radius, alpha_max, alpha_resolution, distance_ref):
+    is_exact = np.ones(len(x), dtype=bool)
+    k = np.empty(len(x), dtype=np.int64)
+    d = np.empty(len(x))
+    arc = y != 0
+    x_arc = x[arc]
+    y_arc = y[arc]
+    R = (x_arc * x_arc + y_arc * y_arc) / (2 * y_arc)
+    abs_R = np.abs(R)
+    r_min = abs(v_max / w_max)
+    x_sign = x_arc if K > 0 else -x_arc
+    theta = np.arctan2(x_sign, np.where(y_arc > 0, abs_R - y_arc, y_arc + abs_R))
+    # helper.wrap_to_0_2pi
+    negative = theta < 0
+    theta = np.fmod(theta, 2. * math.pi)
+    theta[negative] += 2. * math.pi
+    d[arc] = theta * (abs_R + turn_radius)
+    too_tight = abs_R < r_min
+    R = np.where(too_tight, r_min * np.sign(R), R)
+    a = np.pi * v_max / (w_max * R)
+    k[arc] = _alpha_to_idx_numpy(a, alpha_max, alpha_resolution)
+    is_exact[arc] = ~too_tight & ~(np.abs(a) > alpha_max + alpha_resolution)
+    straight = np.flatnonzero(~arc)
+    if len(straight) > 0:
+        forward = np.sign(x[straight]) == np.sign(K)
+        k[straight] = np.where(forward, _alpha_to_idx(0., alpha_max, alpha_resolution),
+                               _alpha_to_idx(np.pi, alpha_max, alpha_resolution))
+        d[straight] = np.where(forward, x[straight], 1e+3)
+        is_exact[straight] = forward
+    return is_exact, k, d / distance_ref
+
+
+def _first_nearest_numpy(dx, dy, d):
+    if len(d) == 0:
+        return -1
+    best = int(np.argmin(d))
+    if not np.isfinite(d[best]):
+        return -1
+    if dx[best] <= d[best] and dy[best] <= d[best]:
+        # the scan can't skip it: it is never further in x or y than the nearest so far
+        return best
+    return _first_nearest_loops(dx.tolist(), dy.tolist(), d.tolist())
+
+
+def _cost_to_go_numpy(blocked, goal_ix, goal_iy, x_resolution, y_resolution):
+    # Dijkstra by bands of the least step (Dial): the cells less than one step above the least tentative cost can't
+    # improve each other, they are settled and relaxed at once. The grid is padded with blocked cells.
+    h, w = blocked.shape
+    padded_w = w + 2
+    padded = np.ones((h + 2, padded_w), dtype=bool)
+    padded[1:-1, 1:-1] = blocked
+    padded = padded.ravel()
+    step_d = math.hypot(x_resolution, y_resolution)
+    offsets = np.array([1, -1, padded_w, -padded_w, padded_w + 1, -padded_w + 1, padded_w - 1, -padded_w - 1])
+    steps = np.array([x_resolution, x_resolution, y_resolution, y_resolution, step_d, step_d, step_d, step_d])
+    band = min(x_resolution, y_resolution)
+    cost = np.full(len(padded), np.inf)
+    start = (goal_iy + 1) * padded_w + goal_ix + 1
+    cost[start] = 0.
+    pending_idx = np.array([start])  # tentative costs, entries whose cell was improved since are skipped
+    pending_cost = np.array([0.])
+    while len(pending_idx) > 0:
+        settle = pending_cost < pending_cost.min() + band
+        idx = pending_idx[settle]
+        idx_cost = pending_cost[settle]
+        pending_idx = pending_idx[~settle]
+        pending_cost = pending_cost[~settle]
+        current = idx_cost == cost[idx]
+        idx, first = np.unique(idx[current], return_index=True)
+        idx_cost = idx_cost[current][first]
+        neighbours = (idx[:, None] + offsets).ravel()
+        neighbours_cost = (idx_cost[:, None] + steps).ravel()
+        improved = ~padded[neighbours] & (neighbours_cost < cost[neighbours])
+        neighbours = neighbours[improved]
+        neighbours_cost = neighbours_cost[improved]
+        np.minimum.at(cost, neighbours, neighbours_cost)
+        pending_idx = np.concatenate((pending_idx, neighbours))
+        pending_cost = np.concatenate((pending_cost, neighbours_cost))
+    return cost.reshape(h + 2, padded_w)[1:-1, 1:-1].copy()
+
+
+# loops versions, numba compatible
+
+def _polygons_min_distance_loops(polygons, d, boxes, resolution, size, corners_d):
+    eps_square = POLYGON_BOUNDARY_EPS * POLYGON_BOUNDARY_EPS
+    vertices_count = polygons.shape[1]
+    for p in range(polygons.shape[0]):
+        for ix in range(boxes[p, 0], boxes[p, 1] + 1):
+            px = ix * resolution - size
+            for iy in range(boxes[p, 2], boxes[p, 3] + 1):
+                if corners_d[ix, iy] <= d[p]:
+                    continue
+                py = iy * resolution - size
+                # same as points_in_polygons: on the boundary or odd crossings of the ray towards +x
+                inside = False
+                crossings = 0
+                for j in range(vertices_count):
+                    a_x = polygons[p, j, 0]
+                    a_y = polygons[p, j, 1]
+                    b_y = polygons[p, (j + 1) % vertices_count, 1]
+                    ab_x = polygons[p, (j + 1) % vertices_count, 0] - a_x
+                    ab_y = b_y - a_y
+                    length_square = ab_x * ab_x + ab_y * ab_y
+                    t = 0. if length_square == 0. else ((px - a_x) * ab_x + (py - a_y) * ab_y) / length_square
+                    t = min(1., max(0., t))
+                    dx = px - (a_x + t * ab_x)
+                    dy = py - (a_y + t * ab_y)
+                    if dx * dx + dy * dy <= eps_square:
+                        inside = True
+                        break
+                    if (a_y > py) != (b_y > py) and px < a_x + (py - a_y) * ab_x / ab_y:
+                        crossings += 1
+                if inside or crossings % 2 == 1:
+                    corners_d[ix, iy] = d[p]
+
+
+def _alpha_to_idx(alpha, alpha_max, alpha_resolution):
+    # PTG.alpha2idx of a scalar, inlined in _cptg_inverse_loops
+    alpha = (alpha + math.pi) % (2. * math.pi) - math.pi
+    if abs(alpha) > alpha_max:
+        alpha = alpha_max if alpha > 0 else -alpha_max
+    return int(np.rint((alpha + alpha_max) / alpha_resolution))
+
+
+def _cptg_inverse_loops(x, y, K, v_max, w_max, turn_radius, alpha_max, alpha_resolution, distance_ref):
+    n = len(x)
+    is_exact = np.ones(n, dtype=np.bool_)
+    k = np.empty(n, dtype=np.int64)
+    d = np.empty(n)
+    r_min = abs(v_max / w_max)
+    # trajectories of the straight lines: alpha 0 forward, alpha pi (wrapped to -pi, clipped to alpha_max) backward
+    k_forward = int(np.rint(alpha_max / alpha_resolution))
+    k_backward = int(np.rint((max(-math.pi, -alpha_max) + alpha_max) / alpha_resolution))
+    for i in range(n):
+        if y[i] != 0:
+            R = (x[i] * x[i] + y[i] * y[i]) / (2 * y[i])
+            x_sign = x[i] if K > 0 else -x[i]
+            if y[i] > 0:
+                theta = np.arctan2(x_sign, abs(R) - y[i])
+            else:
+                theta = np.arctan2(x_sign, y[i] + abs(R))
+            negative = theta < 0
+            theta = np.fmod(theta, 2. * math.pi)
+            if negative:
+                theta += 2. * math.pi
+            d[i] = theta * (abs(R) + turn_radius)
+            if abs(R) < r_min:
+                is_exact[i] = False
+                R = r_min if R > 0 else (-r_min if R < 0 else 0.)
+            a = np.pi * v_max / (w_max * R)
+            if abs(a) > alpha_max + alpha_resolution:
+                is_exact[i] = False
+            # PTG.alpha2idx
+            a = (a + math.pi) % (2. * math.pi) - math.pi
+            if abs(a) > alpha_max:
+                a = alpha_max if a > 0 else -alpha_max
+            k[i] = int(np.rint((a + alpha_max) / alpha_resolution))
+        elif np.sign(x[i]) == np.sign(K):
+            k[i] = k_forward
+            d[i] = x[i]
+        else:
+            k[i] = k_backward
+            d[i] = 1e+3
+            is_exact[i] = False
+        d[i] /= distance_ref
+    return is_exact, k, d
+
+
+def _first_nearest_loops(dx, dy, d):
+    d_min = math.inf
+    best = -1
+    for i in range(len(d)):
+        if dx[i] > d_min or dy[i] > d_min:
+            continue
+        if d[i] < d_min:
+            d_min = d[i]
+            best = i
+    return best
+
+
+def _cost_to_go_loops(blocked, goal_ix, goal_iy, x_resolution, y_resolution):
+    # Dijkstra over the 8-connected grid, with a binary heap of the cells indexed by cell (decrease key in place)
+    h, w = blocked.shape
+    step_d = math.hypot(x_resolution, y_resolution)
+    moves_x = np.array([1, -1, 0, 0, 1, 1, -1, -1])
+    moves_y = np.array([0, 0, 1, -1, 1, -1, 1, -1])
+    steps = np.array([x_resolution, x_resolution, y_resolution, y_resolution, step_d, step_d, step_d, step_d])
+    cost = np.full(h * w, np.inf)
+    heap = np.empty(h * w, dtype=np.int64)  # cells, ordered by cost
+    position = np.full(h * w, -1, dtype=np.int64)  # of each cell in heap, -1 if not in it
+    start = goal_iy * w + goal_ix
+    cost[start] = 0.
+    heap[0] = start
+    position[start] = 0
+    size = 1
+    while size > 0:
+        idx = heap[0]
+        position[idx] = -1
+        size -= 1
+        if size > 0:
+            # sift the last cell down from the root
+            cell = heap[size]
+            i = 0
+            while True:
+                child = 2 * i + 1
+                if child >= size:
+                    break
+                if child + 1 < size and cost[heap[child + 1]] < cost[heap[child]]:
+                    child += 1
+                if cost[heap[child]] >= cost[cell]:
+                    break
+                heap[i] = heap[child]
+                position[heap[i]] = i
+                i = child
+            heap[i] = cell
+            position[cell] = i
+        iy = idx // w
+        ix = idx % w
+        for m in range(8):
+            jx = ix + moves_x[m]
+            jy = iy + moves_y[m]
+            if jx < 0 or jy < 0 or jx >= w or jy >= h or blocked[jy, jx]:
+                continue
+            j = jy * w + jx
+            new_cost = cost[idx] + steps[m]
+            if new_cost >= cost[j]:
+                continue
+            cost[j] = new_cost
+            # sift j up from its position, or from the end if it's not in the heap
+            i = position[j]
+            if i < 0:
+                i = size
+                size += 1
+            while i > 0:
+                parent = (i - 1) // 2
+                if cost[heap[parent]] <= new_cost:
+                    break
+                heap[i] = heap[parent]
+                position[heap[i]] = i
+                i = parent
+            heap[i] = j
+            position[j] = i
+    return cost.reshape(h, w)
+
+
+_NUMPY = {'polygons_min_distance': _polygons_min_distance_numpy,
+          'cptg_inverse': _cptg_inverse_numpy,
+          'first_nearest': _first_nearest_numpy,
+          'cost_to_go': _cost_to_go_numpy}
+
+_LOOPS = {'polygons_min_distance': _polygons_min_distance_loops,
+          'cptg_inverse': _cptg_inverse_loops,
+          'first_nearest': _first_nearest_loops,
+          'cost_to_go': _cost_to_go_loops}
@@ -1,15 +1,21 @@
+import os.path
 from typing import List
-import matplotlib.pyplot as plt
-import matplotlib.pyplot as image
 import numpy as np
 from sortedcontainers import sorteddict
 import prrt.helper as helper
+import prrt.kernels as kernels
 from prrt.grid import WorldGrid
-from prrt.primitive import PoseR2S2, PointR2
+from prrt.primitive import PoseR2S2, PointR2, PoseArray
 from prrt.ptg import PTG, APTG
-from math import degrees as deg
+from prrt.sampler import Sampler, SamplerFactory
+from prrt.solution import Solution
+from prrt.profiler import PhaseProfiler, NullProfiler, run_with_profiler_hook
+from prrt.eventlog import EventLog, NullEventLog
+from prrt.shortcut import PathShortcutter, ShortcutReport
+from prrt.pruning import TreePruner, PruneReport
 from prrt.vehicle import ArticulatedVehicle
 import time
+import random
 
 
 class Node(object):
@@ -22,7 +28,9 @@ class Node(object):
         self.parent = parent
         self.ptg = ptg
         self.edges_to_child = []  # type: List[Edge]
+        self.edge = None  # type: Edge  # edge from the parent node
         self.id = 0
+        self.cost = 0.  # sum of the edges trajectory length from the root, set when inserted in a tree
 
     def __str__(self):
         return str(self.pose)
@@ -39,6 +47,65 @@ class Edge(object):
         self.d = d
         self.parent = parent
         self.end_pose = end_pose
+        self.child = None  # type: Node
+        self.verified = True  # False until fully collision checked, see Planner.lazy_collides
+
+
+class EdgeIndex(object):
+    """
+    Spatial index of the tree edges: a uniform grid of square buckets, each holding the edges whose swept
+    vehicle footprint (bounding box) overlaps the bucket
+    """
+
+    def __init__(self, bucket_size: float = 5.0, world_cell_size: float = 0.):
+        self.bucket_size = bucket_size
+        self.world_cell_size = world_cell_size  # obstacle points lie on the world cell corners
+        self._buckets = {}  # type: dict  # {(bx, by): set of edges}
+        self._edge_buckets = {}  # type: dict  # {edge: list of (bx, by)}
+
+    @staticmethod
+    def get_swept_bounds(edge: Edge, margin: float = 0.) -> (float, float, float, float):
+        """
+        Bounding box of the vehicle footprint along the edge, grown by the obstacle grid resolution (the TP check
+        marks all the cells sharing a corner covered by the vehicle) plus margin
+        :return: x_min, y_min, x_max, y_max
+        """
+        arrays = edge.ptg.get_cpoints_arrays(edge.k)
+        n = edge.ptg.get_cpoints_idx_at_d(edge.d, edge.k) + 1  # up to the first cpoint at or past edge.d
+        vertices = edge.ptg.vehicle.vertices_at_poses(arrays['x'][:n], arrays['y'][:n], arrays['theta'][:n],
+                                                      arrays['phi'][:n]).reshape(-1, 2)
+        parent = edge.parent.pose
+        cos_theta = np.cos(parent.theta)
+        sin_theta = np.sin(parent.theta)
+        xs = parent.x + vertices[:, 0] * cos_theta - vertices[:, 1] * sin_theta
+        ys = parent.y + vertices[:, 0] * sin_theta + vertices[:, 1] * cos_theta
+        pad = edge.ptg.obstacle_grid._resolution + margin
+        return xs.min() - pad, ys.min() - pad, xs.max() + pad, ys.max() + pad
+
+    def insert(self, edge: Edge):
+        x_min, y_min, x_max, y_max = self.get_swept_bounds(edge, self.world_cell_size)
+        keys = [(bx, by) for bx in range(int(np.floor(x_min / self.bucket_size)),
+                                         int(np.floor(x_max / self.bucket_size)) + 1)
+                for by in range(int(np.floor(y_min / self.bucket_size)), int(np.floor(y_max / self.bucket_size)) + 1)]
+        for key in keys:
+            self._buckets.setdefault(key, set()).add(edge)
+        self._edge_buckets[edge] = keys
+
+    def remove(self, edge: Edge):
+        for key in self._edge_buckets.pop(edge, []):
+            self._buckets[key].discard(edge)
+
+    def query(self, points: np.ndarray) -> set:
+        """
+        :param points: 2xN array of world points
+        :return: the edges whose buckets contain any of the points
+        """
+        edges = set()
+        keys = set(zip(np.floor(points[0] / self.bucket_size).astype(int).tolist(),
+                       np.floor(points[1] / self.bucket_size).astype(int).tolist()))
+        for key in keys:
+            edges.update(self._buckets.get(key, ()))
+        return edges
 
 
 class Tree(object):
@@ -50,22 +117,24 @@ class Tree(object):
         root_node = Node(ptg=None, pose=init_pose)
         self.nodes = [root_node]  # type: List[Node]
         self._edges = []  # type: List[Edge]
+        self._next_id = 1
+        self.edge_index = None  # type: EdgeIndex  # built on demand, see build_edge_index
 
     def get_aptg_nearest_node(self, to_node: Node, aptg: APTG, mode='TP') -> (PTG, Node, float):
+        if mode == 'TP':
+            return self._get_aptg_nearest_node_batch(to_node, aptg)
+        assert mode == 'Metric', 'Unknown nearest node mode {0}'.format(mode)
         d_min = float('inf')
         node_min = None
         node_ptg = None
         for node in self.nodes:
-            # Only do the the expensive ptg.get_distance when needed
+            # Only do the the expensive ptg.get_distance_metric when needed
             if abs(node.pose.x - to_node.pose.x) > d_min:
                 continue
             if abs(node.pose.y - to_node.pose.y) > d_min:
                 continue
             ptg = aptg.ptg_at_phi(node.pose.phi)
-            if mode == 'TP':
-                d = ptg.get_distance(node.pose, to_node.pose)
-            elif mode == 'Metric':
-                d = ptg.get_distance_metric(node.pose, to_node.pose)
+            d = ptg.get_distance_metric(node.pose, to_node.pose)
             if d < d_min:
                 d_min = d
                 node_min = node
@@ -73,63 +142,144 @@ class Tree(object):
 
         return node_ptg, node_min, d_min
 
+    def _get_aptg_nearest_node_batch(self, to_node: Node, aptg: APTG) -> (PTG, Node, float):
+        # nearest node in TP mode: the distances to all the nodes are computed at once, ties resolved to the first
+        # node as when scanning the nodes in order
+        poses = self.get_node_poses()
+        relative = PoseArray.from_poses([to_node.pose]) - poses
+        ptg_idx = aptg.ptg_indices_at_phi(poses.phi)
+        is_exact, k, d = aptg.inverse_WS2TP_batch(ptg_idx, relative.x, relative.y)
+        d = np.where(is_exact, d * aptg.ptgs[0].distance_ref, np.inf)
+        best = kernels.first_nearest(np.abs(poses.x - to_node.pose.x), np.abs(poses.y - to_node.pose.y), d)
+        if best < 0:
+            return None, None, float('inf')
+        return aptg.ptgs[ptg_idx[best]], self.nodes[best], float(d[best])
+
+    def get_node_poses(self) -> PoseArray:
+        """
+        Poses of self.nodes in the same order. Extended with the nodes appended since the last call, rebuilt when
+        the nodes list is replaced (see remove_subtree and remove_leaves)
+        """
+        nodes, poses = self.__dict__.get('_node_poses', (None, None))
+        if nodes is not self.nodes:
+            nodes, poses = self.nodes, PoseArray.from_poses([node.pose for node in self.nodes])
+        elif len(poses) < len(nodes):
+            added = PoseArray.from_poses([node.pose for node in nodes[len(poses):]])
+            poses = PoseArray(np.concatenate((poses.data, added.data)))
+        self._node_poses = (nodes, poses)
+        return poses
+
     def insert_node_and_edge(self, parent: Node, child: Node, edge: Edge):
-        child.id = len(self.nodes)
+        child.id = self._next_id
+        self._next_id += 1
+        child.edge = edge
+        child.cost = parent.cost + edge.d
+        edge.child = child
         self.nodes.append(child)
         self._edges.append(edge)
         parent.edges_to_child.append(edge)
+        if self.edge_index is not None:
+            self.edge_index.insert(edge)
+
+    def build_edge_index(self, bucket_size: float = 5.0, world_cell_size: float = 0.):
+        """
+        Indexes all the edges of the tree, edges inserted afterwards are indexed on insertion
+        """
+        self.edge_index = EdgeIndex(bucket_size, world_cell_size)
+        for edge in self._edges:
+            self.edge_index.insert(edge)
+
+    def remove_subtree(self, node: Node) -> List[Node]:
+        """
+        Removes the given node, all its descendants and the edges leading to them
+        :return: the removed nodes
+        """
+        assert node.parent is not None, 'The root node can\'t be removed'
+        removed = []
+        stack = [node]
+        while len(stack) > 0:
+            current = stack.pop()
+            removed.append(current)
+            stack.extend(edge.child for edge in current.edges_to_child)
+        node.parent.edges_to_child.remove(node.edge)
+        removed_nodes = set(removed)
+        removed_edges = set(current.edge for current in removed)
+        self.nodes = [current for current in self.nodes if current not in removed_nodes]
+        self._edges = [edge for edge in self._edges if edge not in removed_edges]
+        if self.edge_index is not None:
+            for edge in removed_edges:
+                self.edge_index.remove(edge)
+        return removed
+
+    def remove_leaves(self, leaves: List[Node]):
+        """
+        Removes the given leaf nodes and the edges leading to them, the nodes list and indexes are updated once
+        """
+        if len(leaves) == 0:
+            return
+        for node in leaves:
+            assert node.parent is not None and len(node.edges_to_child) == 0, 'Only leaf nodes can be removed'
+            node.parent.edges_to_child.remove(node.edge)
+        removed_nodes = set(leaves)
+        removed_edges = set(node.edge for node in leaves)
+        self.nodes = [current for current in self.nodes if current not in removed_nodes]
+        self._edges = [edge for edge in self._edges if edge not in removed_edges]
+        if self.edge_index is not None:
+            for edge in removed_edges:
+                self.edge_index.remove(edge)
 
-    def plot_nodes(self, world: WorldGrid, goal: PointR2 = None, goal_dist_tolerance=1.0, file_name=None ):
-        import os.path
-        file_name_root_eps = './out/tree.eps'
-        file_name_root_png = './out/tree.png'
-        file_name_png = file_name_root_png
-        file_name_eps = file_name_root_eps
+    @staticmethod
+    def get_branch(node: Node) -> List[Node]:
+        # nodes connecting the root to the given node, root first
+        branch = []
+        while node is not None:
+            branch.append(node)
+            node = node.parent
+        branch.reverse()
+        return branch
 
-        # save the solution in a different file if the file already exist and numerate them
-        # TODO: really dirty way of doing it as it will check for all the files, fix this!
-        cnt = 0
-        while os.path.exists(file_name_png):
-            cnt = cnt + 1
-            file_name_png = ('{0}{1:04d}.png'.format(file_name_root_png, cnt))
-
-        cnt = 0
-        while os.path.exists(file_name_eps):
-            cnt = cnt + 1
-            file_name_eps = ('{0}{1:04d}.eps'.format(file_name_root_eps, cnt))
-
-        fig, ax = plt.subplots()
-        #ax.matshow(world.omap, cmap=plt.cm.gray_r, origin='upper', interpolation='none')
-        # instead of showing image first and then the
-        map = np.fliplr(world.map_32bit)
-        #map = world.map_32bit
-        ax.imshow(map, #cmap=plt.cm.gray_r, interpolation='none', #origin='upper',
-                  extent=(world.width, 0.0, world.height, 0.0), zorder=-1)
-        plt.xlabel('x(m)', fontsize=20)
-        plt.ylabel('y(m)', fontsize=20)
-        plt.ylim(0, world.height)
-        plt.xlim(0, world.width)
-
-        circle = plt.Circle((goal.x, goal.y), goal_dist_tolerance, color='red', fill=False)
-        ax.add_artist(circle)
-        for node in self.nodes:
-            x = node.pose.x #world.x_to_ix(node.pose.x)
-            y = node.pose.y #world.y_to_iy(node.pose.y)
-            ax.plot(x, y, 'bx')
-        if goal is not None:
-            ax.plot(goal.x, goal.y, '+r')
-            #ax.plot(world.x_to_ix(goal.x), world.y_to_iy(goal.y), '+r')
-        # save png
-        if file_name_png is None:
-            plt.savefig(file_name_png)
-        else:
-            plt.savefig(file_name_png, format='png', dpi=150, bbox_inches='tight', pad_inches=0.1)
-        # save eps
-        if file_name_eps is None:
-            plt.savefig(file_name_eps)
-        else:
-            plt.savefig(file_name_eps, format='eps', dpi=150, bbox_inches='tight', pad_inches=0.1)
-            # plt.show()
+    @staticmethod
+    def get_path_length(node: Node) -> float:
+        # R2 length of the branch connecting the root to the given node
+        length = 0.0
+        while node.parent is not None:
+            length += node.parent.pose.distance_2d(node.pose)
+            node = node.parent
+        return length
+
+    def plot_nodes(self, world: WorldGrid, goal: PointR2 = None, goal_dist_tolerance=1.0, file_name='./out/tree.png',
+                   draw_edges=False):
+        # save the plot in a different file if the file already exist and numerate them, an eps copy is saved too
+        file_name_png = helper.get_unique_file_name(file_name, '.png')
+        file_name_eps = helper.get_unique_file_name(os.path.splitext(file_name)[0] + '.eps', '.eps')
+        import prrt.visualization as visualization  # matplotlib is only loaded when plotting
+        visualization.plot_tree(world, self.nodes, goal, goal_dist_tolerance, [file_name_png, file_name_eps],
+                                draw_edges)
+
+
+class PlannerResult(object):
+    """
+    Outcome of a Planner.solve() call
+    """
+    SOLVED = 'solved'
+    TIMEOUT = 'timeout'  # deadline or time_budget reached, branch holds the best effort path
+    MAX_COUNT = 'max_count'  # max_count nodes reached, branch holds the best effort path
+
+    def __init__(self):
+        self.status = None  # type: str
+        self.branch = []  # type: List[PoseR2S2]  # root to goal node, or to the node closest to goal if not solved
+        self.solution = None  # type: Solution  # sampled trajectory along branch
+        self.shortcut = None  # type: ShortcutReport  # set if the path was shortcut
+        self.pruning = None  # type: PruneReport  # set if tree pruning is enabled
+        self.success = False
+        self.iterations = 0
+        self.nodes = 0
+        self.path_length = 0.  # (m) R2 length of the branch, see Tree.get_path_length
+        self.distance_to_target = float('inf')
+        self.solving_time = float('inf')  # (s) from the start of the solve to its return, post-processing included
+        self.first_solution_time = float('inf')  # (s) from the start of the solve to the first goal reached
+        self.profile = None  # type: dict  # see PhaseProfiler.report(), None if profiling is disabled
+        self.seed = None  # type: int  # seed of the random number generator, reproduces the result
 
 
 class Planner(object):
@@ -143,16 +293,27 @@ class Planner(object):
         self.init_pose = None  # type: PoseR2S2
         self.goal_pose = None  # type: PoseR2S2
         self.tree = None  # type: Tree
+        self.sampler = None  # type: Sampler
         self.config = config
+        # seed: None seeds the random number generator from the OS
+        self.rng = random.Random(config.get('seed'))
         self.planner_success = False
         self.total_number_of_iterations = 0
         self.total_number_of_nodes = 0
         self.best_path_length = float('inf')
         self.best_distance_to_target = float('inf')
         self.solving_time = float('inf')
+        self.first_solution_time = float('inf')  # see PlannerResult.first_solution_time
+        self.profiler = None  # type: PhaseProfiler
+        self.event_log = None  # type: EventLog
+        self._lazy_outlines = {}  # type: dict  # {(ptg, k): see get_lazy_outlines}
+        self.result = None  # type: PlannerResult
+        self.best_node = None  # type: Node  # goal node if solved, otherwise the node closest to the goal
+        self.solution_node = None  # type: Node  # last node of the reported path, best_node unless shortcut
+        self.pruner = None  # type: TreePruner  # set by solve if prune_interval or node_budget is set
 
     def load_world_map(self, map_file, width: float, height: float):
-        self.world = WorldGrid(map_file, width, height)
+        self.world = WorldGrid.from_file(map_file, width, height)
         self.world.build_obstacle_buffer()
 
     def load_aptgs(self, files: List[str]):
@@ -160,12 +321,152 @@ class Planner(object):
             self.aptgs.append(helper.load_object(file))
 
     def setup(self):
-        aptgs_files = self.config['aptg_files']
-        self.load_aptgs(aptgs_files)
-        map_file = self.config['world_map_file']
-        width = self.config['world_width']
-        height = self.config['world_height']
-        self.load_world_map(map_file, width, height)
+        kernels.set_backend(self.config.get('kernels'))
+        # APTGs and world map are loaded once, later solve() calls (e.g. replanning) reuse them
+        if len(self.aptgs) == 0:
+            aptgs_files = self.config['aptg_files']
+            self.load_aptgs(aptgs_files)
+        if self.world is None:
+            map_file = self.config['world_map_file']
+            width = self.config['world_width']
+            height = self.config['world_height']
+            self.load_world_map(map_file, width, height)
+        if not self.world.whole_map:
+            # tiled maps only hold the tiles around the queried positions
+            if self.config.get('cost_to_go', False):
+                raise ValueError('cost_to_go is not available on tiled maps ({0})'.format(self.world.map_file))
+            sampler_class = SamplerFactory.get_sampler_class(self.config)
+            if sampler_class.needs_whole_map:
+                raise ValueError('{0} is not available on tiled maps ({1}), use FreeSpaceSampler or '
+                                 'UniformSampler'.format(sampler_class.__name__, self.world.map_file))
+
+    def update_world(self, added_regions: List[tuple] = (), removed_regions: List[tuple] = ()) -> int:
+        """
+        Applies obstacle changes to the world map without rebuilding it, then removes from the tree the edges
+        whose swept footprint collides with the new obstacles, along with their subtrees. The surviving
+        tree seeds the next search, see solve(reuse_tree=True).
+        :param added_regions: list of (x_min, y_min, x_max, y_max) regions (m) that became occupied
+        :param removed_regions: list of (x_min, y_min, x_max, y_max) regions (m) that became free
+        :return: number of nodes removed from the tree
+        """
+        self.setup()
+        for region in removed_regions:
+            self.world.remove_obstacle_region(*region)
+        new_obstacles = [self.world.add_obstacle_region(*region) for region in added_regions]
+        new_obstacles = [obstacles for obstacles in new_obstacles if obstacles.shape[1] > 0]
+        if self.tree is None or len(new_obstacles) == 0:
+            return 0
+        new_obstacles = np.hstack(new_obstacles)
+        if self.tree.edge_index is None:
+            self.tree.build_edge_index(self.config.get('edge_index_bucket_size', 5.0),
+                                       max(self.world.x_resolution, self.world.y_resolution))
+        removed_nodes = set()
+        for edge in self.tree.edge_index.query(new_obstacles):
+            if edge.child in removed_nodes or not self.edge_collides(edge, new_obstacles):
+                continue
+            removed_nodes.update(self.tree.remove_subtree(edge.child))
+        print('World updated, {0} nodes invalidated'.format(len(removed_nodes)))
+        return len(removed_nodes)
+
+    def edge_collides(self, edge: Edge, obstacles: np.ndarray = None) -> bool:
+        """
+        Checks the edge against the given obstacles (2xN world points, defaults to the world obstacles), same check
+        as in solve()
+        """
+        max_dist = self.config['obs_R'] * edge.ptg.distance_ref
+        if obstacles is None:
+            obstacles_rel = self.world.transform_point_cloud(edge.parent.pose, max_dist)
+        else:
+            obstacles_rel = WorldGrid.transform_points(obstacles, edge.parent.pose, max_dist)
+        obstacles_TP = self.transform_toTP_obstacles(edge.ptg, obstacles_rel, edge.k, max_dist)
+        return obstacles_TP[edge.k] < edge.d
+
+    def lazy_collides(self, ptg: PTG, start_pose: PoseR2S2, k: int, d: float) -> bool:
+        """
+        Cheap collision check used in lazy_collision mode: the vehicle outline is looked up in the occupancy map
+        at poses lazy_collision_step (m) apart along the trajectory, up to d. It sees the same shapes within the
+        same range as the full check but may miss obstacles between the checked poses, past the last one or inside
+        the outline: edges accepted this way are verified by verify_branch once on a goal branch.
+        """
+        d_stations, points = self.get_lazy_outlines(ptg, k)
+        points = points[:max(1, np.searchsorted(d_stations, d, side='right'))].reshape(-1, 2)
+        cos_theta = np.cos(start_pose.theta)
+        sin_theta = np.sin(start_pose.theta)
+        x_rel = points[:, 0] * cos_theta - points[:, 1] * sin_theta
+        y_rel = points[:, 0] * sin_theta + points[:, 1] * cos_theta
+        # same range as the obstacles of the full check, see WorldGrid.transform_points
+        max_dist = self.config['obs_R'] * ptg.distance_ref
+        in_range = (np.abs(x_rel) < max_dist) & (np.abs(y_rel) < max_dist)
+        return self.world.points_occupied(start_pose.x + x_rel[in_range], start_pose.y + y_rel[in_range]).any()
+
+    def get_lazy_outlines(self, ptg: PTG, k: int) -> (np.ndarray, np.ndarray):
+        """
+        Points sampled at the map resolution on the outline of the tractor and trailer (the shapes of the ptg
+        obstacle grid) at the lazy check poses of trajectory k, relative to the trajectory start. As in the full
+        check, points further than obs_R * distance_ref are ignored. Built on first use and cached.
+        :return: d of the check poses and a (poses count, points count, 2) array of points, ignored points are nan
+        """
+        outlines = self._lazy_outlines.get((ptg, k))
+        if outlines is None:
+            step = self.config.get('lazy_collision_step', 0.5)
+            max_dist = self.config['obs_R'] * ptg.distance_ref
+            resolution = min(self.world.x_resolution, self.world.y_resolution)
+            cpoints_at_k = ptg.cpoints[k]
+            d_last = cpoints_at_k[-1].d
+            idx = np.unique(ptg.get_cpoints_idx_at_d(np.append(np.arange(step, d_last, step), d_last), k))
+            arrays = ptg.get_cpoints_arrays(k)
+            poses = (arrays['x'][idx], arrays['y'][idx], arrays['theta'][idx], arrays['phi'][idx])
+            tractors = ptg.vehicle.tractor_vertices_at_poses(*poses)
+            trailers = ptg.vehicle.trailer_vertices_at_poses(*poses)
+            outlines = []
+            for i in range(len(idx)):
+                points = []
+                for vertices in (tractors[i], trailers[i]):
+                    for a, b in zip(vertices, np.roll(vertices, -1, axis=0)):
+                        t = np.linspace(0., 1., int(np.ceil(np.hypot(*(b - a)) / resolution)) + 1)
+                        points.append(a + t[:, None] * (b - a))
+                points = np.vstack(points)
+                points[np.any(np.abs(points) > max_dist, axis=1)] = np.nan
+                outlines.append(points)
+            # pad to the same number of points per pose
+            size = max(len(points) for points in outlines)
+            outlines = np.array([np.pad(points, ((0, size - len(points)), (0, 0)), constant_values=np.nan)
+                                 for points in outlines])
+            outlines = (arrays['d'][idx], outlines)
+            self._lazy_outlines[(ptg, k)] = outlines
+        return outlines
+
+    def verify_branch(self, node: Node) -> Node:
+        """
+        Fully checks the edges not yet verified from the root to the given node
+        :return: the child node of the first colliding edge, None if the branch is collision free
+        """
+        for branch_node in self.tree.get_branch(node)[1:]:
+            edge = branch_node.edge
+            if edge.verified:
+                continue
+            if self.edge_collides(edge):
+                return branch_node
+            edge.verified = True
+        return None
+
+    def repair_branch(self, node: Node, iteration: int = 0) -> int:
+        """
+        Lazy collision mode: verifies the branch ending at node and removes its first colliding edge along with
+        the subtree below it
+        :return: number of nodes removed, 0 if the branch is collision free
+        """
+        t = self.profiler.clock()
+        invalid_node = self.verify_branch(node)
+        self.profiler.add('planner', 'verify_branch', self.profiler.clock() - t)
+        if invalid_node is None:
+            return 0
+        removed_nodes = self.tree.remove_subtree(invalid_node)
+        for removed_node in removed_nodes:
+            self.event_log.node_pruned(iteration, removed_node)
+        self.profiler.count('planner', 'lazy_repairs')
+        self.profiler.count('planner', 'lazy_removed_nodes', len(removed_nodes))
+        return len(removed_nodes)
 
     def getResults(self) -> (bool, int, int, float, float, float):
         print("Getting results ")
@@ -177,38 +478,108 @@ class Planner(object):
                self.solving_time
 
     @staticmethod
-    def transform_toTP_obstacles(ptg: PTG, obstacles_ws: List[PointR2], k: int, max_dist: float) -> List[float]:
-        # obs_TP = []  # type: List[float]
-        # for k in range(len(ptg.cpoints)):
-        #     obs_TP.append(ptg.distance_ref)
-        # If you just  turned 180deg, end there
-        # if len(ptg.cpoints[k]) == 0:
-        #     obs_TP[k] = 0.  # Invalid configuration
-        #     continue
-        # phi = ptg.cpoints[k][-1].theta
-        # if abs(phi) >= np.pi * 0.95:
-        #     obs_TP[k] = ptg.cpoints[k][-1].d
+    def transform_toTP_obstacles(ptg: PTG, obstacles_ws: np.ndarray, k: int, max_dist: float) -> List[float]:
+        """
+        Free distance along trajectory k of the ptg given the obstacles (2xN, in the ptg frame) within max_dist,
+        the other trajectories are left at distance_ref
+        """
         obs_TP = [ptg.distance_ref] * len(ptg.cpoints)  # type: List[float]
-        for i in range(np.shape(obstacles_ws)[1]):
-            if abs(obstacles_ws[0][i]) > max_dist or abs(obstacles_ws[1][i]) > max_dist:
-                continue
-            obstacle = PointR2(obstacles_ws[0][i], obstacles_ws[1][i])
-            collision_cell = ptg.obstacle_grid.cell_by_pos(obstacle)
-            if collision_cell is None:
-                continue
-            # assert collision_cell is not None, 'collision cell is empty!'
-            # get min_dist for the current k
-            for kd_pair in collision_cell:
-                if kd_pair.k == k and kd_pair.d < obs_TP[kd_pair.k]:
-                    obs_TP[kd_pair.k] = kd_pair.d
-                    break
+        obs_TP[k] = ptg.obstacle_grid.free_distance(obstacles_ws, max_dist, k, ptg.distance_ref)
         return obs_TP
 
-    def solve(self):
+    def open_event_log(self, ptg_names: List[str]) -> EventLog:
+        """
+        Starts the tree growth event log if event_log_file is set. Nodes of a reused tree are logged first,
+        as inserted at iteration 0, so the log alone is enough to replay the tree.
+        """
+        file_name = self.config.get('event_log_file', '')
+        if file_name == '':
+            return NullEventLog()
+        header = {'ptgs': ptg_names,
+                  'map_file': str(self.world.map_file),
+                  'world_width': self.config['world_width'],
+                  'world_height': self.config['world_height'],
+                  'init_pose': self.config['init_pose'],
+                  'goal_pose': self.config['goal_pose'],
+                  'goal_dist_tolerance': self.config['goal_dist_tolerance'],
+                  'seed': self.config.get('seed')}
+        event_log = EventLog(helper.get_unique_file_name(file_name, '.bin'), header)
+        ptg_ids = {name: i for i, name in enumerate(ptg_names)}
+        for node in self.tree.nodes[1:]:
+            event_log.node_inserted(0, node, ptg_ids[node.edge.ptg.name], node.edge.k, node.edge.d)
+        return event_log
+
+    def solve(self, deadline: float = None, reuse_tree: bool = False) -> PlannerResult:
+        """
+        Runs the RRT until the goal is reached, max_count nodes are in the tree or the time runs out.
+        :param deadline: absolute time (time.perf_counter() clock) by which solve must return. The config
+            key time_budget (s, measured from this call) sets a deadline too, the earliest one applies.
+        :param reuse_tree: grow the tree of the previous solve() instead of starting a new one
+            (e.g. after update_world)
+        With race_workers > 1 in the config (and a new tree), solves with solve_race instead.
+        """
+        time_budget = self.config.get('time_budget')
+        if time_budget:
+            budget_deadline = time.perf_counter() + time_budget
+            deadline = budget_deadline if deadline is None else min(deadline, budget_deadline)
+        if (self.config.get('race_workers') or 0) > 1 and not reuse_tree:
+            return self.solve_race(self.config['race_workers'], deadline)
+        profile_hook = self.config.get('profile_hook', '')
+        if profile_hook:
+            return run_with_profiler_hook(profile_hook, lambda: self._solve(deadline, reuse_tree),
+                                          self.config['profile_hook_file'])
+        return self._solve(deadline, reuse_tree)
+
+    def solve_race(self, workers: int, deadline: float = None) -> PlannerResult:
+        """
+        Races workers planners in parallel processes, with seeds derived from the config seed, and keeps the
+        first solution (see prrt.race). The tree stays in the winning worker: the results, csv and solution files
+        and the solution plot are those of its path, plot_tree_file is not produced.
+        """
+        from prrt.race import race
+        start_time = time.perf_counter()
+        result = race(self, workers, self.config.get('seed'), deadline)
+        self.result = result
+        self.planner_success = result.success
+        self.total_number_of_iterations = result.iterations
+        self.total_number_of_nodes = result.nodes
+        self.best_path_length = result.path_length
+        self.best_distance_to_target = result.distance_to_target
+        self.first_solution_time = result.first_solution_time
+        if self.config.get('solution_out_file', '') != '':
+            result.solution.export(self.config['solution_out_file'])
+        # past the deadline the csv is skipped, the plots are skipped with any deadline, as in _solve
+        if not self.past_deadline(deadline) and self.config['csv_out_file'] != '':
+            result.solution.to_csv(helper.get_unique_file_name(self.config['csv_out_file'], '.csv'))
+        if deadline is None and result.success and self.config['plot_solution'] != '':
+            self.trace_solution(self.aptgs[0].vehicle, PoseR2S2.from_dict(self.config['goal_pose']),
+                                self.config['plot_solution'], solution=result.solution)
+        self.solving_time = result.solving_time = time.perf_counter() - start_time
+        return result
+
+    def _solve(self, deadline: float = None, reuse_tree: bool = False) -> PlannerResult:
+        start_time = time.perf_counter()
         self.setup()  # load aptgs and world map
+        self.profiler = PhaseProfiler() if self.config.get('profile', False) else NullProfiler()
+        profiler = self.profiler
+        clock = profiler.clock
         init_pose = PoseR2S2.from_dict(self.config['init_pose'])
         goal_pose = PoseR2S2.from_dict(self.config['goal_pose'])
-        self.tree = Tree(init_pose)
+        if not reuse_tree or self.tree is None:
+            self.tree = Tree(init_pose)
+        # setup and the cost-to-go field count against the deadline, past it the search loop is not entered
+        if self.config.get('cost_to_go', False):
+            t = clock()
+            self.world.build_cost_to_go(goal_pose, self.aptgs[0].vehicle.half_width(), deadline)
+            profiler.add('planner', 'build_cost_to_go', clock() - t)
+        if not self.past_deadline(deadline):
+            self.sampler = SamplerFactory.build_sampler(self.config, self.world, init_pose, goal_pose, self.rng)
+        ptg_ids = {}  # ptgs are numbered across all aptgs in the event log
+        for aptg in self.aptgs:
+            for ptg in aptg.ptgs:
+                ptg_ids[ptg] = len(ptg_ids)
+        self.event_log = self.open_event_log([ptg.name for ptg in ptg_ids])
+        event_log = self.event_log
         goal_dist_tolerance = self.config['goal_dist_tolerance']
         goal_ang_tolerance = self.config['goal_ang_tolerance']
         debug_tree_state = self.config['debug_tree_state']
@@ -217,36 +588,88 @@ class Planner(object):
         obs_R = self.config['obs_R']
         D_max = self.config['D_max']
         solution_found = False
+        timed_out = False
         max_count = self.config['max_count']
+        refine_iterations = self.config.get('refine_iterations') or 0
+        refine_until = 0  # iteration up to which a shorter solution is searched once one is found
         counter = 0
-        min_goal_dist_yet = float('inf')
-        start_time = time.time()
-        while not solution_found and len(self.tree.nodes) < max_count:
+        self.best_node = min(self.tree.nodes, key=lambda node: node.pose.distance_2d(goal_pose))
+        min_goal_dist_yet = self.best_node.pose.distance_2d(goal_pose)
+        # a reused tree may still hold a valid solution
+        best_goal_ang = abs(helper.angle_distance(self.best_node.pose.theta, goal_pose.theta))
+        solution_found = len(self.tree.nodes) > 1 and min_goal_dist_yet < goal_dist_tolerance and \
+                         best_goal_ang < goal_ang_tolerance
+        self.first_solution_time = float('inf')
+        lazy_collision = self.config.get('lazy_collision', False)
+        if solution_found and self.repair_branch(self.best_node) > 0:
+            # reused lazy tree, its goal branch collides: grow the repaired tree
+            solution_found = False
+            self.best_node = min(self.tree.nodes, key=lambda node: node.pose.distance_2d(goal_pose))
+            min_goal_dist_yet = self.best_node.pose.distance_2d(goal_pose)
+        prune_interval = self.config.get('prune_interval') or 0
+        self.pruner = TreePruner(self.world, self.config) if prune_interval > 0 or \
+            (self.config.get('node_budget') or 0) > 0 else None
+        pruned_count = 0  # pruned nodes count toward max_count, as if still in the tree
+        if solution_found:
+            self.first_solution_time = time.perf_counter() - start_time
+        solution_cost = self.tree.get_path_length(self.best_node) if solution_found else float('inf')
+        while (not solution_found or counter < refine_until) and len(self.tree.nodes) + pruned_count < max_count:
+            if self.past_deadline(deadline):
+                timed_out = True
+                break
             counter += 1
-            rand_pose = self.world.get_random_pose(goal_pose, bias)
+            prune_dominated = prune_interval > 0 and counter % prune_interval == 0
+            if self.pruner is not None and (prune_dominated or 0 < self.pruner.node_budget < len(self.tree.nodes)):
+                t = clock()
+                removed_nodes = self.pruner.prune(self.tree, goal_pose, {self.best_node}, prune_dominated)
+                pruned_count += len(removed_nodes)
+                for node in removed_nodes:
+                    event_log.node_pruned(counter, node)
+                profiler.add('planner', 'prune', clock() - t)
+            t = clock()
+            rand_pose = self.sampler.get_random_pose(goal_pose, bias)
+            profiler.add('planner', 'sampling', clock() - t)
+            event_log.sample(counter, rand_pose)
             candidate_new_nodes = sorteddict.SortedDict()
             rand_node = Node(ptg=None, pose=rand_pose)
             for aptg in self.aptgs:
+                t = clock()
                 ptg, ptg_nearest_node, ptg_d_min = self.tree.get_aptg_nearest_node(rand_node, aptg)
+                profiler.add(aptg.name, 'get_aptg_nearest_node', clock() - t)
                 if ptg_nearest_node is None:
                     print('APTG {0} can\'t find nearest pose to {1}'.format(aptg.name, rand_node))
                     continue
                 ptg_nearest_pose = ptg_nearest_node.pose
                 rand_pose_rel = rand_pose - ptg_nearest_pose
                 d_max = min(D_max, ptg.distance_ref)
+                t = clock()
                 is_exact, k_rand, d_rand = ptg.inverse_WS2TP(rand_pose_rel)
+                t1 = clock()
+                profiler.add(aptg.name, 'inverse_WS2TP', t1 - t)
                 d_rand *= ptg.distance_ref
-                max_dist_for_obstacles = obs_R * ptg.distance_ref
-                obstacles_rel = self.world.transform_point_cloud(ptg_nearest_pose, max_dist_for_obstacles)
-                obstacles_TP = self.transform_toTP_obstacles(ptg, obstacles_rel, k_rand, max_dist_for_obstacles)
-                d_free = obstacles_TP[k_rand]
                 d_new = min(d_max, d_rand)
+                if lazy_collision:
+                    d_free = 0. if self.lazy_collides(ptg, ptg_nearest_pose, k_rand, d_new) else d_new
+                    profiler.add(aptg.name, 'lazy_collides', clock() - t1)
+                else:
+                    max_dist_for_obstacles = obs_R * ptg.distance_ref
+                    obstacles_rel = self.world.transform_point_cloud(ptg_nearest_pose, max_dist_for_obstacles)
+                    t2 = clock()
+                    profiler.add(aptg.name, 'transform_point_cloud', t2 - t1)
+                    obstacles_TP = self.transform_toTP_obstacles(ptg, obstacles_rel, k_rand,
+                                                                 max_dist_for_obstacles)
+                    profiler.add(aptg.name, 'transform_toTP_obstacles', clock() - t2)
+                    d_free = obstacles_TP[k_rand]
                 if debug_tree_state > 0 and counter % debug_tree_state == 0:
+                    t = clock()
                     self.tree.plot_nodes(self.world, ptg_nearest_pose,
-                                         '{0}{1:04d}.png'.format(debug_tree_state_file, counter) )
+                                         file_name='{0}{1:04d}.png'.format(debug_tree_state_file, counter))
+                    profiler.add('planner', 'debug_tree_state', clock() - t)
                 # Skip if the current ptg and alpha (k_ran) can't reach this point
                 if ptg.cpoints[k_rand][-1].d < d_new:
                     #print('Node leads to invalid trajectory. Node Skipped!')
+                    profiler.count(aptg.name, 'rejected_unreachable')
+                    event_log.rejected_unreachable(counter, ptg_nearest_node.id, ptg_ids[ptg], k_rand, d_new)
                     continue
 
                 if d_free >= d_new:
@@ -261,169 +684,216 @@ class Planner(object):
                     new_nearest_node = None  # type: Node
                     if not is_acceptable_goal:
                         new_node = Node(ptg, new_pose)
+                        t = clock()
                         new_nearest_ptg, new_nearest_node, new_nearest_dist = self.tree.get_aptg_nearest_node(new_node,
                                                                                                               aptg)
+                        profiler.add(aptg.name, 'duplicate_check', clock() - t)
                         if new_nearest_node is not None:
                             new_nearest_ang = abs(helper.angle_distance(new_pose.theta, new_nearest_node.pose.theta))
                             accept_this_node = new_nearest_dist >= 0.1 or new_nearest_ang >= 0.35
                             # ToDo: make 0.1 and 0.35 configurable parameters
                     if not accept_this_node:
+                        profiler.count(aptg.name, 'rejected_duplicate')
+                        event_log.rejected_duplicate(counter, ptg_nearest_node.id, ptg_ids[ptg], k_rand, d_new,
+                                                     new_pose)
                         continue
                     new_edge = Edge(ptg, k_rand, d_new, ptg_nearest_node, new_pose)
-                    candidate_new_nodes.update({d_new: new_edge})
+                    new_edge.verified = not lazy_collision
+                    # prefer the longest extension, on ties prefer the one further down the cost-to-go field
+                    cost_to_go = 0. if self.world.cost_to_go is None else self.world.cost_to_go_at(new_pose.x,
+                                                                                                   new_pose.y)
+                    candidate_new_nodes.update({(d_new, -cost_to_go): new_edge})
+                    profiler.count(aptg.name, 'candidates')
                     #print('Candidate node found')
                 else:  # path is not free
                     #print('Obstacle ahead!')
-                    # do nothing for now
-                    pass
+                    profiler.count(aptg.name, 'rejected_collision')
+                    event_log.collision(counter, ptg_nearest_node.id, ptg_ids[ptg], k_rand, d_free, rand_pose)
             if len(candidate_new_nodes) > 0:
                 best_edge = candidate_new_nodes.peekitem(-1)[1]  # type : Edge
                 new_state_node = Node(best_edge.ptg, best_edge.end_pose, best_edge.parent)
                 self.tree.insert_node_and_edge(best_edge.parent, new_state_node, best_edge)
+                self.sampler.update_frontier(new_state_node.pose)
+                profiler.count('planner', 'nodes_inserted')
+                event_log.node_inserted(counter, new_state_node, ptg_ids[best_edge.ptg], best_edge.k, best_edge.d)
                 #print('new node added to tree from ptg {0}'.format(best_edge.ptg.name))
                 goal_dist = best_edge.end_pose.distance_2d(goal_pose)
+                t = clock()
                 print("New note : ", new_state_node.pose)
                 print("Goal distance of the current node : ", goal_dist)
+                profiler.add('planner', 'print', clock() - t)
                 goal_ang = abs(helper.angle_distance(best_edge.end_pose.theta, goal_pose.theta))
                 is_acceptable_goal = goal_dist < goal_dist_tolerance and goal_ang < goal_ang_tolerance
-                min_goal_dist_yet = min(goal_dist, min_goal_dist_yet)
+                if not solution_found and goal_dist < min_goal_dist_yet:
+                    min_goal_dist_yet = goal_dist
+                    self.best_node = new_state_node
+                t = clock()
                 print("Best Goal distance : ", min_goal_dist_yet)
+                profiler.add('planner', 'print', clock() - t)
+                if is_acceptable_goal and lazy_collision:
+                    # drop the colliding edge and its subtree, and keep growing the repaired tree
+                    removed_count = self.repair_branch(new_state_node, counter)
+                    if removed_count > 0:
+                        print('Goal branch collides, {0} nodes removed'.format(removed_count))
+                        if solution_found:
+                            continue  # the solution branch is verified, the colliding edge is not on it
+                        self.best_node = min(self.tree.nodes, key=lambda node: node.pose.distance_2d(goal_pose))
+                        min_goal_dist_yet = self.best_node.pose.distance_2d(goal_pose)
+                        continue
                 if is_acceptable_goal:
-                    print('goal reached!')
-                    break
-                    # To do: continue running to refine solution
+                    path_length = self.tree.get_path_length(new_state_node)
+                    if not solution_found:
+                        print('goal reached!')
+                        self.first_solution_time = time.perf_counter() - start_time
+                        refine_until = counter + refine_iterations
+                    if path_length < solution_cost:
+                        if solution_found:
+                            print('shorter solution found, path length {0:.2f}'.format(path_length))
+                        event_log.goal_reached(counter, new_state_node.id)
+                        solution_found = True
+                        solution_cost = path_length
+                        self.best_node = new_state_node
+                        min_goal_dist_yet = goal_dist
+                        self.sampler.update_solution_cost(path_length)
+                    if counter >= refine_until:
+                        break
+                    continue
+                t = clock()
                 print("Counter = ",counter, "   Number of nodes :", len(self.tree.nodes))
-        self.solving_time = time.time() - start_time
-        print('Done in {0:.2f} seconds'.format(time.time() - start_time))
-        #self.solving_time = time.time() - start_time
+                profiler.add('planner', 'print', clock() - t)
+        if not solution_found and lazy_collision:
+            # the branch closest to the goal is returned, cut it before its first colliding edge
+            while self.repair_branch(self.best_node, counter) > 0:
+                self.best_node = min(self.tree.nodes, key=lambda node: node.pose.distance_2d(goal_pose))
+            min_goal_dist_yet = self.best_node.pose.distance_2d(goal_pose)
+        event_log.close()
+        self.solution_node = self.best_node
+        profiler.count('planner', 'iterations', counter)
+        if self.pruner is not None:
+            profiler.count('planner', 'pruned_dominated', self.pruner.report.dominated)
+            profiler.count('planner', 'pruned_over_budget', self.pruner.report.over_budget)
+            print(self.pruner.report)
+        print('Done in {0:.2f} seconds'.format(time.perf_counter() - start_time))
         print('Minimum distance to goal reached is {0}'.format(min_goal_dist_yet))
-        if not is_acceptable_goal:
-            print('Solution not found within iteration limit')
+        # past the deadline only the result is built. The plots take seconds, they are skipped with any deadline
+        dump_results = not self.past_deadline(deadline)
+        plot_results = deadline is None
+        if not dump_results:
+            print('Past the deadline, the csv and plots are skipped')
+        if not solution_found:
+            if timed_out:
+                print('Solution not found within time limit, returning the branch closest to goal')
+                status = PlannerResult.TIMEOUT
+            else:
+                print('Solution not found within iteration limit')
+                status = PlannerResult.MAX_COUNT
             self.planner_success = False
             self.total_number_of_iterations = counter
             self.total_number_of_nodes = len(self.tree.nodes)
-            self.best_path_length = 0.0 #Todo : add calculation!
+            self.best_path_length = self.tree.get_path_length(self.best_node)
             self.best_distance_to_target = min_goal_dist_yet
 
             # dump results
-            if self.config['csv_out_file'] != '':
-                self.solution_to_csv(self.config['csv_out_file'])
-            if self.config['plot_tree_file'] != '':
+            if dump_results and self.config['csv_out_file'] != '':
+                self.solution_to_csv(self.config['csv_out_file'], self.best_node)
+            if plot_results and self.config['plot_tree_file'] != '':
                 self.tree.plot_nodes(self.world, goal_pose, self.config['goal_dist_tolerance'], self.config['plot_tree_file'])
             #if self.config['plot_solution'] != '':
             #   self.trace_solution(self.aptgs[0].vehicle, goal_pose, self.config['plot_solution'])
-            return
+            return self._build_result(status, start_time)
+        shortcut_report = None
+        if self.config.get('shortcut', False):
+            t = clock()
+            shortcutter = PathShortcutter(self.aptgs, self.world, self.config)
+            self.solution_node, shortcut_report = shortcutter.shortcut(self.best_node, goal_pose, deadline)
+            profiler.add('planner', 'shortcut', clock() - t)
+            print(shortcut_report)
+            min_goal_dist_yet = self.solution_node.pose.distance_2d(goal_pose)
         # set parameters to get results
         self.planner_success = True
         self.total_number_of_iterations = counter
         self.total_number_of_nodes = len(self.tree.nodes)
-        self.best_path_length = 0.0  # Todo : add calculation!
+        self.best_path_length = self.tree.get_path_length(self.solution_node)
         self.best_distance_to_target = min_goal_dist_yet
-        # dump results
-        if self.config['csv_out_file'] != '':
-            self.solution_to_csv(self.config['csv_out_file'])
-        if self.config['plot_tree_file'] != '':
+        # dump results, the shortcut may have run past the deadline
+        dump_results = dump_results and not self.past_deadline(deadline)
+        if dump_results and self.config['csv_out_file'] != '':
+            self.solution_to_csv(self.config['csv_out_file'], self.solution_node)
+        if plot_results and self.config['plot_tree_file'] != '':
             self.tree.plot_nodes(self.world, goal_pose, self.config['goal_dist_tolerance'], self.config['plot_tree_file'])
-        if self.config['plot_solution'] != '':
-            self.trace_solution(self.aptgs[0].vehicle, goal_pose, self.config['plot_solution'])
-
-    def trace_solution(self, vehicle: ArticulatedVehicle, goal: PoseR2S2 = None, file_name='frame'):
-        child_node = self.tree.nodes[-1]
-        trajectory = []  # type #: List[Edge]
-        while True:
-            parent_node = child_node.parent
-            if parent_node is None:
-                break
-            trajectory.append(self.get_trajectory_edge(parent_node, child_node))
-            child_node = parent_node
-        fig, ax = plt.subplots()
-        plt.autoscale(tight=True)
-
-        frame = 0
-        #ax.matshow(self.world.omap, cmap=plt.cm.gray_r, origin='lower')
-        # instead of showing image first and then the
-        map = np.fliplr(self.world.map_32bit)
-        #map = self.world.map_32bit
-        ax.imshow(map, #cmap=plt.cm.gray_r,# origin='upper', interpolation='none',
-                  extent=(self.world.width, 0.0, self.world.height, 0.0), zorder=-1)
-        plt.xlabel('x(m)', fontsize=20)
-        plt.ylabel('y(m)', fontsize=20)
-        plt.ylim(0, self.world.height)
-        plt.xlim(0, self.world.width)
-        circle = plt.Circle((goal.x, goal.y), self.config['goal_dist_tolerance'], color='red', fill=False)
-        ax.add_artist(circle)
-
-        for i in range(len(trajectory) - 1, -1, -1):
-            # plot the vehicle
-            edge = trajectory[i]
-            start_pose = edge.parent.pose.copy()
-            color = 'b'
-            for d in np.arange(0., edge.d, 0.2):
-                c_point = edge.ptg.get_cpoint_at_d(d, edge.k)
-                current_pose = start_pose + c_point.pose
-                vehicle.phi = c_point.phi
-                #ATTENTION: this may not work, I have commented the function
-                #vehicle.plot(ax, current_pose, self.world, color)
-                vehicle.plot(ax, current_pose, color)
-
-                title = r'$x={0:.1f},y={1:.1f},\theta={2:+.1f}^\circ,\phi={3:+.1f}^\circ, v={4:+.1f}, \omega={5:+.1f}, \alpha={6:+.1f}^\circ$'.format(
-                    current_pose.x,
-                    current_pose.y,
-                    deg(current_pose.theta),
-                    deg(current_pose.phi),
-                    c_point.v,
-                    c_point.w,
-                    deg(c_point.alpha))
-                #fig.suptitle(title, x=0.5, y=1.0)
-                if goal is not None:
-                    #ax.plot(self.world.x_to_ix(goal.x), self.world.y_to_iy(goal.y), '+r')
-                    ax.plot(goal.x, goal.y, '+r')
-
-                print('Saving frame {0}'.format(frame))
-                plt.savefig('{0}{1:04d}.png'.format(file_name, frame), dpi=200) #, bbox_inches='tight', pad_inches=0.2)
-                # clear the figure for next drawing
-                ax.lines = []
-                frame += 1
-
-    def solution_to_csv(self, file_name='solution.csv'):
-        import csv
-        import os.path
-        child_node = self.tree.nodes[-1]
-        trajectory = []  # type #: List[Edge]
-        solution_length = 0.0
-        file_name_root = file_name
+        if plot_results and self.config['plot_solution'] != '':
+            self.trace_solution(self.aptgs[0].vehicle, goal_pose, self.config['plot_solution'], self.solution_node)
+        result = self._build_result(PlannerResult.SOLVED, start_time)
+        result.shortcut = shortcut_report
+        return result
 
-        # save the solution in a different file if the file already exist and numerate them
-        # TODO: really dirty way of doing it as it will check for all the files, fix this!
-        cnt = 0
-        while os.path.exists(file_name):
-            cnt = cnt + 1
-            file_name = ('{0}{1:04d}.csv'.format(file_name_root, cnt))
-
-        while True:
-            parent_node = child_node.parent
-            if parent_node is None:
-                break
-            trajectory.append(self.get_trajectory_edge(parent_node, child_node))
-            solution_length = solution_length + parent_node.pose.distance_2d(child_node.pose)
-            child_node = parent_node
-        self.best_path_length = solution_length
-        with open(file_name, 'w', newline='') as csvfile:
-            csv_writer = csv.writer(csvfile, delimiter=',')
-            for i in range(len(trajectory) - 1, -1, -1):
-                edge = trajectory[i]
-                start_pose = edge.parent.pose.copy()
-                for d in np.arange(0., edge.d, 0.2):
-                    c_point = edge.ptg.get_cpoint_at_d(d, edge.k)
-                    current_pose = start_pose + c_point.pose
-                    row = [current_pose.x, current_pose.y, current_pose.theta, current_pose.phi, c_point.v,
-                           c_point.w]
-                    csv_writer.writerow([edge.ptg.name, edge.parent.id] + ['{0:+.4f}'.format(x) for x in row])
+    @staticmethod
+    def past_deadline(deadline: float = None) -> bool:
+        return deadline is not None and time.perf_counter() >= deadline
+
+    def _build_result(self, status: str, start_time: float) -> PlannerResult:
+        """
+        :param start_time: time.perf_counter() at the start of the solve, solving_time runs up to here
+        """
+        result = PlannerResult()
+        result.status = status
+        result.branch = [node.pose for node in self.tree.get_branch(self.solution_node)]
+        result.solution = self.get_solution(self.solution_node)
+        if self.config.get('solution_out_file', '') != '':
+            result.solution.export(self.config['solution_out_file'])
+        result.success = self.planner_success
+        result.iterations = self.total_number_of_iterations
+        result.nodes = self.total_number_of_nodes
+        result.path_length = self.best_path_length
+        result.distance_to_target = self.best_distance_to_target
+        self.solving_time = time.perf_counter() - start_time
+        result.solving_time = self.solving_time
+        result.first_solution_time = self.first_solution_time
+        result.seed = self.config.get('seed')
+        result.pruning = None if self.pruner is None else self.pruner.report
+        if self.profiler.enabled:
+            result.profile = self.profiler.report()
+            if self.config.get('profile_file', '') != '':
+                self.profiler.dump(self.config['profile_file'])
+                print('Profile saved to {0}'.format(self.config['profile_file']))
+        self.result = result
+        return result
+
+    def trace_solution(self, vehicle: ArticulatedVehicle, goal: PoseR2S2 = None, file_name='frame',
+                       end_node: Node = None, solution: Solution = None):
+        """
+        Plots the vehicle along the solution, one frame per solution sample. Frames are saved as
+        {file_name}0000.png, {file_name}0001.png, ... or, if plot_solution_format is 'mp4', encoded
+        to {file_name}.mp4 by ffmpeg
+        :param solution: the solution to plot, defaults to the solution ending at end_node
+        """
+        import prrt.visualization as visualization  # matplotlib is only loaded when plotting
+        solution = self.get_solution(end_node) if solution is None else solution
+        segments = visualization.vehicle_segments(vehicle, solution.x, solution.y, solution.theta, solution.phi)
+        goal_dist_tolerance = self.config['goal_dist_tolerance']
+        if self.config.get('plot_solution_format', 'png') == 'mp4':
+            frames = visualization.render_video(self.world, segments, goal, goal_dist_tolerance,
+                                                file_name + '.mp4', self.config.get('plot_solution_fps', 25))
+        else:
+            frames = visualization.render_png_frames(self.world, segments, goal, goal_dist_tolerance, file_name,
+                                                     self.config.get('plot_workers', 0))
+        print('Saved {0} solution frames'.format(frames))
 
+    def get_solution(self, end_node: Node = None) -> Solution:
+        end_node = self.tree.nodes[-1] if end_node is None else end_node
+        return Solution.from_node(end_node, self.config.get('solution_step', 0.2))
+
+    def solution_to_csv(self, file_name='solution.csv', end_node: Node = None):
+        solution = self.get_solution(end_node)
+        # save the solution in a different file if the file already exist and numerate them
+        file_name = helper.get_unique_file_name(file_name, '.csv')
+        solution.to_csv(file_name)
         print('Dumping solution to csv file done')
 
     @staticmethod
     def get_trajectory_edge(parent: Node, child: Node) -> Edge:
+        if child.edge is not None:
+            return child.edge
         for edge in parent.edges_to_child:
             if edge.end_pose == child.pose:
                 return edge
@@ -434,10 +904,15 @@ class Planner(object):
         del self.init_pose   # type: PoseR2S2
         del self.goal_pose   # type: PoseR2S2
         del self.tree   # type: Tree
+        del self.sampler  # type: Sampler
         del self.config
         del self.planner_success
         del self.total_number_of_iterations
         del self.total_number_of_nodes
         del self.best_path_length
         del self.best_distance_to_target
-        del self.solving_time
\ No newline at end of file
+        del self.solving_time
+        del self.rng
+        del self.profiler
+        del self.result
+        del self.best_node
\ No newline at end of file
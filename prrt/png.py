@@ -0,0 +1,233 @@
+import itertools
+import struct
+import zlib
+import numpy as np
+
+# Minimal PNG reader (zlib + numpy only) used to load the world maps without importing matplotlib.
+# Supports non interlaced grayscale, RGB, palette and alpha images of any bit depth.
+
+SIGNATURE = b'\x89PNG\r\n\x1a\n'
+CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}  # channels per color type
+
+
+def read_png(file_name: str) -> np.ndarray:
+    """
+    Same output as matplotlib.image.imread for png files
+    :return: float32 array with values in [0, 1], (height, width) for grayscale images, (height, width, channels)
+     otherwise. Palette and gray with alpha images are expanded to RGBA
+    """
+    chunks = list(iter_png_rows(file_name, 0))
+    return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+
+def png_size(file_name: str) -> (int, int):
+    """
+    :return: width and height of the image, only the header is read
+    """
+    with open(file_name, 'rb') as f:
+        if f.read(len(SIGNATURE)) != SIGNATURE:
+            raise ValueError('{0} is not a png file'.format(file_name))
+        chunk_type, body = next(_iter_chunks(f))
+    if chunk_type != b'IHDR':
+        raise ValueError('{0}: missing png header'.format(file_name))
+    width, height = struct.unpack('>II', body[:8])
+    return width, height
+
+
+def iter_png_rows(file_name: str, rows_per_chunk=256):
+    """
+    Decodes the image by chunks of rows_per_chunk rows (0 for all the rows at once), so that large images can be
+    processed without holding the whole of them in memory
+    :return: generator of arrays of consecutive rows, same format as read_png
+    """
+    with open(file_name, 'rb') as f:
+        if f.read(len(SIGNATURE)) != SIGNATURE:
+            raise ValueError('{0} is not a png file'.format(file_name))
+        chunks = _iter_chunks(f)
+        header = None
+        palette = None
+        transparency = None
+        first_idat = b''
+        for chunk_type, body in chunks:
+            if chunk_type == b'IHDR':
+                header = struct.unpack('>IIBBBBB', body)
+            elif chunk_type == b'PLTE':
+                palette = np.frombuffer(body, dtype=np.uint8).reshape(-1, 3)
+            elif chunk_type == b'tRNS':
+                transparency = np.frombuffer(body, dtype=np.uint8)
+            elif chunk_type == b'IDAT':
+                first_idat = body
+                break
+        width, height, bit_depth, color_type, _, _, interlace = header
+        channels = CHANNELS.get(color_type)
+        if interlace != 0 or channels is None or bit_depth not in (1, 2, 4, 8, 16) or \
+                (bit_depth < 8 and channels > 1) or (bit_depth == 16 and color_type == 3):
+            raise ValueError('{0}: unsupported png format (bit depth {1}, color type {2}, interlace {3})'.format(
+                file_name, bit_depth, color_type, interlace))
+        bpp = max(1, channels * bit_depth // 8)  # bytes per pixel, as used by the filters
+        row_size = (width * channels * bit_depth + 7) // 8
+        rows_per_chunk = height if rows_per_chunk <= 0 else rows_per_chunk
+        decompressor = zlib.decompressobj()
+        pending = bytearray()
+        previous = np.zeros(row_size, dtype=np.uint8)
+        row = 0
+        for chunk_type, body in itertools.chain([(b'IDAT', first_idat)], chunks):
+            if chunk_type == b'IEND':
+                break
+            if chunk_type != b'IDAT':
+                continue
+            data = body
+            while row < height:
+                # maps compress very well, only the data of the next rows is decompressed at once
+                size = min(rows_per_chunk, height - row) * (row_size + 1)
+                if len(pending) < size:
+                    pending += decompressor.decompress(data, size - len(pending))
+                    data = decompressor.unconsumed_tail
+                if len(pending) < size:
+                    break  # needs the next IDAT chunk
+                rows = unfilter(bytes(pending[:size]), size // (row_size + 1), row_size, bpp, previous)
+                del pending[:size]
+                previous = rows[-1]
+                row += len(rows)
+                yield _to_image(rows, width, bit_depth, color_type, palette, transparency)
+        if row < height:
+            raise ValueError('{0}: truncated png data'.format(file_name))
+
+
+def _iter_chunks(f):
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            return
+        length, chunk_type = struct.unpack('>I4s', chunk_header)
+        body = f.read(length)
+        f.read(4)  # crc
+        yield chunk_type, body
+
+
+def _to_image(rows: np.ndarray, width: int, bit_depth: int, color_type: int, palette: np.ndarray,
+              transparency: np.ndarray) -> np.ndarray:
+    height = len(rows)
+    channels = CHANNELS[color_type]
+    if bit_depth == 16:
+        samples = rows.view('>u2').reshape(height, width, channels)
+    elif bit_depth == 8:
+        samples = rows.reshape(height, width, channels)
+    else:
+        # several pixels per byte, most significant bits first
+        bits = np.unpackbits(rows, axis=1)[:, :width * bit_depth].reshape(height, width, bit_depth)
+        samples = np.dot(bits, 1 << np.arange(bit_depth - 1, -1, -1)).astype(np.uint8)[..., None]
+    if color_type == 3:
+        indices = samples[..., 0]
+        alpha = np.full(len(palette), 255, dtype=np.uint8)
+        if transparency is not None:
+            alpha[:len(transparency)] = transparency
+        return np.column_stack((palette, alpha))[indices].astype(np.float32) / 255.
+    image = samples.astype(np.float32) / float((1 << bit_depth) - 1)
+    if color_type == 0:
+        return image[..., 0]
+    if color_type == 4:
+        # gray and alpha is expanded to RGBA
+        return np.dstack((image[..., 0], image[..., 0], image[..., 0], image[..., 1]))
+    return image
+
+
+def unfilter(raw: bytes, height: int, row_size: int, bpp: int, previous: np.ndarray = None) -> np.ndarray:
+    """
+    Reverts the per row png filters
+    :param previous: unfiltered row preceding the first one, if any
+    :return: (height, row_size) uint8 array
+    """
+    scanlines = np.frombuffer(raw, dtype=np.uint8)[:height * (row_size + 1)].reshape(height, row_size + 1)
+    filters = scanlines[:, 0]
+    rows = scanlines[:, 1:].copy()
+    previous = np.zeros(row_size, dtype=np.uint8) if previous is None else previous
+    for i in range(height):
+        row = rows[i]
+        filter_type = filters[i]
+        if filter_type == 1:  # Sub: running sum of the pixels bytes along the row
+            row[:] = np.cumsum(row.reshape(-1, bpp), axis=0, dtype=np.uint8).ravel()
+        elif filter_type == 2:  # Up
+            row += previous
+        elif filter_type == 3:  # Average, depends on the left byte: done byte by byte
+            row[:] = _unfilter_average(row, previous, bpp)
+        elif filter_type == 4:  # Paeth, same but flat runs are vectorized
+            row[:] = _unfilter_paeth(row, previous, bpp)
+        elif filter_type != 0:
+            raise ValueError('Invalid png filter type {0}'.format(filter_type))
+        previous = row
+    return rows
+
+
+def _unfilter_average(row: np.ndarray, previous: np.ndarray, bpp: int) -> np.ndarray:
+    out = np.empty_like(row)
+    for lane in range(bpp):  # the bytes of a pixel only depend on the same byte of the left pixel
+        x = bytearray(row[lane::bpp].tobytes())
+        up = previous[lane::bpp].tobytes()
+        a = 0
+        for j in range(len(x)):
+            a = (x[j] + ((a + up[j]) >> 1)) & 0xFF
+            x[j] = a
+        out[lane::bpp] = np.frombuffer(bytes(x), dtype=np.uint8)
+    return out
+
+
+def _unfilter_paeth(row: np.ndarray, previous: np.ndarray, bpp: int) -> np.ndarray:
+    out = np.empty_like(row)
+    for lane in range(bpp):
+        out[lane::bpp] = _unfilter_paeth_lane(row[lane::bpp], previous[lane::bpp])
+    return out
+
+
+def _unfilter_paeth_lane(x: np.ndarray, up: np.ndarray) -> np.ndarray:
+    # where the previous row is flat (up == up left) Paeth predicts the left byte, so the runs between the other
+    # bytes are running sums. Maps are mostly flat, noisy rows are done byte by byte.
+    n = len(x)
+    steps = np.flatnonzero(np.concatenate(([True], up[1:] != up[:-1])))
+    if len(steps) > n // 8:
+        return _paeth_sequential(x, up)
+    out = x.copy()
+    up_list = up.tolist()
+    for i, j in enumerate(steps):
+        a = int(out[j - 1]) if j > 0 else 0
+        out[j] = (int(x[j]) + _paeth(a, up_list[j], up_list[j - 1] if j > 0 else 0)) & 0xFF
+        end = steps[i + 1] if i + 1 < len(steps) else n
+        if end > j + 1:
+            out[j + 1:end] = np.cumsum(x[j + 1:end], dtype=np.uint8) + out[j]
+    return out
+
+
+def _paeth(a: int, b: int, c: int) -> int:
+    p = a + b - c
+    pa = abs(p - a)
+    pb = abs(p - b)
+    pc = abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    if pb <= pc:
+        return b
+    return c
+
+
+def _paeth_sequential(x: np.ndarray, up: np.ndarray) -> np.ndarray:
+    out = bytearray(x.tobytes())
+    up = up.tobytes()
+    a = c = 0
+    for j in range(len(out)):
+        b = up[j]
+        # same as _paeth, inlined
+        pa = b - c
+        pb = a - c
+        pc = pa + pb
+        pa = -pa if pa < 0 else pa
+        pb = -pb if pb < 0 else pb
+        pc = -pc if pc < 0 else pc
+        if pa <= pb and pa <= pc:
+            a = (out[j] + a) & 0xFF
+        elif pb <= pc:
+            a = (out[j] + b) & 0xFF
+        else:
+            a = (out[j] + c) & 0xFF
+        out[j] = a
+        c = b
+    return np.frombuffer(bytes(out), dtype=np.uint8)
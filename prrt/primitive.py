@@ -1,12 +1,32 @@
 import prrt.helper as helper
 from typing import List, Tuple
 from math import sin, cos, sqrt, degrees as deg, radians as rad
+import numpy as np
 
+# Points closer than this to a polygon edge (m) are on its boundary, and count as inside
+POLYGON_BOUNDARY_EPS = 1e-9
 
-class PointR2(object):
+
+class SlotsPickleMixin(object):
+    """
+    Pickle support for classes with __slots__: the state is a dict of the slots, the same as the instance
+    __dict__ pickled before the slots were added, so APTGs dumped by either version load alike
+    """
+    __slots__ = ()
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state: dict):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class PointR2(SlotsPickleMixin):
     """
     define a 2d point (x,y) in R2 euclidean space
     """
+    __slots__ = ('x', 'y')
 
     def __init__(self, x=0., y=0.):
         self.x = x
@@ -16,11 +36,12 @@ class PointR2(object):
         return '({0:+.2f},{1:+.2f})'.format(self.x, self.y)
 
 
-class PoseR2S2(object):
+class PoseR2S2(SlotsPickleMixin):
     """
     define a pose (x,y,theta, last_phi) in R2 S2 space
     last_phi is the articulation angle of the truck-trailer vehicle
     """
+    __slots__ = ('x', 'y', 'theta', 'phi')
 
     def __init__(self, x=0., y=0., theta=0.0, phi=0.0):
         self.x = x
@@ -85,10 +106,11 @@ class PoseR2S2(object):
         return PoseR2S2(d['x'], d['y'], rad(d['theta']), rad(d['phi']))
 
 
-class CPoint(object):
+class CPoint(SlotsPickleMixin):
     """
     Holds data about a trajectory point in configuration space
     """
+    __slots__ = ('pose', 'd', 'v', 'w', 'alpha', 'n')
 
     def __init__(self, pose: PoseR2S2 = None, d: float = 0., v: float = 0., w: float = 0, alpha: float = 0., n=0):
         self.pose = pose
@@ -135,6 +157,109 @@ class CPoint(object):
         self.pose.phi = phi
 
 
+class PoseArray(object):
+    """
+    N poses (x, y, theta, phi) held in a single (N, 4) array, the vectorized counterpart of PoseR2S2.
+    Operators follow PoseR2S2: a + b composes b (relative to a) onto a, a - b is a relative to b. Operands of
+    different lengths broadcast when one of them holds a single pose, a PoseR2S2 on the right counts as a single
+    pose (on the left, wrap it with PoseArray.from_poses([pose])).
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data: np.ndarray = None):
+        self.data = np.zeros((0, 4)) if data is None else np.asarray(data, dtype=float).reshape(-1, 4)
+
+    @staticmethod
+    def from_columns(x: np.ndarray, y: np.ndarray, theta: np.ndarray, phi: np.ndarray = 0.) -> 'PoseArray':
+        return PoseArray(np.stack(np.broadcast_arrays(x, y, theta, phi), axis=-1))
+
+    @staticmethod
+    def from_poses(poses: List[PoseR2S2]) -> 'PoseArray':
+        return PoseArray([(pose.x, pose.y, pose.theta, pose.phi) for pose in poses])
+
+    def to_poses(self) -> List[PoseR2S2]:
+        return [PoseR2S2(*row) for row in self.data.tolist()]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            return PoseR2S2(*self.data[item].tolist())
+        return PoseArray(self.data[item])
+
+    def __str__(self):
+        return '[' + ', '.join(str(pose) for pose in self.to_poses()) + ']'
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.data[:, 0]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.data[:, 1]
+
+    @property
+    def theta(self) -> np.ndarray:
+        return self.data[:, 2]
+
+    @property
+    def phi(self) -> np.ndarray:
+        return self.data[:, 3]
+
+    @staticmethod
+    def _as_pose_array(other) -> 'PoseArray':
+        return PoseArray.from_poses([other]) if isinstance(other, PoseR2S2) else other
+
+    def compose(self, other) -> 'PoseArray':
+        other = self._as_pose_array(other)
+        cos_theta = np.cos(self.theta)
+        sin_theta = np.sin(self.theta)
+        return PoseArray.from_columns(self.x + other.x * cos_theta - other.y * sin_theta,
+                                      self.y + other.x * sin_theta + other.y * cos_theta,
+                                      helper.wrap_to_npi_pi(self.theta + other.theta), other.phi)
+
+    def inverse_compose(self, other) -> 'PoseArray':
+        other = self._as_pose_array(other)
+        cos_theta = np.cos(other.theta)
+        sin_theta = np.sin(other.theta)
+        dx = self.x - other.x
+        dy = self.y - other.y
+        return PoseArray.from_columns(dx * cos_theta + dy * sin_theta, -dx * sin_theta + dy * cos_theta,
+                                      helper.wrap_to_npi_pi(self.theta - other.theta), self.phi)
+
+    def __add__(self, other) -> 'PoseArray':
+        return self.compose(other)
+
+    def __sub__(self, other) -> 'PoseArray':
+        return self.inverse_compose(other)
+
+    def __neg__(self) -> 'PoseArray':
+        cos_theta = np.cos(self.theta)
+        sin_theta = np.sin(self.theta)
+        return PoseArray.from_columns(-self.x * cos_theta - self.y * sin_theta, self.x * sin_theta - self.y * cos_theta,
+                                      -self.theta, self.phi)
+
+    def wrap(self) -> 'PoseArray':
+        """
+        Same poses with theta and phi wrapped to [-pi, pi)
+        """
+        return PoseArray.from_columns(self.x, self.y, helper.wrap_to_npi_pi(self.theta),
+                                      helper.wrap_to_npi_pi(self.phi))
+
+    def compose_points(self, x: np.ndarray, y: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Points given relative to each pose, in world coordinates (see PoseR2S2.compose_point)
+        """
+        cos_theta = np.cos(self.theta)
+        sin_theta = np.sin(self.theta)
+        return self.x + x * cos_theta - y * sin_theta, self.y + x * sin_theta + y * cos_theta
+
+    def distance_2d(self, other) -> np.ndarray:
+        other = self._as_pose_array(other)
+        return np.hypot(other.x - self.x, other.y - self.y)
+
+
 def get_bounding_box(points: List[PointR2]) -> Tuple[PointR2]:
     x = [point.x for point in points]
     y = [point.y for point in points]
@@ -142,21 +267,77 @@ def get_bounding_box(points: List[PointR2]) -> Tuple[PointR2]:
 
 
 def polygon_contains_point(polygon: List[PointR2], point: PointR2, bb: Tuple[PointR2] = None) -> bool:
-    # Code ported to python from:
-    # http://stackoverflow.com/questions/217578/how-can-i-determine-whether-a-2d-point-is-within-a-polygon
-    eps = 0.001
-    segments = polygon_to_segments(polygon)
+    """
+    Even-odd rule on the closed polygon (the last vertex connects back to the first), points on the
+    boundary count as inside. Same semantics as points_in_polygon, which should be preferred for many points.
+    """
     if bb is None:
         bb = get_bounding_box(polygon)
-    ray_start = PointR2(bb[0].x - eps, bb[0].y)
-    ray = (ray_start, point)
+    if point.x < bb[0].x - POLYGON_BOUNDARY_EPS or point.x > bb[1].x + POLYGON_BOUNDARY_EPS or \
+            point.y < bb[0].y - POLYGON_BOUNDARY_EPS or point.y > bb[1].y + POLYGON_BOUNDARY_EPS:
+        return False
     result = False
-    for segment in segments:
-        if ray_intersects_segment(segment, ray):
-            result = not result
+    for k in range(len(polygon)):
+        a = polygon[k]
+        b = polygon[(k + 1) % len(polygon)]
+        # distance from the point to the edge
+        ab_x = b.x - a.x
+        ab_y = b.y - a.y
+        length_square = ab_x * ab_x + ab_y * ab_y
+        t = 0. if length_square == 0. else ((point.x - a.x) * ab_x + (point.y - a.y) * ab_y) / length_square
+        t = min(1., max(0., t))
+        dx = point.x - (a.x + t * ab_x)
+        dy = point.y - (a.y + t * ab_y)
+        if dx * dx + dy * dy <= POLYGON_BOUNDARY_EPS * POLYGON_BOUNDARY_EPS:
+            return True
+        # the horizontal ray from the point towards +x crosses the edge (half-open in y)
+        if (a.y > point.y) != (b.y > point.y):
+            x_cross = a.x + (point.y - a.y) * ab_x / ab_y
+            if point.x < x_cross:
+                result = not result
     return result
 
 
+def points_in_polygon(x: np.ndarray, y: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    """
+    Vectorized polygon_contains_point for many points against one polygon
+    :param polygon: (vertices count, 2) array
+    :return: (points count,) bool array
+    """
+    return points_in_polygons(x, y, np.asarray(polygon, dtype=float)[None])[0]
+
+
+def points_in_polygons(x: np.ndarray, y: np.ndarray, polygons: np.ndarray) -> np.ndarray:
+    """
+    Vectorized polygon_contains_point for many points against many polygons of the same vertices count
+    (e.g. vehicle shapes from ArticulatedVehicle.vertices_at_poses). Memory grows as polygons * points * vertices,
+    large inputs should be split by the caller.
+    :param polygons: (polygons count, vertices count, 2) array
+    :return: (polygons count, points count) bool array
+    """
+    polygons = np.asarray(polygons, dtype=float)
+    px = np.asarray(x, dtype=float).reshape(1, -1, 1)
+    py = np.asarray(y, dtype=float).reshape(1, -1, 1)
+    a_x = polygons[:, None, :, 0]
+    a_y = polygons[:, None, :, 1]
+    b_y = np.roll(polygons[:, :, 1], -1, axis=1)[:, None, :]
+    ab_x = np.roll(polygons[:, :, 0], -1, axis=1)[:, None, :] - a_x
+    ab_y = b_y - a_y
+    # distance from each point to each edge
+    length_square = ab_x * ab_x + ab_y * ab_y
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(length_square == 0., 0., ((px - a_x) * ab_x + (py - a_y) * ab_y) / length_square)
+        t = np.minimum(1., np.maximum(0., t))
+        dx = px - (a_x + t * ab_x)
+        dy = py - (a_y + t * ab_y)
+        on_boundary = np.any(dx * dx + dy * dy <= POLYGON_BOUNDARY_EPS * POLYGON_BOUNDARY_EPS, axis=2)
+        # crossings of the horizontal ray from each point towards +x (half-open in y)
+        straddles = (a_y > py) != (b_y > py)
+        x_cross = a_x + (py - a_y) * ab_x / ab_y
+        crossings = np.count_nonzero(straddles & (px < x_cross), axis=2)
+    return on_boundary | (crossings % 2 == 1)
+
+
 def polygon_contains_point_2(polygon: List[PointR2], point: PointR2, bb: Tuple[PointR2] = None) -> bool:
     # Ref: https://www.ecse.rpi.edu/Homepages/wrf/Research/Short_Notes/pnpoly.html#Point on an Edge
     # Seems to have an issue with edge cases. Currently not used
@@ -236,9 +417,8 @@ def ray_intersects_segment(segment: Tuple[PointR2], ray: Tuple[PointR2]) -> bool
     # If we get here, only two possibilities are left. Either the two
     # vectors intersect in exactly one point or they are collinear, which
     # means they intersect in any number of points from zero to infinite.
-    # assert (a1 * b2) - (a2 * b1) != 0., 'Collinear segments not handled'
+    # Collinear segments are not handled and reported as not intersecting
     if (a1 * b2) - (a2 * b1) == 0.:
-        print('Collinear segments detected')
         return False
     # If they are not collinear, they must intersect in exactly one point.
     return True
@@ -0,0 +1,108 @@
+import json
+import time
+
+
+class PhaseProfiler(object):
+    """
+    Accumulates wall time (monotonic clock) and call counts of the solve phases,
+    and event counters, grouped per APTG. Usage in a hot loop:
+        t = profiler.clock()
+        ...
+        profiler.add(group, phase, profiler.clock() - t)
+    """
+    enabled = True
+
+    def __init__(self):
+        self.clock = time.perf_counter
+        self._phases = {}  # type: dict  # {group: {phase: [calls, total time]}}
+        self._counters = {}  # type: dict  # {group: {counter: count}}
+
+    def add(self, group: str, phase: str, elapsed: float):
+        phases = self._phases.setdefault(group, {})
+        entry = phases.get(phase)
+        if entry is None:
+            phases[phase] = [1, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def count(self, group: str, counter: str, n: int = 1):
+        counters = self._counters.setdefault(group, {})
+        counters[counter] = counters.get(counter, 0) + n
+
+    def report(self) -> dict:
+        """
+        :return: {group: {'phases': {phase: {calls, total, mean}}, 'counters': {counter: count}}}
+        """
+        result = {}
+        for group in sorted(set(self._phases) | set(self._counters)):
+            phases = {}
+            for phase, (calls, total) in self._phases.get(group, {}).items():
+                phases[phase] = {'calls': calls, 'total': total, 'mean': total / calls}
+            result[group] = {'phases': phases, 'counters': dict(self._counters.get(group, {}))}
+        return result
+
+    def dump(self, file_name: str):
+        with open(file_name, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def print_report(self):
+        for group, data in self.report().items():
+            print('[{0}]'.format(group))
+            phases = sorted(data['phases'].items(), key=lambda item: -item[1]['total'])
+            for phase, stats in phases:
+                print('  {0:<28}{1:>10d} calls {2:>10.3f} s {3:>10.1f} us/call'.format(phase, stats['calls'],
+                                                                                      stats['total'],
+                                                                                      stats['mean'] * 1e6))
+            for counter, count in sorted(data['counters'].items()):
+                print('  {0:<28}{1:>10d}'.format(counter, count))
+
+
+class NullProfiler(PhaseProfiler):
+    """
+    Profiler used when profiling is disabled, all the calls are no-ops
+    """
+    enabled = False
+
+    def __init__(self):
+        super(NullProfiler, self).__init__()
+        self.clock = _null_clock
+
+    def add(self, group: str, phase: str, elapsed: float):
+        pass
+
+    def count(self, group: str, counter: str, n: int = 1):
+        pass
+
+
+def _null_clock() -> float:
+    return 0.
+
+
+def run_with_profiler_hook(hook: str, func, out_file: str):
+    """
+    Runs func() under the given profiler and saves the profiler output to out_file
+    :param hook: 'cProfile' (standard library, deterministic) or 'pyinstrument' (sampling, optional package)
+    """
+    if hook == 'cProfile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return func()
+        finally:
+            profiler.disable()
+            profiler.dump_stats(out_file)
+            print('cProfile stats saved to {0}'.format(out_file))
+    elif hook == 'pyinstrument':
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            return func()
+        finally:
+            profiler.stop()
+            with open(out_file, 'w') as f:
+                f.write(profiler.output_text(unicode=True))
+            print('pyinstrument report saved to {0}'.format(out_file))
+    raise ValueError('Unknown profiler hook {0}'.format(hook))
@@ -0,0 +1,125 @@
+from typing import List
+import numpy as np
+import prrt.helper as helper
+from prrt.grid import WorldGrid
+from prrt.primitive import PoseR2S2
+
+BUDGET_LOW_WATER = 0.9  # a tree over node_budget is cut down to this fraction of it, so cuts are not done every node
+
+
+class PruneReport(object):
+    """
+    Nodes removed by a TreePruner over a solve
+    """
+
+    def __init__(self):
+        self.passes = 0
+        self.dominated = 0  # leaves removed as dominated
+        self.over_budget = 0  # leaves removed to keep the tree within node_budget
+
+    @property
+    def removed(self) -> int:
+        return self.dominated + self.over_budget
+
+    def __str__(self):
+        return 'Pruning: {0} passes, {1} dominated and {2} over budget nodes removed'.format(
+            self.passes, self.dominated, self.over_budget)
+
+
+class TreePruner(object):
+    """
+    Keeps the tree small in long runs, only leaf nodes are removed so the rest of the tree is unchanged:
+    - a leaf is dominated if another node within prune_radius (m), prune_ang_tolerance (deg) of heading and
+      prune_phi_tolerance (deg) of articulation angle has a lower cost from the root (trajectories length):
+      growing the tree from that node reaches the same states for less.
+    - with node_budget set, the least promising leaves are removed when the tree exceeds it. Leaves are ranked
+      by cost from the root plus cost to go (the cost-to-go field when available, the distance to the goal
+      otherwise), as in A*.
+    """
+
+    def __init__(self, world: WorldGrid, config: dict):
+        self.world = world
+        self.radius = config.get('prune_radius', 0.5)
+        self.ang_tolerance = np.radians(config.get('prune_ang_tolerance', 10.))
+        self.phi_tolerance = np.radians(config.get('prune_phi_tolerance', 5.))
+        self.node_budget = config.get('node_budget') or 0
+        self.report = PruneReport()
+
+    @staticmethod
+    def leaves(tree, protected: set) -> np.ndarray:
+        """
+        Indices in tree.nodes of the leaves that may be removed
+        """
+        return np.array([i for i, node in enumerate(tree.nodes)
+                         if len(node.edges_to_child) == 0 and node.parent is not None and node not in protected],
+                        dtype=np.int64)
+
+    def dominated_leaves(self, tree, protected: set) -> List:
+        leaves = self.leaves(tree, protected)
+        if len(leaves) == 0:
+            return []
+        poses = tree.get_node_poses()
+        costs = np.array([node.cost for node in tree.nodes])
+        # the nodes are bucketed on a prune_radius grid: the nodes within prune_radius of a leaf are in the leaf
+        # bucket or its 8 neighbours. Buckets are numbered column by column, so for each of the 3 neighbour
+        # columns the 3 buckets are a single range of the nodes sorted by bucket.
+        bx = np.floor(poses.x / self.radius).astype(np.int64)
+        by = np.floor(poses.y / self.radius).astype(np.int64)
+        column = by.max() - by.min() + 3
+        bucket = (bx - bx.min() + 1) * column + by - by.min() + 1
+        order = np.argsort(bucket, kind='stable')
+        sorted_buckets = bucket[order]
+        first = np.concatenate([np.searchsorted(sorted_buckets, bucket[leaves] + dx * column - 1, 'left')
+                                for dx in (-1, 0, 1)])
+        last = np.concatenate([np.searchsorted(sorted_buckets, bucket[leaves] + dx * column + 1, 'right')
+                               for dx in (-1, 0, 1)])
+        # one (leaf, node) pair per node in the 3 ranges of each leaf
+        counts = last - first
+        leaf = np.repeat(np.tile(leaves, 3), counts)
+        node = order[np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - first, counts)]
+        near = costs[node] < costs[leaf]
+        leaf, node = leaf[near], node[near]
+        near = (poses.x[leaf] - poses.x[node]) ** 2 + (poses.y[leaf] - poses.y[node]) ** 2 <= self.radius ** 2
+        leaf, node = leaf[near], node[near]
+        near = np.abs(helper.wrap_to_npi_pi(poses.theta[leaf] - poses.theta[node])) <= self.ang_tolerance
+        near &= np.abs(helper.wrap_to_npi_pi(poses.phi[leaf] - poses.phi[node])) <= self.phi_tolerance
+        return [tree.nodes[i] for i in np.unique(leaf[near]).tolist()]
+
+    def least_promising_leaves(self, tree, goal_pose: PoseR2S2, protected: set, count: int) -> List:
+        leaves = self.leaves(tree, protected)
+        if len(leaves) == 0:
+            return []
+        poses = tree.get_node_poses()
+        if self.world.cost_to_go is not None:
+            cost_to_go = np.array([self.world.cost_to_go_at(x, y) for x, y in zip(poses.x[leaves].tolist(),
+                                                                                    poses.y[leaves].tolist())])
+        else:
+            cost_to_go = np.hypot(poses.x[leaves] - goal_pose.x, poses.y[leaves] - goal_pose.y)
+        promise = np.array([tree.nodes[i].cost for i in leaves.tolist()]) + cost_to_go
+        worst = np.argsort(-promise, kind='stable')[:count]
+        return [tree.nodes[i] for i in leaves[worst].tolist()]
+
+    def prune(self, tree, goal_pose: PoseR2S2, protected: set, dominated=True) -> List:
+        """
+        Removes the dominated leaves (if dominated), then the least promising leaves while the tree is over budget
+        :param protected: nodes to keep, the root is always kept
+        :return: the removed nodes
+        """
+        self.report.passes += 1
+        removed = []
+        if dominated:
+            leaves = self.dominated_leaves(tree, protected)
+            tree.remove_leaves(leaves)
+            self.report.dominated += len(leaves)
+            removed.extend(leaves)
+        if 0 < self.node_budget < len(tree.nodes):
+            # removed leaves may expose their parents as the next least promising leaves
+            target = int(self.node_budget * BUDGET_LOW_WATER)
+            while len(tree.nodes) > target:
+                leaves = self.least_promising_leaves(tree, goal_pose, protected, len(tree.nodes) - target)
+                if len(leaves) == 0:
+                    break
+                tree.remove_leaves(leaves)
+                self.report.over_budget += len(leaves)
+                removed.extend(leaves)
+        return removed
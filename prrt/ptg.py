@@ -1,10 +1,13 @@
+import hashlib
+import os.path
 from abc import ABCMeta, abstractmethod
 from prrt.vehicle import ArticulatedVehicle
 from prrt.primitive import PoseR2S2, CPoint, PointR2
 import numpy as np
 import prrt.helper as helper
+import prrt.kernels as kernels
 from typing import List, Type
-from prrt.grid import ObstacleGrid, CPointsGrid
+from prrt.grid import ObstacleGrid, CompactObstacleGrid, CPointsGrid
 from math import tan, sqrt, radians as rad, degrees as deg, pi as PI
 
 
@@ -12,6 +15,8 @@ class PTG(metaclass=ABCMeta):
     """
     Base class for parametrized trajectory generators.
     """
+    phi_invariant_inverse = False  # inverse_WS2TP is the same at all init_phi (given the other parameters)
+    closed_form_inverse = False  # inverse_WS2TP is exact, computed without the inverse table
 
     def __init__(self, vehicle: ArticulatedVehicle, config: dict):
         # check the provided config file for details on the variables initialized below
@@ -28,6 +33,7 @@ class PTG(metaclass=ABCMeta):
         self.k_theta = config['k_theta']  # type: float
         self.distance_ref = config['grid_size']  # type: float
         self.obstacle_grid = ObstacleGrid(3 * config['grid_size'], 3 * config['grid_resolution'])
+        self.obstacle_grid_bits = config.get('obstacle_grid_bits', 0)  # type: int  # 0: float distances
         self.cpoints_grid = CPointsGrid(config['grid_size'], config['grid_resolution'])
         self.name = config['name']
         # initial phi is meant to be added by the caller (eg. APTG). Assume it 0 if not available
@@ -47,36 +53,52 @@ class PTG(metaclass=ABCMeta):
             2- See which cells it collides with
             3- Update the cells with alpha and d values
         """
-        from prrt.primitive import get_bounding_box, polygon_contains_point as polygon_contains_point
         assert len(self.cpoints) > 0, 'cpoints don\'t exist!'
+        grid = self.obstacle_grid
         for k in range(len(self.idx_to_alpha)):
-            cpoints_at_k = self.cpoints[k]
-            for cpoint in cpoints_at_k:
-                shape_tractor = self.vehicle.get_tractor_vertices_at_pose(cpoint.pose)
-                shape_trailer = self.vehicle.get_trailer_vertices_at_pose(cpoint.pose)
-                shapes = [shape_tractor, shape_trailer]
-                for shape in shapes:
-                    shape_bb = get_bounding_box(shape)
-                    x_idx_min = max(0, self.obstacle_grid.x_to_ix(shape_bb[0].x))
-                    y_idx_min = max(0, self.obstacle_grid.y_to_iy(shape_bb[0].y))
-                    x_idx_max = min(self.obstacle_grid.cell_count_x - 1, self.obstacle_grid.x_to_ix(shape_bb[1].x))
-                    y_idx_max = min(self.obstacle_grid.cell_count_y - 1, self.obstacle_grid.y_to_iy(shape_bb[1].y))
-                    for x_idx in range(x_idx_min - 1, x_idx_max + 1):
-                        cell = PointR2()
-                        cell.x = self.obstacle_grid.idx_to_x(x_idx)
-                        for y_idx in range(y_idx_min - 1, y_idx_max + 1):
-                            cell.y = self.obstacle_grid.idx_to_y(y_idx)
-                            if polygon_contains_point(shape, cell, shape_bb):
-                                self.obstacle_grid.update_cell(x_idx, y_idx, k, cpoint.d)
-                                self.obstacle_grid.update_cell(x_idx - 1, y_idx, k, cpoint.d)
-                                self.obstacle_grid.update_cell(x_idx, y_idx - 1, k, cpoint.d)
-                                self.obstacle_grid.update_cell(x_idx - 1, y_idx - 1, k, cpoint.d)
+            arrays = self.get_cpoints_arrays(k)
+            poses = (arrays['x'], arrays['y'], arrays['theta'], arrays['phi'])
+            # least d of the shapes containing each cell corner (idx_to_x, idx_to_y)
+            corners_d = np.full((grid.cell_count_x, grid.cell_count_y), np.inf)
+            for shapes in (self.vehicle.tractor_vertices_at_poses(*poses),
+                           self.vehicle.trailer_vertices_at_poses(*poses)):
+                if shapes.shape[1] == 0:
+                    continue
+                # corners of the cells under each shape bounding box, as in x_to_ix and y_to_iy
+                x_idx = np.floor(shapes[:, :, 0] / grid._resolution) + grid._half_cell_count_x
+                y_idx = np.floor(shapes[:, :, 1] / grid._resolution) + grid._half_cell_count_y
+                boxes = np.column_stack((np.maximum(0, x_idx.min(axis=1) - 1),
+                                         np.minimum(grid.cell_count_x - 1, x_idx.max(axis=1)),
+                                         np.maximum(0, y_idx.min(axis=1) - 1),
+                                         np.minimum(grid.cell_count_y - 1, y_idx.max(axis=1))))
+                kernels.polygons_min_distance(shapes, arrays['d'], boxes, grid._resolution, grid._size, corners_d)
+            # the cells sharing each corner
+            cells_d = corners_d.copy()
+            cells_d[:-1, :] = np.minimum(cells_d[:-1, :], corners_d[1:, :])
+            cells_d[:, :-1] = np.minimum(cells_d[:, :-1], corners_d[:, 1:])
+            cells_d[:-1, :-1] = np.minimum(cells_d[:-1, :-1], corners_d[1:, 1:])
+            for ix, iy in np.argwhere(np.isfinite(cells_d)).tolist():
+                grid.update_cell(ix, iy, k, float(cells_d[ix, iy]))
         print('Completed building obstacle grid for {0}'.format(self.name))
+        if self.__dict__.get('obstacle_grid_bits', 0) > 0:
+            self.compact_obstacle_grid(self.obstacle_grid_bits)
+
+    def compact_obstacle_grid(self, distance_bits: int):
+        """
+        Replaces the obstacle grid by its quantized and compressed version, see CompactObstacleGrid
+        """
+        if isinstance(self.obstacle_grid, CompactObstacleGrid):
+            assert self.obstacle_grid.distance_bits == distance_bits, 'obstacle grid already compacted'
+            return
+        self.obstacle_grid = CompactObstacleGrid(self.obstacle_grid, self.distance_ref, distance_bits)
+        self.obstacle_grid_bits = distance_bits
 
     def build(self):
         self.build_cpoints()
         self.build_obstacle_grid()
         self.build_cpoints_grid()
+        if not self.closed_form_inverse:
+            self.build_inverse_table()
 
     def build_cpoints_grid(self):
         '''
@@ -99,6 +121,13 @@ class PTG(metaclass=ABCMeta):
             k += 1
         print('Completed building cpoints grid for {0}'.format(self.name))
 
+    def __getstate__(self):
+        # the cpoints arrays are rebuilt from the cpoints on first use (a few ms), saving them would double the size
+        # of the cpoints
+        state = self.__dict__.copy()
+        state.pop('_cpoints_arrays', None)
+        return state
+
     def get_distance(self, from_pose: PoseR2S2, to_pose: PoseR2S2) -> float:
         to_at_from = to_pose - from_pose
         is_exact, k, d = self.inverse_WS2TP(to_at_from)
@@ -118,50 +147,93 @@ class PTG(metaclass=ABCMeta):
         delta = alpha + self.alpha_max
         return int(np.rint(delta / self.alpha_resolution))
 
+    def build_inverse_table(self):
+        """
+        Dense lookup table for inverse_WS2TP: for each cell of the cpoints grid, the trajectory k and distance d
+        of the cpoint nearest to the cell center, among the cpoints of the cell and its 8 neighbours. Cells
+        with no cpoint around are marked k = -1, poses falling there are extrapolated from the trajectories
+        end points (stored as arrays as well). Not built for the PTGs with a closed form inverse.
+        """
+        assert len(self.cpoints) > 0, 'call build_cpoints before'
+        grid = self.cpoints_grid
+        arrays = [self.get_cpoints_arrays(k) for k in range(len(self.cpoints))]
+        x = np.concatenate([a['x'] for a in arrays])
+        y = np.concatenate([a['y'] for a in arrays])
+        d = np.concatenate([a['d'] for a in arrays])
+        k = np.concatenate([np.full(len(a['d']), k) for k, a in enumerate(arrays)])
+        ix = np.floor(x / grid._resolution).astype(int) + grid._half_cell_count_x
+        iy = np.floor(y / grid._resolution).astype(int) + grid._half_cell_count_y
+        # every cpoint is a candidate for the 3x3 cells around its own cell
+        offsets = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+        cell_ix = (ix[:, None] + offsets[:, 0]).ravel()
+        cell_iy = (iy[:, None] + offsets[:, 1]).ravel()
+        candidate = np.repeat(np.arange(len(x)), len(offsets))
+        in_grid = (cell_ix >= 0) & (cell_ix < grid.cell_count_x) & (cell_iy >= 0) & (cell_iy < grid.cell_count_y)
+        cell_ix, cell_iy, candidate = cell_ix[in_grid], cell_iy[in_grid], candidate[in_grid]
+        center_x = (cell_ix - grid._half_cell_count_x + 0.5) * grid._resolution
+        center_y = (cell_iy - grid._half_cell_count_y + 0.5) * grid._resolution
+        dist_square = (x[candidate] - center_x) ** 2 + (y[candidate] - center_y) ** 2
+        cell = cell_ix * grid.cell_count_y + cell_iy
+        # nearest candidate of each cell: first one once sorted by cell then distance
+        order = np.lexsort((dist_square, cell))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = cell[order][1:] != cell[order][:-1]
+        nearest = order[first]
+        table_k = np.full(grid.cell_count_x * grid.cell_count_y, -1, dtype=np.int32)
+        table_d = np.full(grid.cell_count_x * grid.cell_count_y, np.nan)
+        table_k[cell[nearest]] = k[candidate[nearest]]
+        table_d[cell[nearest]] = d[candidate[nearest]]
+        self._inverse_table = {'k': table_k.reshape(grid.cell_count_x, grid.cell_count_y),
+                               'd': table_d.reshape(grid.cell_count_x, grid.cell_count_y),
+                               'end_x': np.array([a['x'][-1] for a in arrays]),
+                               'end_y': np.array([a['y'][-1] for a in arrays]),
+                               'end_d': np.array([a['d'][-1] for a in arrays])}
+        return self._inverse_table
+
+    def get_inverse_table(self) -> dict:
+        # PTGs dumped before the table existed build it on first use
+        table = self.__dict__.get('_inverse_table')
+        if table is None:
+            table = self.build_inverse_table()
+        return table
+
     def inverse_WS2TP(self, p: PoseR2S2, tolerance=0.1) -> (bool, int, float):
-        k_min = 100000
-        k_max = 0
-        n_min = 100000
-        n_max = 0
-        at_least_once = False
+        table = self.get_inverse_table()
         ix = self.cpoints_grid.x_to_ix(p.x)
         iy = self.cpoints_grid.y_to_iy(p.y)
-        for i in [ix - 1, ix, ix + 1]:
-            for j in [iy - 1, iy, iy + 1]:
-                cell = self.cpoints_grid.cell_by_idx(ix, iy)
-                if cell is not None:
-                    cell_k_min, cell_n_min, cell_k_max, cell_n_max = cell
-                    k_min = min(k_min, cell_k_min)
-                    n_min = min(n_min, cell_n_min)
-                    k_max = max(k_max, cell_k_max)
-                    n_max = max(n_max, cell_n_max)
-                    at_least_once = True
-
-        k_best = -1
-        d_best = -1.
-        least_dist_square = float('inf')
-        if at_least_once:
-            for k in range(k_min, k_max + 1):
-                for n in range(n_min, min(n_max + 1, len(self.cpoints[k]))):
-                    cpoint = self.cpoints[k][n]
-                    dist_square = (p.x - cpoint.x) ** 2 + (p.y - cpoint.y) ** 2
-                    if dist_square < least_dist_square:
-                        least_dist_square = dist_square
-                        k_best = k
-                        d_best = cpoint.d
-            d = sqrt(d_best) / self.distance_ref
-            return True, k_best, d  # Exact cpoint, at alpha index = k, with distance d
+        if 0 <= ix < self.cpoints_grid.cell_count_x and 0 <= iy < self.cpoints_grid.cell_count_y:
+            k = int(table['k'][ix, iy])
+            if k >= 0:
+                return True, k, float(table['d'][ix, iy]) / self.distance_ref  # Exact cpoint
 
         # Point not within grid, extrapolate trajectories to reach the point
-        for cpoints_at_k in self.cpoints:
-            cpoint = cpoints_at_k[-1]  # get last point in trajectory
-            dist_square = cpoint.d ** 2 + (p.x - cpoint.x) ** 2 + (p.y - cpoint.y) ** 2
-            if dist_square < least_dist_square:
-                least_dist_square = dist_square
-                k_best = self.alpha2idx(cpoint.alpha)
-                d_best = dist_square
-        d = sqrt(d_best) / self.distance_ref
-        return False, k_best, d  # Exact cpoint, at alpha index = k, with distance d
+        dist_square = table['end_d'] ** 2 + (p.x - table['end_x']) ** 2 + (p.y - table['end_y']) ** 2
+        k = int(np.argmin(dist_square))
+        return False, k, sqrt(dist_square[k]) / self.distance_ref
+
+    def inverse_WS2TP_batch(self, x: np.ndarray, y: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        inverse_WS2TP of many positions
+        :return: is_exact, k and normalized d arrays
+        """
+        table = self.get_inverse_table()
+        grid = self.cpoints_grid
+        ix = (np.floor(x / grid._resolution) + grid._half_cell_count_x).astype(np.int64)
+        iy = (np.floor(y / grid._resolution) + grid._half_cell_count_y).astype(np.int64)
+        in_grid = (ix >= 0) & (ix < grid.cell_count_x) & (iy >= 0) & (iy < grid.cell_count_y)
+        k = np.full(len(x), -1, dtype=np.int64)
+        d = np.empty(len(x))
+        k[in_grid] = table['k'][ix[in_grid], iy[in_grid]]
+        d[in_grid] = table['d'][ix[in_grid], iy[in_grid]]
+        is_exact = k >= 0
+        # extrapolate the trajectories to reach the other points
+        far = np.flatnonzero(~is_exact)
+        if len(far) > 0:
+            dist_square = table['end_d'] ** 2 + (x[far, None] - table['end_x']) ** 2 + \
+                          (y[far, None] - table['end_y']) ** 2
+            k[far] = np.argmin(dist_square, axis=1)
+            d[far] = np.sqrt(dist_square[np.arange(len(far)), k[far]])
+        return is_exact, k, d / self.distance_ref
 
     def get_cpoint_at_d(self, d: float, k: int) -> CPoint:
         assert k < len(self.cpoints), 'k value exceeds bound'''
@@ -169,12 +241,35 @@ class PTG(metaclass=ABCMeta):
             if cpoint.d >= d:
                 return cpoint
 
+    def get_cpoints_arrays(self, k: int) -> dict:
+        """
+        Columns (numpy arrays) of the cpoints of trajectory k: d, x, y, theta, phi, v, w.
+        Built on first use and cached.
+        """
+        cache = self.__dict__.setdefault('_cpoints_arrays', {})
+        arrays = cache.get(k)
+        if arrays is None:
+            cpoints_at_k = self.cpoints[k]
+            arrays = {'d': np.array([cpoint.d for cpoint in cpoints_at_k]),
+                      'x': np.array([cpoint.x for cpoint in cpoints_at_k]),
+                      'y': np.array([cpoint.y for cpoint in cpoints_at_k]),
+                      'theta': np.array([cpoint.theta for cpoint in cpoints_at_k]),
+                      'phi': np.array([cpoint.phi for cpoint in cpoints_at_k]),
+                      'v': np.array([cpoint.v for cpoint in cpoints_at_k]),
+                      'w': np.array([cpoint.w for cpoint in cpoints_at_k])}
+            cache[k] = arrays
+        return arrays
+
+    def get_cpoints_idx_at_d(self, d: np.ndarray, k: int) -> np.ndarray:
+        """
+        Vectorized get_cpoint_at_d: index of the first cpoint of trajectory k with cpoint.d >= d, for each d
+        """
+        d_k = self.get_cpoints_arrays(k)['d']
+        return np.minimum(np.searchsorted(d_k, d, side='left'), len(d_k) - 1)
+
     def plot_trajectories(self, axes):
-        for cpoints_at_k in self.cpoints:
-            x = [cpoint.pose.x for cpoint in cpoints_at_k]
-            y = [cpoint.pose.y for cpoint in cpoints_at_k]
-            axes.plot(x, y, label=r'$\alpha = {0:.1f}^\circ$'.format(deg(cpoints_at_k[0].alpha)))
-            axes.legend(loc='upper left', shadow=True)
+        import prrt.visualization as visualization  # matplotlib is only loaded when plotting
+        visualization.plot_trajectories(axes, self)
 
 
 class CPTG(PTG):
@@ -182,6 +277,8 @@ class CPTG(PTG):
     Circular path PTG. Paths are generated by selecting a fixed
     alpha
     """
+    phi_invariant_inverse = True
+    closed_form_inverse = True
 
     def build_cpoints(self):
         """
@@ -262,6 +359,10 @@ class CPTG(PTG):
         assert ik < len(self.cpoints), 'ik exceeds limit'
         return is_exact, ik, d
 
+    def inverse_WS2TP_batch(self, x: np.ndarray, y: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+        return kernels.cptg_inverse(x, y, self.K, self.vehicle.v_max, self.vehicle.w_max, self.vehicle.tractor_l,
+                                    self.alpha_max, self.alpha_resolution, self.distance_ref)
+
 
 class AlphaA_PTG(PTG):
     """
@@ -331,16 +432,83 @@ class APTG(object):
         Warning: Takes a while to complete, around 1 hour on the default configurations
         To speed up testing of collision unrelated feature set skip_collision_calc to True
         '''
+        for phi in self.phi_bins():
+            self.ptgs.append(self.build_ptg(phi, skip_collision_calc))
+
+    def phi_bins(self) -> List[float]:
+        """
+        Initial articulation angles sampled at phi_resolution, bin i is the phi_init of self.ptgs[i]
+        """
         phi_max = self.vehicle.phi_max
-        for phi in np.arange(-phi_max, phi_max + self.phi_resolution,
-                             self.phi_resolution):
-            self.config['init_phi'] = min(deg(phi), 30.)
-            self.config['name'] = '{0}_init_phi = {1:0.1f}'.format(self.name, deg(phi))
-            ptg = self.ptg_class(self.vehicle, self.config)
-            if skip_collision_calc:
-                ptg.build_cpoints()
-            else:
-                ptg.build()
+        return list(np.arange(-phi_max, phi_max + self.phi_resolution, self.phi_resolution))
+
+    def new_ptg(self, phi: float) -> PTG:
+        """
+        The PTG at the given initial articulation angle, not built yet
+        """
+        self.config['init_phi'] = min(deg(phi), 30.)
+        self.config['name'] = '{0}_init_phi = {1:0.1f}'.format(self.name, deg(phi))
+        return self.ptg_class(self.vehicle, self.config)
+
+    def build_ptg(self, phi: float, skip_collision_calc=False) -> PTG:
+        ptg = self.new_ptg(phi)
+        if skip_collision_calc:
+            ptg.build_cpoints()
+        else:
+            ptg.build()
+        return ptg
+
+    def build_fingerprint(self) -> str:
+        """
+        Hash of what the built ptgs depend on: the APTG configuration and the vehicle dimensions.
+        Shards built with another configuration are ignored.
+        """
+        config = sorted((key, value) for key, value in self.config.items() if key not in ('name', 'init_phi'))
+        vehicle = [(key, getattr(self.vehicle, key, None)) for key in
+                   ('v_max', 'w_max', 'phi_max', 'tractor_w', 'tractor_l', 'link_l', 'trailer_w', 'trailer_l')]
+        text = repr((self.name, config, type(self.vehicle).__name__, vehicle))
+        return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+    def shard_file(self, shard_dir: str, phi_bin: int) -> str:
+        return os.path.join(shard_dir, '{0}_phi_{1:03d}_{2}.pkl'.format(self.name, phi_bin, self.build_fingerprint()))
+
+    def build_shards(self, shard_dir: str, phi_bins: List[int] = None) -> List[int]:
+        """
+        Builds the ptgs of the given phi bins (all of them by default) and saves each one to its own shard file
+        in shard_dir as soon as it is built. Bins already saved are skipped, so that an interrupted build resumes
+        where it stopped and the bins can be split across machines. See assemble
+        :return: the phi bins built by this call
+        """
+        os.makedirs(shard_dir, exist_ok=True)
+        phis = self.phi_bins()
+        phi_bins = range(len(phis)) if phi_bins is None else phi_bins
+        built = []
+        for phi_bin in phi_bins:
+            assert 0 <= phi_bin < len(phis), 'phi bin {0} out of range [0, {1}]'.format(phi_bin, len(phis) - 1)
+            file_name = self.shard_file(shard_dir, phi_bin)
+            if os.path.exists(file_name):
+                print('Skipping phi bin {0}, {1} exists'.format(phi_bin, file_name))
+                continue
+            helper.save_object(self.build_ptg(phis[phi_bin]), file_name)
+            print('Saved phi bin {0} to {1}'.format(phi_bin, file_name))
+            built.append(phi_bin)
+        return built
+
+    def missing_shards(self, shard_dir: str) -> List[int]:
+        return [phi_bin for phi_bin in range(len(self.phi_bins()))
+                if not os.path.exists(self.shard_file(shard_dir, phi_bin))]
+
+    def assemble(self, shard_dir: str):
+        """
+        Loads the ptgs saved by build_shards, all the phi bins must have been built
+        """
+        missing = self.missing_shards(shard_dir)
+        if len(missing) > 0:
+            raise FileNotFoundError('Missing shards in {0} for phi bins {1}'.format(shard_dir, missing))
+        self.ptgs = []
+        for phi_bin in range(len(self.phi_bins())):
+            ptg = helper.load_object(self.shard_file(shard_dir, phi_bin))  # type: PTG
+            ptg.vehicle = self.vehicle  # shared by all the ptgs, as after build()
             self.ptgs.append(ptg)
 
     def dump(self, file_name):
@@ -352,9 +520,56 @@ class APTG(object):
         '''
         helper.save_object(self, file_name)
 
+    def compact(self, distance_bits=8):
+        """
+        Quantizes and compresses the obstacle grids of all the ptgs, see CompactObstacleGrid
+        """
+        for ptg in self.ptgs:
+            ptg.compact_obstacle_grid(distance_bits)
+        self.config['obstacle_grid_bits'] = distance_bits
+
+    def memory_report(self) -> dict:
+        """
+        Approximate memory used by the APTG broken down by component (summed over the ptgs), in bytes.
+        Objects shared by several components are counted once, in the first one.
+        """
+        seen = set()
+        report = {'vehicle': helper.deep_size(self.vehicle, seen)}
+        for component in ('cpoints', 'obstacle_grid', 'cpoints_grid', '_inverse_table', '_cpoints_arrays'):
+            report[component.lstrip('_')] = sum(helper.deep_size(ptg.__dict__.get(component), seen)
+                                                for ptg in self.ptgs)
+        report['other'] = helper.deep_size(self, seen)
+        report['total'] = sum(report.values())
+        return report
+
     def ptg_at_phi(self, phi: float) -> PTG:
         # get the ptg with the nearest phi_init
         delta = phi - (-self.vehicle.phi_max)
         idx = int(np.rint(delta / self.phi_resolution))
         assert idx <= len(self.ptgs), 'Articulation angel (phi) out of range!'
         return self.ptgs[idx]
+
+    def inverse_WS2TP_batch(self, ptg_idx: np.ndarray, x: np.ndarray, y: np.ndarray) -> (np.ndarray, np.ndarray,
+                                                                                        np.ndarray):
+        """
+        inverse_WS2TP of many positions, position i relative to ptgs[ptg_idx[i]]
+        :return: is_exact, k and normalized d arrays
+        """
+        if self.ptgs[0].phi_invariant_inverse:
+            return self.ptgs[0].inverse_WS2TP_batch(x, y)
+        is_exact = np.empty(len(x), dtype=bool)
+        k = np.empty(len(x), dtype=np.int64)
+        d = np.empty(len(x))
+        for idx in np.unique(ptg_idx).tolist():
+            selected = np.flatnonzero(ptg_idx == idx)
+            is_exact[selected], k[selected], d[selected] = self.ptgs[idx].inverse_WS2TP_batch(x[selected],
+                                                                                             y[selected])
+        return is_exact, k, d
+
+    def ptg_indices_at_phi(self, phi: np.ndarray) -> np.ndarray:
+        """
+        Indices in ptgs of ptg_at_phi of many articulation angles
+        """
+        idx = np.rint((phi - (-self.vehicle.phi_max)) / self.phi_resolution).astype(np.int64)
+        assert np.all(idx <= len(self.ptgs)), 'Articulation angel (phi) out of range!'
+        return idx
@@ -0,0 +1,112 @@
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import time
+import traceback
+from typing import List
+
+# OR-parallel seed racing: planners with different seeds solve the same problem in worker processes, the first
+# solution wins and the other workers are stopped (see Planner.solve_race). With the fork start method the workers
+# share the APTGs and the world map loaded by the parent (copy on write), otherwise each worker loads them.
+
+# config keys of the files written by a solve, cleared in the workers: the parent writes the winner's outputs
+OUTPUT_KEYS = ('csv_out_file', 'plot_tree_file', 'plot_solution', 'solution_out_file', 'event_log_file',
+               'profile_file', 'profile_hook')
+
+_shared_planner = None  # set while the workers are forked, see race()
+
+
+def worker_seeds(master_seed, workers: int) -> List[int]:
+    """
+    Seeds of the race workers, always the same for a given master seed (None draws them from the OS)
+    """
+    rng = random.Random(master_seed)
+    return [rng.getrandbits(32) for _ in range(workers)]
+
+
+def worker_config(config: dict, seed: int) -> dict:
+    config = dict(config, seed=seed, race_workers=0)
+    for key in OUTPUT_KEYS:
+        if key in config:
+            config[key] = ''
+    return config
+
+
+def _run_worker(index: int, config: dict, remaining: float, results):
+    try:
+        from prrt.planner import Planner
+        planner = _shared_planner
+        if planner is None:
+            planner = Planner(config)  # spawned: the APTGs and the map are loaded by solve
+        else:
+            planner.config = config
+            planner.rng = random.Random(config['seed'])
+        deadline = None if remaining is None else time.perf_counter() + remaining
+        sys.stdout = open(os.devnull, 'w')  # the planner is chatty, only the parent reports
+        result = planner.solve(deadline)
+        results.put((index, result, None))
+    except Exception:
+        results.put((index, None, traceback.format_exc()))
+
+
+def race(planner, workers: int, master_seed=None, deadline: float = None):
+    """
+    Solves planner.config with workers planners racing in parallel processes
+    :param planner: prrt.planner.Planner, its APTGs and world map are loaded first when the workers can share them
+    :param master_seed: seed the worker seeds are derived from, see worker_seeds
+    :param deadline: absolute time (time.perf_counter() clock) by which the workers stop
+    :return: PlannerResult of the first worker to solve, or if none solves, of the one closest to the goal. Its
+     seed reproduces the run with a single planner. solving_time is the race wall time.
+    """
+    global _shared_planner
+    start = time.perf_counter()
+    seeds = worker_seeds(master_seed, workers)
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    if context.get_start_method() == 'fork':
+        planner.setup()
+        _shared_planner = planner
+    results = context.Queue()
+    remaining = None if deadline is None else max(0., deadline - time.perf_counter())
+    processes = [context.Process(target=_run_worker, args=(i, worker_config(planner.config, seed), remaining, results),
+                                 daemon=True) for i, seed in enumerate(seeds)]
+    try:
+        for process in processes:
+            process.start()
+    finally:
+        _shared_planner = None
+    finished = {}  # worker index -> PlannerResult
+    errors = {}  # worker index -> traceback
+    winner = None
+    try:
+        while len(finished) + len(errors) < workers:
+            try:
+                index, result, error = results.get(timeout=1.)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes) and results.empty():
+                    break  # workers died without reporting
+                continue
+            if error is not None:
+                errors[index] = error
+                print('Race worker {0} (seed {1}) failed:\n{2}'.format(index, seeds[index], error))
+                continue
+            finished[index] = result
+            if result.success:
+                winner = index
+                break
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+    if winner is None:
+        if len(finished) == 0:
+            raise RuntimeError('All the {0} race workers failed'.format(workers))
+        winner = min(finished, key=lambda i: (finished[i].distance_to_target, i))
+    result = finished[winner]
+    result.solving_time = time.perf_counter() - start
+    print('Race: worker {0} of {1} (seed {2}) {3} in {4:.2f} s, {5} nodes'.format(
+        winner, workers, seeds[winner], result.status, result.solving_time, result.nodes))
+    return result
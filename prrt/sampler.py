@@ -0,0 +1,171 @@
+import random
+from abc import ABCMeta, abstractmethod
+import numpy as np
+from prrt.grid import WorldGrid
+from prrt.primitive import PoseR2S2
+
+
+class Sampler(metaclass=ABCMeta):
+    """
+    Base class for the RRT random pose samplers.
+    The sampler class is selected in the planner configuration file
+    (see 'sampler_module' and 'sampler_class' in planner.yaml)
+    """
+    needs_whole_map = False  # samples from the free cells index of WorldGrid, not available on tiled maps
+
+    def __init__(self, world: WorldGrid, config: dict, init_pose: PoseR2S2, goal_pose: PoseR2S2,
+                 rng: random.Random = None):
+        self.world = world
+        self.rng = rng if rng is not None else random.Random()
+        self.config = config
+        self.init_pose = init_pose
+        self.goal_pose = goal_pose
+        self.solution_cost = float('inf')
+
+    @abstractmethod
+    def sample(self) -> PoseR2S2:
+        """
+        Draws a random pose from the sampling region
+        """
+        pass
+
+    def get_random_pose(self, bias_pose: PoseR2S2 = None, bias=0.05) -> PoseR2S2:
+        if bias_pose is not None:
+            rand = self.rng.uniform(0, 1)
+            if rand <= bias:
+                return bias_pose.copy()
+        return self.sample()
+
+    def update_solution_cost(self, cost: float):
+        """
+        Called by the planner once a solution of the given cost (path length in m) is known
+        """
+        self.solution_cost = min(self.solution_cost, cost)
+
+    def update_frontier(self, pose: PoseR2S2):
+        """
+        Called by the planner each time a new node is added to the tree
+        """
+        pass
+
+
+class UniformSampler(Sampler):
+    """
+    Samples x and y uniformly over the whole map, obstacles included
+    """
+
+    def sample(self) -> PoseR2S2:
+        return self.world.get_random_pose(rng=self.rng)
+
+
+class FreeSpaceSampler(Sampler):
+    """
+    Samples only cells that are free in the world occupancy map
+    """
+
+    def __init__(self, world: WorldGrid, config: dict, init_pose: PoseR2S2, goal_pose: PoseR2S2,
+                 rng: random.Random = None):
+        super(FreeSpaceSampler, self).__init__(world, config, init_pose, goal_pose, rng)
+        self.world.build_free_space_index()
+
+    def sample(self) -> PoseR2S2:
+        return self.world.get_random_free_pose(rng=self.rng)
+
+
+class InformedSampler(FreeSpaceSampler):
+    """
+    Free space sampler that, once a solution of cost c_best is known, restricts
+    samples to the free cells inside the ellipse |p - init| + |p - goal| <= c_best. The planner only keeps
+    sampling after a solution with refine_iterations set (see planner.yaml)
+    Ref: Gammell, Jonathan D., Siddhartha S. Srinivasa, and Timothy D. Barfoot. "Informed RRT*: Optimal
+     sampling-based path planning focused via direct sampling of an admissible ellipsoidal heuristic." IROS 2014.
+    """
+    needs_whole_map = True
+
+    def __init__(self, world: WorldGrid, config: dict, init_pose: PoseR2S2, goal_pose: PoseR2S2,
+                 rng: random.Random = None):
+        super(InformedSampler, self).__init__(world, config, init_pose, goal_pose, rng)
+        self._informed_cells = None  # type: np.ndarray
+
+    def update_solution_cost(self, cost: float):
+        if cost >= self.solution_cost:
+            return
+        super(InformedSampler, self).update_solution_cost(cost)
+        x, y = self.world.free_cells_centers()
+        # the goal is admitted within goal_dist_tolerance, widen the ellipse accordingly
+        c_best = self.solution_cost + self.config.get('goal_dist_tolerance', 0.)
+        heuristic = np.hypot(x - self.init_pose.x, y - self.init_pose.y) + np.hypot(x - self.goal_pose.x,
+                                                                                  y - self.goal_pose.y)
+        informed_cells = self.world.free_cells[heuristic <= c_best]
+        if len(informed_cells) > 0:
+            self._informed_cells = informed_cells
+
+    def sample(self) -> PoseR2S2:
+        if self._informed_cells is None:
+            return self.world.get_random_free_pose(rng=self.rng)
+        return self.world.get_random_free_pose(self._informed_cells, self.rng)
+
+
+class HeuristicSampler(FreeSpaceSampler):
+    """
+    Free space sampler guided by the world cost-to-go field (see WorldGrid.build_cost_to_go).
+    With probability corridor_bias the sample is drawn from the free cells lying up to corridor_lookahead
+    meters further down the corridor than the frontier (the tree node with the least cost-to-go),
+    and is headed along the descent direction of the field.
+    """
+    needs_whole_map = True
+
+    def __init__(self, world: WorldGrid, config: dict, init_pose: PoseR2S2, goal_pose: PoseR2S2,
+                 rng: random.Random = None):
+        super(HeuristicSampler, self).__init__(world, config, init_pose, goal_pose, rng)
+        assert world.cost_to_go is not None, 'HeuristicSampler requires cost_to_go to be enabled'
+        self.corridor_bias = config.get('corridor_bias', 0.3)
+        self.corridor_lookahead = config.get('corridor_lookahead', 5.0)
+        self.corridor_radius = config.get('corridor_radius', 10.0)
+        cost_to_go = world.cost_to_go.ravel()
+        reachable = self.world.free_cells[np.isfinite(cost_to_go[self.world.free_cells])]
+        order = np.argsort(cost_to_go[reachable], kind='stable')
+        self._sorted_cells = reachable[order]
+        self._sorted_costs = cost_to_go[self._sorted_cells]
+        grad_y, grad_x = np.gradient(np.where(np.isfinite(world.cost_to_go), world.cost_to_go, 0.))
+        self._descent_heading = np.arctan2(-grad_y, -grad_x).ravel()
+        self.frontier_pose = init_pose
+        self.frontier_cost = world.cost_to_go_at(init_pose.x, init_pose.y)
+
+    def update_frontier(self, pose: PoseR2S2):
+        cost = self.world.cost_to_go_at(pose.x, pose.y)
+        if cost < self.frontier_cost:
+            self.frontier_cost = cost
+            self.frontier_pose = pose
+
+    def sample(self) -> PoseR2S2:
+        if self.rng.uniform(0, 1) > self.corridor_bias or not np.isfinite(self.frontier_cost):
+            return self.world.get_random_free_pose(rng=self.rng)
+        first = np.searchsorted(self._sorted_costs, self.frontier_cost - self.corridor_lookahead)
+        last = np.searchsorted(self._sorted_costs, self.frontier_cost, side='right')
+        band = self._sorted_cells[first:last]
+        if len(band) == 0:
+            return self.world.get_random_free_pose(rng=self.rng)
+        # prefer the cells of the band close to the frontier node (the band may span other branches of a maze)
+        for i in range(20):
+            pose = self.world.get_random_free_pose(band, self.rng)
+            if pose.distance_2d(self.frontier_pose) < self.corridor_radius:
+                break
+        cell = self.world.y_to_iy(pose.y) * self.world.iwidth + self.world.x_to_ix(pose.x)
+        pose.theta = self._descent_heading[cell] + self.rng.gauss(0., 0.2)
+        return pose
+
+
+class SamplerFactory(object):
+    @staticmethod
+    def get_sampler_class(config: dict):
+        module_name = config.get('sampler_module', 'prrt.sampler')
+        class_name = config.get('sampler_class', 'UniformSampler')
+        sampler_module = __import__(module_name, fromlist=[class_name])
+        return getattr(sampler_module, class_name)  # type: Type[Sampler]
+
+    @staticmethod
+    def build_sampler(config: dict, world: WorldGrid, init_pose: PoseR2S2, goal_pose: PoseR2S2,
+                      rng: random.Random = None) -> Sampler:
+        sampler_class = SamplerFactory.get_sampler_class(config)
+        return sampler_class(world, config, init_pose, goal_pose, rng)
@@ -0,0 +1,209 @@
+import time
+from typing import List
+import numpy as np
+import prrt.helper as helper
+from prrt.grid import WorldGrid
+from prrt.primitive import PoseArray, PoseR2S2
+from prrt.ptg import PTG, APTG
+
+
+class ShortcutReport(object):
+    """
+    Outcome of PathShortcutter.shortcut()
+    """
+
+    def __init__(self):
+        self.segments_before = 0
+        self.segments_after = 0
+        self.length_before = 0.  # R2 length of the path (m), as PlannerResult.path_length
+        self.length_after = 0.
+        self.shortcuts = 0  # number of edge chains replaced by a single edge
+
+    @property
+    def segments_removed(self) -> int:
+        return self.segments_before - self.segments_after
+
+    @property
+    def length_removed(self) -> float:
+        return self.length_before - self.length_after
+
+    def __str__(self):
+        return 'Shortcut {0} chains: {1} -> {2} segments, {3:.2f} m -> {4:.2f} m'.format(
+            self.shortcuts, self.segments_before, self.segments_after, self.length_before, self.length_after)
+
+
+class PathShortcutter(object):
+    """
+    Post-processes a solution branch by replacing chains of edges with single PTG trajectories.
+    From each node of the path, the farthest later node reachable by one collision free trajectory is
+    connected directly. A trajectory is accepted if it ends within shortcut_dist_tolerance (m),
+    shortcut_ang_tolerance (deg) and shortcut_phi_tolerance (deg) of the later node, and if the rest of the
+    path, driven from the pose actually reached, is still collision free and ends within the same tolerances
+    of the last node. The path then goes on from the reached pose. The last node only needs to be replaced by
+    a pose admitted as goal (goal_dist_tolerance and goal_ang_tolerance, same test as in Planner.solve).
+    Clearance is checked against the PTG obstacle grid: the obstacles around a node are transformed once
+    and give the free distance along every trajectory, which is then shared by all the candidate later nodes.
+    """
+
+    def __init__(self, aptgs: List[APTG], world: WorldGrid, config: dict):
+        self.aptgs = aptgs
+        self.world = world
+        self.obs_R = config['obs_R']
+        self.goal_dist_tolerance = config['goal_dist_tolerance']
+        self.goal_ang_tolerance = config['goal_ang_tolerance']
+        self.dist_tolerance = config.get('shortcut_dist_tolerance', 0.1)
+        self.ang_tolerance = np.radians(config.get('shortcut_ang_tolerance', 2.))
+        self.phi_tolerance = np.radians(config.get('shortcut_phi_tolerance', 2.))
+
+    def free_distances(self, ptg: PTG, pose: PoseR2S2) -> np.ndarray:
+        max_dist = self.obs_R * ptg.distance_ref
+        obstacles_rel = self.world.transform_point_cloud(pose, max_dist)
+        return transform_toTP_obstacles_all(ptg, obstacles_rel, max_dist)
+
+    def inverse_WS2TP_batch(self, from_pose: PoseR2S2, to_poses: List[PoseR2S2]) -> List[tuple]:
+        """
+        Trajectories towards each of to_poses from from_pose, one inverse_WS2TP_batch call per APTG
+        :return: (ptg, is_exact, k) per APTG, is_exact and k arrays over to_poses
+        """
+        rel = PoseArray.from_poses(to_poses) - from_pose
+        inverses = []
+        for aptg in self.aptgs:
+            ptg = aptg.ptg_at_phi(from_pose.phi)
+            is_exact, k, d = ptg.inverse_WS2TP_batch(rel.x, rel.y)
+            inverses.append((ptg, is_exact, k))
+        return inverses
+
+    def connect(self, from_pose: PoseR2S2, to_pose: PoseR2S2, goal_pose: PoseR2S2, free_distances: dict,
+                trajectories: List[tuple]):
+        """
+        Looks along the trajectories around the one given by inverse_WS2TP for a collision free point admitted
+        as to_pose (or as goal if goal_pose is given, the nearest one is taken)
+        :param trajectories: (ptg, is_exact, k) of inverse_WS2TP(to_pose - from_pose) per APTG
+        :return: (ptg, k, d, reached pose), None if there is none
+        """
+        if goal_pose is not None:
+            target = goal_pose
+            dist_tolerance, ang_tolerance, phi_tolerance = self.goal_dist_tolerance, self.goal_ang_tolerance, np.inf
+        else:
+            target = to_pose
+            dist_tolerance, ang_tolerance, phi_tolerance = self.dist_tolerance, self.ang_tolerance, self.phi_tolerance
+        target_rel = target - from_pose
+        for ptg, is_exact, k_target in trajectories:
+            if not is_exact:
+                continue
+            if ptg not in free_distances:
+                free_distances[ptg] = self.free_distances(ptg, from_pose)
+            for k in range(max(0, k_target - 1), min(len(ptg.cpoints), k_target + 2)):
+                cpoints = ptg.get_cpoints_arrays(k)
+                dist = np.hypot(cpoints['x'] - target_rel.x, cpoints['y'] - target_rel.y)
+                ang = np.abs(helper.wrap_to_npi_pi(cpoints['theta'] - target_rel.theta))
+                admitted = (cpoints['d'] <= free_distances[ptg][k]) & (ang <= ang_tolerance) & \
+                           (np.abs(cpoints['phi'] - target.phi) <= phi_tolerance)
+                if goal_pose is not None:
+                    admitted &= dist < dist_tolerance
+                    n = np.argmax(admitted)
+                else:
+                    admitted &= dist <= dist_tolerance
+                    n = np.argmin(np.where(admitted, dist, np.inf))
+                if admitted[n]:
+                    cpoint = ptg.cpoints[k][n]
+                    return ptg, k, cpoint.d, from_pose + cpoint.pose
+        return None
+
+    def follow(self, pose: PoseR2S2, edges: List[tuple], end_pose: PoseR2S2, goal_pose: PoseR2S2):
+        """
+        Drives the (ptg, k, d) edges from pose
+        :return: the poses reached, None if an edge collides or if the last pose is not admitted as end_pose (or
+         as goal if goal_pose is given)
+        """
+        poses = []
+        for ptg, k, d in edges:
+            if self.free_distances(ptg, pose)[k] < d:
+                return None
+            pose = pose + ptg.get_cpoint_at_d(d, k).pose
+            poses.append(pose)
+        if goal_pose is not None:
+            admitted = pose.distance_2d(goal_pose) < self.goal_dist_tolerance and \
+                       abs(helper.angle_distance(pose.theta, goal_pose.theta)) < self.goal_ang_tolerance
+        else:
+            admitted = pose.distance_2d(end_pose) <= self.dist_tolerance and \
+                       abs(helper.angle_distance(pose.theta, end_pose.theta)) <= self.ang_tolerance and \
+                       abs(pose.phi - end_pose.phi) <= self.phi_tolerance
+        return poses if admitted else None
+
+    def shortcut(self, end_node, goal_pose: PoseR2S2 = None, deadline: float = None):
+        """
+        :param end_node: last node of the path (prrt.planner.Node), the tree is not modified
+        :param goal_pose: if given, the last node may be replaced by any pose admitted as goal
+        :param deadline: absolute time (time.perf_counter() clock) after which the rest of the path is kept as is
+        :return: last node of the new path (a chain of new nodes and edges) and the ShortcutReport
+        """
+        from prrt.planner import Node, Edge, Tree
+        branch = Tree.get_branch(end_node)
+        report = ShortcutReport()
+        report.segments_before = len(branch) - 1
+        report.length_before = Tree.get_path_length(end_node)
+        last = len(branch) - 1
+        # the path poses, moved along with the rest of the path when a shortcut ends off an intermediate node
+        poses = [node.pose for node in branch]
+        edges = [None] + [(node.edge.ptg, node.edge.k, node.edge.d) for node in branch[1:]]
+        reach = max(aptg.ptgs[0].distance_ref for aptg in self.aptgs)
+        new_node = Node(branch[0].ptg, branch[0].pose)
+        new_node.id = branch[0].id
+        i = 0
+        while i < last:
+            from_pose = poses[i]
+            # later nodes out of reach of any trajectory are skipped without calling inverse_WS2TP
+            xy = np.array([[pose.x, pose.y] for pose in poses[i + 2:]]).reshape(-1, 2)
+            distances = np.hypot(xy[:, 0] - from_pose.x, xy[:, 1] - from_pose.y)
+            candidates = (i + 2 + np.flatnonzero(distances <= reach)).tolist()
+            if deadline is not None and time.perf_counter() >= deadline:
+                candidates = []
+            # the last node is looked up at its original pose, a goal pose
+            targets = [branch[j].pose if j == last else poses[j] for j in candidates]
+            inverses = self.inverse_WS2TP_batch(from_pose, targets) if len(candidates) > 0 else []
+            free_distances = {}  # free distance per trajectory of each ptg, computed on first use
+            connection = None
+            tail = None
+            j = i + 1
+            for c in range(len(candidates) - 1, -1, -1):
+                j = candidates[c]
+                connection = self.connect(from_pose, targets[c], goal_pose if j == last else None, free_distances,
+                                          [(ptg, is_exact[c], k[c]) for ptg, is_exact, k in inverses])
+                if connection is None:
+                    continue
+                if j == last:
+                    break
+                # the path goes on from the reached pose, the rest of it must still be valid from there
+                tail = self.follow(connection[3], edges[j + 1:], branch[last].pose, goal_pose)
+                if tail is not None:
+                    break
+                connection = None
+            if connection is None:
+                j = i + 1
+                ptg, k, d = edges[j]
+                connection = (ptg, k, d, poses[j])
+            else:
+                report.shortcuts += 1
+                poses[j] = connection[3]
+                if tail is not None:
+                    poses[j + 1:] = tail
+            ptg, k, d, reached = connection
+            child = Node(ptg, reached, new_node)
+            child.id = branch[j].id
+            child.edge = Edge(ptg, k, d, new_node, reached)
+            child.edge.child = child
+            new_node.edges_to_child.append(child.edge)
+            new_node = child
+            report.segments_after += 1
+            i = j
+        report.length_after = Tree.get_path_length(new_node)
+        return new_node, report
+
+
+def transform_toTP_obstacles_all(ptg: PTG, obstacles_ws: np.ndarray, max_dist: float) -> np.ndarray:
+    """
+    Same as Planner.transform_toTP_obstacles but for every trajectory k at once
+    :return: free distance along each trajectory of the ptg
+    """
+    return ptg.obstacle_grid.free_distances(obstacles_ws, max_dist, len(ptg.cpoints), ptg.distance_ref)
@@ -0,0 +1,116 @@
+from typing import List
+import numpy as np
+from prrt.primitive import PoseR2S2, PoseArray
+
+
+class Solution(object):
+    """
+    Trajectory from the tree root to a given node, sampled every step meters along each edge.
+    Samples are held as numpy arrays (one entry per sample) so they can be exported in bulk.
+    """
+    COLUMNS = ('x', 'y', 'theta', 'phi', 'v', 'w')
+
+    def __init__(self):
+        self.poses = []  # type: List[PoseR2S2]  # nodes poses, root first
+        self.node_ids = np.empty(0, dtype=int)  # node ids, root first
+        self.ptg_names = []  # type: List[str]  # name of the PTG of each edge
+        self.edge_idx = np.empty(0, dtype=int)  # edge index of each sample
+        self.parent_id = np.empty(0, dtype=int)  # id of the parent node of the edge of each sample
+        self.k = np.empty(0, dtype=int)  # trajectory index of each sample
+        self.d = np.empty(0)  # distance along the edge of each sample
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.theta = np.empty(0)
+        self.phi = np.empty(0)
+        self.v = np.empty(0)
+        self.w = np.empty(0)
+
+    @staticmethod
+    def from_node(end_node, step: float = 0.2) -> 'Solution':
+        """
+        Builds the solution by following the parent links from end_node up to the root
+        :param end_node: prrt.planner.Node, the last node of the solution
+        :param step: sampling step along each edge (m)
+        """
+        branch = []
+        node = end_node
+        while node is not None:
+            branch.append(node)
+            node = node.parent
+        branch.reverse()
+        solution = Solution()
+        solution.poses = [node.pose for node in branch]
+        solution.node_ids = np.array([node.id for node in branch], dtype=int)
+        columns = {name: [] for name in ('edge_idx', 'parent_id', 'k', 'd') + Solution.COLUMNS}
+        for edge_idx, node in enumerate(branch[1:]):
+            edge = node.edge
+            solution.ptg_names.append(edge.ptg.name)
+            d = np.arange(0., edge.d, step)
+            idx = edge.ptg.get_cpoints_idx_at_d(d, edge.k)
+            cpoints = edge.ptg.get_cpoints_arrays(edge.k)
+            poses = PoseArray.from_poses([edge.parent.pose]) + PoseArray.from_columns(
+                cpoints['x'][idx], cpoints['y'][idx], cpoints['theta'][idx], cpoints['phi'][idx])
+            for name in ('x', 'y', 'theta'):
+                columns[name].append(getattr(poses, name))
+            for name in ('phi', 'v', 'w'):
+                columns[name].append(cpoints[name][idx])
+            columns['d'].append(d)
+            columns['k'].append(np.full(len(d), edge.k, dtype=int))
+            columns['edge_idx'].append(np.full(len(d), edge_idx, dtype=int))
+            columns['parent_id'].append(np.full(len(d), edge.parent.id, dtype=int))
+        for name, values in columns.items():
+            if len(values) > 0:
+                setattr(solution, name, np.concatenate(values))
+        return solution
+
+    @property
+    def length(self) -> float:
+        # R2 length of the polyline connecting the nodes
+        xy = np.array([[pose.x, pose.y] for pose in self.poses])
+        if len(xy) < 2:
+            return 0.
+        return float(np.sum(np.hypot(*np.diff(xy, axis=0).T)))
+
+    @property
+    def samples_count(self) -> int:
+        return len(self.x)
+
+    def to_csv(self, file_name: str):
+        """
+        One row per sample: PTG name, parent node id, x, y, theta, phi, v, w
+        """
+        names = np.array(self.ptg_names, dtype=object)[self.edge_idx] if self.samples_count > 0 else []
+        values = np.column_stack([getattr(self, name) for name in self.COLUMNS])
+        rows = ['{0},{1},'.format(name, parent_id) + ','.join('{0:+.4f}'.format(value) for value in row)
+                for name, parent_id, row in zip(names, self.parent_id.tolist(), values.tolist())]
+        with open(file_name, 'w', newline='') as f:
+            f.write(''.join(row + '\r\n' for row in rows))
+
+    def to_columns(self) -> dict:
+        columns = {name: getattr(self, name) for name in ('edge_idx', 'parent_id', 'k', 'd') + self.COLUMNS}
+        columns['ptg_name'] = np.array(self.ptg_names, dtype=str)[self.edge_idx] if self.samples_count > 0 else \
+            np.empty(0, dtype=str)
+        return columns
+
+    def to_npz(self, file_name: str):
+        columns = self.to_columns()
+        columns['node_ids'] = self.node_ids
+        columns['node_poses'] = np.array([[pose.x, pose.y, pose.theta, pose.phi] for pose in self.poses])
+        np.savez(file_name, **columns)
+
+    def to_parquet(self, file_name: str):
+        # requires the optional pyarrow package
+        import pyarrow
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(pyarrow.table(self.to_columns()), file_name)
+
+    def export(self, file_name: str):
+        """
+        Saves the solution, the format is selected by the file extension (.csv, .npz or .parquet)
+        """
+        if file_name.endswith('.npz'):
+            self.to_npz(file_name)
+        elif file_name.endswith('.parquet'):
+            self.to_parquet(file_name)
+        else:
+            self.to_csv(file_name)
@@ -0,0 +1,289 @@
+import json
+import random
+import struct
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+from prrt.grid import WorldGrid, image_to_omap
+from prrt.png import iter_png_rows, png_size
+from prrt.primitive import PoseR2S2
+
+# Tiled occupancy maps, for site maps too large to be held in memory as images.
+# File layout: MAGIC, header length (uint32), json header, the occupied cells count of each tile (tiles_y x tiles_x
+# int32), then the tiles row by row. A tile holds tile_size x tile_size occupancy bits packed row by row, most
+# significant bit first. Cells past the map edges are free.
+MAGIC = b'PRRTMAP1'
+HEADER_LENGTH = struct.Struct('<I')
+TILED_MAP_EXTENSION = '.tmap'
+
+
+def convert_png_to_tiled_map(png_file: str, tiled_file: str, tile_size=256) -> dict:
+    """
+    Converts a png map to the tiled format, the png is decoded by strips of tile_size rows so that the whole image
+    is never held in memory. The occupancy is the same as WorldGrid's omap.
+    :param tile_size: tile side in cells, a multiple of 8
+    :return: the tiled map header
+    """
+    assert tile_size > 0 and tile_size % 8 == 0, 'tile_size must be a multiple of 8'
+    width, height = png_size(png_file)
+    header = {'width': width,
+              'height': height,
+              'tile_size': tile_size,
+              'tiles_x': -(-width // tile_size),
+              'tiles_y': -(-height // tile_size),
+              'source': str(Path(png_file).resolve())}
+    header_bytes = json.dumps(header).encode('utf-8')
+    counts = np.zeros((header['tiles_y'], header['tiles_x']), dtype='<i4')
+    with open(tiled_file, 'wb') as f:
+        f.write(MAGIC + HEADER_LENGTH.pack(len(header_bytes)) + header_bytes)
+        counts_offset = f.tell()
+        f.write(counts.tobytes())  # filled in once all the tiles are written
+        for ty, rows in enumerate(iter_png_rows(png_file, tile_size)):
+            strip = np.zeros((tile_size, header['tiles_x'] * tile_size), dtype=bool)
+            strip[:len(rows), :width] = image_to_omap(rows)
+            tiles = strip.reshape(tile_size, header['tiles_x'], tile_size).transpose(1, 0, 2)
+            counts[ty] = np.count_nonzero(tiles, axis=(1, 2))
+            f.write(np.packbits(tiles, axis=2).tobytes())
+        f.seek(counts_offset)
+        f.write(counts.tobytes())
+    return header
+
+
+def open_tiled_map(file_name: str, mode='c') -> (dict, np.memmap, np.memmap):
+    """
+    Memory maps a tiled map, the default copy on write mode allows changes that are never written back to the file
+    :return: the header, the (tiles_y, tiles_x) occupied cells counts and the (tiles_y, tiles_x, tile_size,
+     tile_size / 8) packed tiles
+    """
+    with open(file_name, 'rb') as f:
+        assert f.read(len(MAGIC)) == MAGIC, '{0} is not a tiled map'.format(file_name)
+        header_length, = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    offset = len(MAGIC) + HEADER_LENGTH.size + header_length
+    shape = (header['tiles_y'], header['tiles_x'])
+    counts = np.memmap(file_name, dtype='<i4', mode=mode, offset=offset, shape=shape)
+    tile_size = header['tile_size']
+    tiles = np.memmap(file_name, dtype=np.uint8, mode=mode, offset=offset + counts.nbytes,
+                      shape=shape + (tile_size, tile_size // 8))
+    return header, counts, tiles
+
+
+class TiledWorldGrid(WorldGrid):
+    """
+    World grid backed by a memory mapped tiled map (see convert_png_to_tiled_map). Queries only read the tiles
+    around the queried positions: the obstacle points of a tile are built on first use and kept in an LRU cache,
+    cell lookups read the packed bits directly. Obstacle regions added or removed at run time only change the
+    copy on write mapping, the file is left as is.
+    The cost-to-go field and the informed and heuristic samplers need the whole occupancy map and are not
+    available, Planner.setup rejects them.
+    """
+    whole_map = False
+    tile_cache_size = 64  # tiles whose obstacle points are kept in memory
+
+    def __init__(self, map_file: str, width: float, height: float):
+        file_path = Path(map_file)
+        assert file_path.exists(), FileExistsError
+        self.map_file = str(file_path.resolve())
+        self.map_key = self.map_file  # identifies the map content in caches
+        self.header, self._counts, self._tiles = open_tiled_map(self.map_file)
+        self.tile_size = self.header['tile_size']
+        self.tiles_x = self.header['tiles_x']
+        self.tiles_y = self.header['tiles_y']
+        self.min_ix = 0
+        self.min_iy = 0
+        self.max_ix = self.header['width'] - 1
+        self.max_iy = self.header['height'] - 1
+        self.iwidth = self.max_ix - self.min_ix + 1
+        self.iheight = self.max_iy - self.min_iy + 1
+        self.width = width
+        self.height = height
+        self.x_resolution = self.width / self.iwidth
+        self.y_resolution = self.height / self.iheight
+        self.omap = None  # the occupancy is only read by tiles
+        self._obstacle_buffer = []
+        self.free_cells = None  # type: np.ndarray
+        self.cost_to_go = None  # type: np.ndarray
+        self._tile_obstacles = OrderedDict()  # (tx, ty) -> 2xN obstacle points
+        self._window = (None, None)  # tiles range and obstacle points of the last transform_point_cloud
+        self._free_cells_cumsum = None  # type: np.ndarray  # free cells count of the tiles, cumulated
+        self._edits = []  # regions changed at run time, replayed when unpickled
+
+    def __getstate__(self):
+        # the mappings are opened again when unpickled, the caches are rebuilt on use
+        state = self.__dict__.copy()
+        for key in ('_counts', '_tiles', '_tile_obstacles', '_window', '_free_cells_cumsum'):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        _, self._counts, self._tiles = open_tiled_map(self.map_file)
+        self._tile_obstacles = OrderedDict()
+        self._window = (None, None)
+        self._free_cells_cumsum = None
+        for occupied, region in self._edits:
+            self._set_region(*region, occupied)
+
+    def tile_occupancy(self, tx: int, ty: int) -> np.ndarray:
+        """
+        :return: (tile_size, tile_size) bool array, cells past the map edges are free
+        """
+        return np.unpackbits(self._tiles[ty, tx], axis=1).view(bool)
+
+    def tile_valid_size(self, tx: int, ty: int) -> (int, int):
+        """
+        :return: number of columns and rows of the tile that lie within the map
+        """
+        return min(self.tile_size, self.iwidth - tx * self.tile_size), min(self.tile_size,
+                                                                           self.iheight - ty * self.tile_size)
+
+    def tile_obstacles(self, tx: int, ty: int) -> np.ndarray:
+        """
+        :return: 2xN coordinates of the occupied cells corners of the tile (obstacle buffer format)
+        """
+        if self._counts[ty, tx] == 0:
+            return np.zeros((2, 0))
+        key = (tx, ty)
+        cache = self._tile_obstacles
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        iy, ix = np.nonzero(self.tile_occupancy(tx, ty))
+        obstacles = np.array([self.idx_to_x(ix + tx * self.tile_size), self.idx_to_y(iy + ty * self.tile_size)],
+                             dtype=float)
+        cache[key] = obstacles
+        if len(cache) > self.tile_cache_size:
+            cache.popitem(last=False)
+        return obstacles
+
+    def tiles_in_region(self, x_min: float, y_min: float, x_max: float, y_max: float) -> (int, int, int, int):
+        """
+        :return: tx_min, ty_min, tx_max, ty_max (inclusive) of the tiles covering the region (m), clipped to the map,
+         None if the region is outside the map
+        """
+        cells = self.region_to_idx(x_min, y_min, x_max, y_max)
+        if cells is None:
+            return None
+        ix_min, iy_min, ix_max, iy_max = cells
+        return (ix_min // self.tile_size, iy_min // self.tile_size, ix_max // self.tile_size,
+                iy_max // self.tile_size)
+
+    def transform_point_cloud(self, ref_pose: PoseR2S2, max_dist):
+        tiles = self.tiles_in_region(ref_pose.x - max_dist, ref_pose.y - max_dist, ref_pose.x + max_dist,
+                                     ref_pose.y + max_dist)
+        if tiles is None:
+            return np.zeros((2, 0))
+        if tiles != self._window[0]:
+            tx_min, ty_min, tx_max, ty_max = tiles
+            points = [self.tile_obstacles(tx, ty) for ty in range(ty_min, ty_max + 1)
+                      for tx in range(tx_min, tx_max + 1)]
+            self._window = (tiles, np.hstack(points))
+        return self.transform_points(self._window[1], ref_pose, max_dist)
+
+    @property
+    def obstacles(self) -> np.ndarray:
+        # 2xN coordinates of the occupied cells corners, this reads the whole map
+        return np.hstack([self.tile_obstacles(tx, ty) for ty in range(self.tiles_y) for tx in range(self.tiles_x)])
+
+    def build_obstacle_buffer(self):
+        # the obstacle points are built per tile on first use, see tile_obstacles
+        pass
+
+    def points_occupied(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        inside = (x >= 0.) & (x < self.width) & (y >= 0.) & (y < self.height)
+        ix = np.minimum((x[inside] / self.x_resolution).astype(int), self.max_ix)
+        iy = np.minimum((y[inside] / self.y_resolution).astype(int), self.max_iy)
+        ts = self.tile_size
+        packed = self._tiles[iy // ts, ix // ts, iy % ts, (ix % ts) >> 3]
+        occupied = np.zeros(len(x), dtype=bool)
+        occupied[inside] = (packed >> (7 - (ix & 7))) & 1 == 1  # tile_size is a multiple of 8
+        return occupied
+
+    @property
+    def map_32bit(self) -> np.ndarray:
+        return self.preview()
+
+    def preview(self, max_size=2048) -> np.ndarray:
+        """
+        Occupancy image of the map for plotting (obstacles in black), subsampled to at most max_size cells per side
+        :return: (rows, columns, 4) RGBA float32 array
+        """
+        step = max(1, -(-max(self.iwidth, self.iheight) // max_size))
+        strips = []
+        for ty in range(self.tiles_y):
+            strip = np.hstack([self.tile_occupancy(tx, ty) for tx in range(self.tiles_x)])
+            first = -(ty * self.tile_size) % step  # keeps the rows at multiples of step
+            strips.append(strip[first:min(self.tile_size, self.iheight - ty * self.tile_size):step,
+                                :self.iwidth:step])
+        free = ~np.vstack(strips)
+        image = np.ones(free.shape + (4,), dtype=np.float32)
+        image[..., :3] = free[..., None]
+        return image
+
+    def build_free_space_index(self):
+        if self._free_cells_cumsum is None:
+            valid = [np.prod(self.tile_valid_size(tx, ty)) for ty in range(self.tiles_y) for tx in range(self.tiles_x)]
+            self._free_cells_cumsum = np.cumsum(np.array(valid) - np.ravel(self._counts))
+
+    def get_random_free_pose(self, cells: np.ndarray = None, rng=random) -> PoseR2S2:
+        """
+        Samples a pose uniformly over the free cells: a tile is drawn in proportion to its free cells count, then a
+        free cell within the tile
+        """
+        assert cells is None, 'cells subsets are not available on tiled maps'
+        self.build_free_space_index()
+        n = rng.randrange(int(self._free_cells_cumsum[-1]))
+        tile = int(np.searchsorted(self._free_cells_cumsum, n, side='right'))
+        if tile > 0:
+            n -= int(self._free_cells_cumsum[tile - 1])
+        ty, tx = divmod(tile, self.tiles_x)
+        valid_x, valid_y = self.tile_valid_size(tx, ty)
+        free = ~self.tile_occupancy(tx, ty)[:valid_y, :valid_x]
+        iy, ix = divmod(int(np.flatnonzero(free)[n]), valid_x)
+        x = self.idx_to_x(ix + tx * self.tile_size) + rng.uniform(0, self.x_resolution)
+        y = self.idx_to_y(iy + ty * self.tile_size) + rng.uniform(0, self.y_resolution)
+        theta = rng.uniform(-np.pi, np.pi)
+        return PoseR2S2(x, y, theta)
+
+    def _set_region(self, ix_min: int, iy_min: int, ix_max: int, iy_max: int, occupied: bool) -> np.ndarray:
+        """
+        Sets the occupancy of the cells range (inclusive)
+        :return: 2xN coordinates of the cells whose occupancy changed (obstacle buffer format)
+        """
+        ts = self.tile_size
+        changed = []
+        for ty in range(iy_min // ts, iy_max // ts + 1):
+            for tx in range(ix_min // ts, ix_max // ts + 1):
+                tile = self.tile_occupancy(tx, ty)
+                x0 = max(ix_min - tx * ts, 0)
+                y0 = max(iy_min - ty * ts, 0)
+                region = tile[y0:min(iy_max - ty * ts, ts - 1) + 1, x0:min(ix_max - tx * ts, ts - 1) + 1]
+                iy, ix = np.nonzero(region != occupied)
+                if len(ix) == 0:
+                    continue
+                region[:] = occupied
+                self._tiles[ty, tx] = np.packbits(tile, axis=1)
+                self._counts[ty, tx] += len(ix) if occupied else -len(ix)
+                self._tile_obstacles.pop((tx, ty), None)
+                changed.append([self.idx_to_x(ix + x0 + tx * ts), self.idx_to_y(iy + y0 + ty * ts)])
+        self._window = (None, None)
+        self._free_cells_cumsum = None
+        return np.hstack(changed) if len(changed) > 0 else np.zeros((2, 0))
+
+    def add_obstacle_region(self, x_min: float, y_min: float, x_max: float, y_max: float) -> np.ndarray:
+        region = self.region_to_idx(x_min, y_min, x_max, y_max)
+        if region is None:
+            return np.zeros((2, 0))
+        self._edits.append((True, region))
+        new_obstacles = self._set_region(*region, True)
+        self._map_changed()
+        return new_obstacles
+
+    def remove_obstacle_region(self, x_min: float, y_min: float, x_max: float, y_max: float) -> np.ndarray:
+        region = self.region_to_idx(x_min, y_min, x_max, y_max)
+        if region is None:
+            return np.zeros((2, 0))
+        self._edits.append((False, region))
+        freed = self._set_region(*region, False)
+        self._map_changed()
+        return freed
@@ -1,5 +1,6 @@
 from prrt.primitive import PointR2, PoseR2S2
 from typing import List
+import numpy as np
 from math import cos, sin, tan, pi as PI, radians as rad
 from prrt.grid import WorldGrid
 from prrt.helper import wrap_to_npi_pi
@@ -54,6 +55,9 @@ class ArticulatedVehicle(object):
         p9 = self.last_hitch_pose.compose_point(PointR2(-self.trailer_l, -self.trailer_w / 2.))
         self.shape = (*self.shape[:6], p6, p7, p8, p9)
 
+    def half_width(self) -> float:
+        return max(self.tractor_w, self.trailer_w) / 2.
+
     def get_vertex(self, idx: int) -> PointR2:
         return self.shape[idx]
 
@@ -81,6 +85,41 @@ class ArticulatedVehicle(object):
     def get_trailer_vertices_at_pose(self, pose: PoseR2S2) -> List[PointR2]:
         return self.get_vertices_at_pose(pose)[6:10]
 
+    # vertices of the tractor and trailer rectangles in the shape (see the vertices numbering above)
+    tractor_vertices = slice(0, 4)
+    trailer_vertices = slice(6, 10)
+
+    def local_vertices(self, phi: np.ndarray) -> np.ndarray:
+        """
+        Vertices in the vehicle frame for each articulation angle
+        :return: (len(phi), vertices count, 2) array
+        """
+        tractor = np.array([(self.tractor_l / 2., -self.tractor_w / 2.), (self.tractor_l / 2., self.tractor_w / 2.),
+                            (-self.tractor_l / 2., self.tractor_w / 2.), (-self.tractor_l / 2., -self.tractor_w / 2.),
+                            (-self.tractor_l / 2., 0.), (-self.tractor_l / 2. - self.link_l, 0.)])
+        trailer = np.array([(0., -self.trailer_w / 2.), (0., self.trailer_w / 2.),
+                            (-self.trailer_l, self.trailer_w / 2.), (-self.trailer_l, -self.trailer_w / 2.)])
+        # the trailer turns by -phi around the hitch (vertex 5)
+        trailer = rotate_points(trailer, -phi) + tractor[5]
+        return np.concatenate((np.broadcast_to(tractor, (len(phi),) + tractor.shape), trailer), axis=1)
+
+    def vertices_at_poses(self, x: np.ndarray, y: np.ndarray, theta: np.ndarray, phi: np.ndarray) -> np.ndarray:
+        """
+        Batch version of get_vertices_at_pose. Doesn't use nor update self.shape, so it's safe to call from
+        several threads.
+        :return: (poses count, vertices count, 2) array, vertices numbered as in self.shape
+        """
+        x, y, theta, phi = np.broadcast_arrays(*(np.atleast_1d(np.asarray(a, dtype=float)) for a in (x, y, theta, phi)))
+        return rotate_points(self.local_vertices(phi), theta) + np.stack((x, y), axis=-1)[:, None, :]
+
+    def tractor_vertices_at_poses(self, x: np.ndarray, y: np.ndarray, theta: np.ndarray,
+                                  phi: np.ndarray) -> np.ndarray:
+        return self.vertices_at_poses(x, y, theta, phi)[:, self.tractor_vertices]
+
+    def trailer_vertices_at_poses(self, x: np.ndarray, y: np.ndarray, theta: np.ndarray,
+                                  phi: np.ndarray) -> np.ndarray:
+        return self.vertices_at_poses(x, y, theta, phi)[:, self.trailer_vertices]
+
     def execute_motion(self, pose: PoseR2S2, v: float, w: float, dt: float) -> PoseR2S2:
         if v >= 0.:
             new_pose = self._sim_move_forward(pose, v, w, dt)
@@ -140,19 +179,8 @@ class ArticulatedVehicle(object):
 
 
     def plot(self, axes, pose, color='b'):
-        vertices = self.get_vertices_at_pose(pose)
-        for j in range(len(vertices) - 1):
-            a = vertices[j]
-            b = vertices[j + 1]
-            axes.plot([a.x, b.x], [a.y, b.y], color)
-
-        a = vertices[3]
-        b = vertices[0]
-        axes.plot([a.x, b.x], [a.y, b.y], color)
-
-        a = vertices[9]
-        b = vertices[6]
-        axes.plot([a.x, b.x], [a.y, b.y], color)
+        import prrt.visualization as visualization  # matplotlib is only loaded when plotting
+        visualization.plot_vehicle(axes, self, pose, color)
 
 """" # this function should not be necessary anymore !
     def plot(self, axes, pose, world: WorldGrid, color='b'):
@@ -251,6 +279,20 @@ class ArticulatedVehicleB(ArticulatedVehicle):
     def get_tractor_vertices_at_pose(self, pose: PoseR2S2) -> List[PointR2]:
         return self.get_vertices_at_pose(pose)[6:10]
 
+    tractor_vertices = slice(6, 10)
+    trailer_vertices = slice(0, 4)
+
+    def local_vertices(self, phi: np.ndarray) -> np.ndarray:
+        # the trailer turns by -phi around the origin, the tractor keeps the vehicle heading
+        trailer = np.array([(0., self.trailer_w / 2.), (0., -self.trailer_w / 2.),
+                            (self.trailer_l, -self.trailer_w / 2.), (self.trailer_l, self.trailer_w / 2.),
+                            (self.trailer_l, 0.), (self.trailer_l + self.link_l, 0.)])
+        tractor = np.array([(0., -self.tractor_w / 2.), (self.tractor_l, -self.tractor_w / 2.),
+                            (self.tractor_l, self.tractor_w / 2.), (0., self.tractor_w / 2.)])
+        trailer = rotate_points(trailer, -phi)
+        tractor = tractor + trailer[:, 5:6, :]
+        return np.concatenate((trailer, tractor), axis=1)
+
     def execute_motion(self, pose: PoseR2S2, v: float, w: float, dt: float) -> PoseR2S2:
         theta1 = pose.theta
         theta2 = wrap_to_npi_pi(theta1 - pose.phi)
@@ -300,6 +342,9 @@ class Car(ArticulatedVehicle):
         p3 = o.compose_point(PointR2(0, self.tractor_w / 2.))
         self.shape = (p0, p1, p2, p3)
 
+    def half_width(self) -> float:
+        return self.tractor_w / 2.
+
     def get_vertices_at_pose(self, pose: PoseR2S2) -> List[PointR2]:
         self.update_shape(pose)
         return self.shape
@@ -310,6 +355,14 @@ class Car(ArticulatedVehicle):
     def get_tractor_vertices_at_pose(self, pose: PoseR2S2) -> List[PointR2]:
         return self.get_vertices_at_pose(pose)
 
+    tractor_vertices = slice(0, 4)
+    trailer_vertices = slice(0, 0)
+
+    def local_vertices(self, phi: np.ndarray) -> np.ndarray:
+        tractor = np.array([(0., -self.tractor_w / 2.), (self.tractor_l, -self.tractor_w / 2.),
+                            (self.tractor_l, self.tractor_w / 2.), (0., self.tractor_w / 2.)])
+        return np.broadcast_to(tractor, (len(phi),) + tractor.shape)
+
     def execute_motion(self, pose: PoseR2S2, v: float, w: float, dt: float) -> PoseR2S2:
         x_new = pose.x + dt * v * cos(pose.theta)
         y_new = pose.y + dt * v * sin(pose.theta)
@@ -317,6 +370,18 @@ class Car(ArticulatedVehicle):
         return PoseR2S2(x_new, y_new, theta_new)
 
 
+def rotate_points(points: np.ndarray, angle: np.ndarray) -> np.ndarray:
+    """
+    Rotates points (..., 2) by each angle
+    :return: (len(angle), points count, 2) array
+    """
+    cos_a = np.cos(angle)[:, None]
+    sin_a = np.sin(angle)[:, None]
+    x = points[..., 0]
+    y = points[..., 1]
+    return np.stack((x * cos_a - y * sin_a, x * sin_a + y * cos_a), axis=-1)
+
+
 class ArticulatedVehicleFactory(object):
     @staticmethod
     def build_av(config: dict) -> ArticulatedVehicle:
@@ -0,0 +1,187 @@
+import multiprocessing
+import shutil
+import subprocess
+from typing import List
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from PIL import Image
+from prrt.grid import WorldGrid
+from prrt.primitive import PoseR2S2
+from prrt.ptg import PTG
+from prrt.vehicle import ArticulatedVehicle
+
+# Plotting layer, the planning modules import it on first use only so that a headless worker
+# never loads matplotlib.
+
+
+def vehicle_segment_pairs(vertices_count: int) -> np.ndarray:
+    """
+    Pairs of vertex indices forming the outline drawn for a vehicle shape (see the vertices numbering in vehicle.py)
+    """
+    if vertices_count == 10:
+        # tractor, link and trailer drawn as one polyline, closing the tractor and trailer rectangles
+        pairs = [(j, j + 1) for j in range(9)] + [(3, 0), (9, 6)]
+    else:
+        pairs = [(j, (j + 1) % vertices_count) for j in range(vertices_count)]
+    return np.array(pairs, dtype=int)
+
+
+def vehicle_segments(vehicle: ArticulatedVehicle, x: np.ndarray, y: np.ndarray, theta: np.ndarray,
+                     phi: np.ndarray) -> np.ndarray:
+    """
+    Outline of the vehicle at each of the given poses
+    :return: (poses count, segments count, 2, 2) array of segment end points, as expected by LineCollection
+    """
+    vertices = vehicle.vertices_at_poses(x, y, theta, phi)
+    pairs = vehicle_segment_pairs(vertices.shape[1])
+    return vertices[:, pairs, :]
+
+
+def plot_vehicle(axes, vehicle: ArticulatedVehicle, pose: PoseR2S2, color='b'):
+    segments = vehicle_segments(vehicle, np.array([pose.x]), np.array([pose.y]), np.array([pose.theta]),
+                                np.array([pose.phi]))[0]
+    for (a_x, a_y), (b_x, b_y) in segments:
+        axes.plot([a_x, b_x], [a_y, b_y], color)
+
+
+def plot_trajectories(axes, ptg: PTG):
+    for k in range(len(ptg.cpoints)):
+        cpoints = ptg.get_cpoints_arrays(k)
+        alpha = np.degrees(ptg.cpoints[k][0].alpha)
+        axes.plot(cpoints['x'], cpoints['y'], label=r'$\alpha = {0:.1f}^\circ$'.format(alpha))
+    axes.legend(loc='upper left', shadow=True)
+
+
+def setup_world_axes(world: WorldGrid, goal: PoseR2S2 = None, goal_dist_tolerance=1.0, figsize=None):
+    """
+    Figure showing the world map, the goal and the goal tolerance circle
+    """
+    fig, ax = plt.subplots(figsize=figsize)
+    # the map is flipped as the y axis is inverted by the extent below
+    ax.imshow(np.fliplr(world.map_32bit), extent=(world.width, 0.0, world.height, 0.0), zorder=-1)
+    ax.set_xlabel('x(m)', fontsize=20)
+    ax.set_ylabel('y(m)', fontsize=20)
+    ax.set_ylim(0, world.height)
+    ax.set_xlim(0, world.width)
+    if goal is not None:
+        ax.add_artist(plt.Circle((goal.x, goal.y), goal_dist_tolerance, color='red', fill=False))
+        ax.plot(goal.x, goal.y, '+r')
+    return fig, ax
+
+
+def plot_tree(world: WorldGrid, nodes: list, goal: PoseR2S2 = None, goal_dist_tolerance=1.0,
+              file_names: List[str] = ('./out/tree.png',), draw_edges=False):
+    """
+    Plots the tree nodes with a single scatter and, if draw_edges, the parent to child links with a single
+    LineCollection. The figure is saved once per file name, the format is selected by the file extension.
+    """
+    fig, ax = setup_world_axes(world, goal, goal_dist_tolerance)
+    xy = np.array([(node.pose.x, node.pose.y) for node in nodes]).reshape(-1, 2)
+    if draw_edges:
+        links = [((node.parent.pose.x, node.parent.pose.y), (node.pose.x, node.pose.y)) for node in nodes
+                 if node.parent is not None]
+        ax.add_collection(LineCollection(links, colors='c', linewidths=0.5))
+    ax.scatter(xy[:, 0], xy[:, 1], marker='x', c='b', linewidths=1.)
+    for file_name in file_names:
+        fig.savefig(file_name, dpi=150, bbox_inches='tight', pad_inches=0.1)
+    plt.close(fig)
+
+
+class SolutionAnimator(object):
+    """
+    Renders the vehicle footprint along a solution, one frame per solution sample.
+    The map, goal and axes are drawn once and restored from a cached background (blitting),
+    each frame only redraws the vehicle outline LineCollection.
+    """
+
+    def __init__(self, world: WorldGrid, segments: np.ndarray, goal: PoseR2S2 = None, goal_dist_tolerance=1.0,
+                 dpi=200, color='b'):
+        self.segments = segments  # type: np.ndarray  # see vehicle_segments()
+        self.fig, self.ax = setup_world_axes(world, goal, goal_dist_tolerance)
+        self.fig.set_dpi(dpi)
+        self.outline = LineCollection([], colors=color, animated=True)
+        self.ax.add_collection(self.outline)
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    @property
+    def frames_count(self) -> int:
+        return len(self.segments)
+
+    @property
+    def frame_size(self) -> tuple:
+        width, height = self.fig.canvas.get_width_height()
+        return width, height
+
+    def render(self, frame: int) -> np.ndarray:
+        """
+        :return: the frame as an (height, width, 4) RGBA array
+        """
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+        self.outline.set_segments(self.segments[frame])
+        self.ax.draw_artist(self.outline)
+        return np.asarray(canvas.buffer_rgba())
+
+    def close(self):
+        plt.close(self.fig)
+
+
+def _render_png_frames(world: WorldGrid, segments: np.ndarray, goal: PoseR2S2, goal_dist_tolerance: float,
+                       file_name: str, first_frame: int) -> int:
+    animator = SolutionAnimator(world, segments, goal, goal_dist_tolerance)
+    for frame in range(animator.frames_count):
+        # png encoding dominates the frame time, favour speed over file size
+        Image.fromarray(animator.render(frame)).save('{0}{1:04d}.png'.format(file_name, first_frame + frame),
+                                                     compress_level=1)
+    animator.close()
+    return animator.frames_count
+
+
+def render_png_frames(world: WorldGrid, segments: np.ndarray, goal: PoseR2S2 = None, goal_dist_tolerance=1.0,
+                      file_name='frame', workers=0):
+    """
+    Saves one png per frame ({file_name}0000.png, {file_name}0001.png, ...). Frames are split in chunks
+    rendered in parallel by a pool of workers, workers=0 uses one worker per cpu.
+    """
+    workers = multiprocessing.cpu_count() if workers <= 0 else workers
+    chunks = np.array_split(np.arange(len(segments)), workers)
+    args = [(world, segments[chunk], goal, goal_dist_tolerance, file_name, chunk[0]) for chunk in chunks
+            if len(chunk) > 0]
+    if len(args) <= 1:
+        return sum(_render_png_frames(*arg) for arg in args)
+    # workers must not inherit an interactive backend from the parent process
+    with multiprocessing.get_context('spawn').Pool(len(args), initializer=matplotlib.use, initargs=('Agg',)) as pool:
+        return sum(pool.starmap(_render_png_frames, args))
+
+
+def render_video(world: WorldGrid, segments: np.ndarray, goal: PoseR2S2 = None, goal_dist_tolerance=1.0,
+                 file_name='solution.mp4', fps=25):
+    """
+    Pipes the raw frames to ffmpeg which must be available on the path, raises RuntimeError if ffmpeg fails
+    (its errors are printed on stderr)
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError('ffmpeg not found, can\'t encode {0}'.format(file_name))
+    animator = SolutionAnimator(world, segments, goal, goal_dist_tolerance)
+    width, height = animator.frame_size
+    command = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgba',
+               '-s', '{0}x{1}'.format(width, height), '-r', str(fps), '-i', '-',
+               # yuv420p needs even dimensions
+               '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', file_name]
+    try:
+        with subprocess.Popen(command, stdin=subprocess.PIPE, bufsize=0) as encoder:
+            try:
+                for frame in range(animator.frames_count):
+                    encoder.stdin.write(animator.render(frame).tobytes())
+                encoder.stdin.close()
+            except BrokenPipeError:
+                pass  # ffmpeg exited early, its exit code is checked below
+    finally:
+        animator.close()
+    if encoder.returncode != 0:
+        raise RuntimeError('ffmpeg failed (exit code {0}), can\'t encode {1}'.format(encoder.returncode, file_name))
+    return animator.frames_count
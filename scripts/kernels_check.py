@@ -0,0 +1,104 @@
+import sys
+import math
+import numpy as np
+import prrt.kernels as kernels
+
+# Randomized checks of the loops kernels (compiled with numba when it is installed) against their numpy versions.
+# How to run, from the repository root: python -m scripts.kernels_check [number of trials] [seed]
+
+
+def polygons_min_distance_inputs(rng: np.random.RandomState) -> tuple:
+    polygons_count, vertices_count = rng.randint(1, 70), rng.choice([3, 4, 5])
+    polygons = rng.uniform(-5., 5., (polygons_count, 1, 2)) + rng.uniform(-1.5, 1.5,
+                                                                         (polygons_count, vertices_count, 2))
+    if rng.rand() < 0.3:
+        polygons = np.round(polygons * 4.) / 4.  # vertices on the cell corners
+    d = rng.uniform(0., 10., polygons_count)
+    resolution, size, count = 0.25, 6., 49
+    x_idx = np.floor(polygons[:, :, 0] / resolution) + int(size / resolution)
+    y_idx = np.floor(polygons[:, :, 1] / resolution) + int(size / resolution)
+    boxes = np.column_stack((np.maximum(0, x_idx.min(axis=1) - 1), np.minimum(count - 1, x_idx.max(axis=1)),
+                             np.maximum(0, y_idx.min(axis=1) - 1),
+                             np.minimum(count - 1, y_idx.max(axis=1)))).astype(np.int64)
+    return polygons, d, boxes, resolution, size, np.full((count, count), np.inf)
+
+
+def cptg_inverse_inputs(rng: np.random.RandomState) -> tuple:
+    x = rng.uniform(-6., 6., 1000)
+    y = rng.uniform(-6., 6., 1000)
+    y[::7] = 0.  # straight ahead or behind
+    x[::11] = 0.
+    return x, y, int(rng.choice([1, -1])), 1.0, 0.8, 1.7, math.radians(45.), math.radians(2.), 7.0
+
+
+def first_nearest_inputs(rng: np.random.RandomState) -> tuple:
+    count = rng.randint(0, 40)
+    d = np.where(rng.rand(count) < 0.3, np.inf, rng.uniform(0., 8., count))
+    if rng.rand() < 0.2:
+        d = np.round(d)  # ties
+    return rng.uniform(0., 5., count), rng.uniform(0., 5., count), d
+
+
+def cost_to_go_inputs(rng: np.random.RandomState) -> tuple:
+    h, w = rng.randint(1, 60), rng.randint(1, 60)
+    blocked = rng.rand(h, w) < rng.uniform(0., 0.4)
+    for _ in range(rng.randint(0, 4)):  # walls, some of them closing off parts of the grid
+        iy, ix = rng.randint(0, h), rng.randint(0, w)
+        blocked[iy:iy + rng.randint(1, h + 1), ix:ix + rng.randint(1, 3)] = True
+    goal_iy, goal_ix = rng.randint(0, h), rng.randint(0, w)
+    blocked[goal_iy, goal_ix] = False
+    x_resolution = rng.uniform(0.05, 0.3)
+    y_resolution = x_resolution if rng.rand() < 0.5 else rng.uniform(0.05, 0.3)
+    return blocked, goal_ix, goal_iy, x_resolution, y_resolution
+
+
+INPUTS = {'polygons_min_distance': polygons_min_distance_inputs,
+          'cptg_inverse': cptg_inverse_inputs,
+          'first_nearest': first_nearest_inputs,
+          'cost_to_go': cost_to_go_inputs}
+
+OUTPUT_ARGUMENT = {'polygons_min_distance': 5}  # kernels updating an argument in place instead of returning
+
+
+def same(expected, actual) -> bool:
+    expected = np.asarray(expected)
+    actual = np.asarray(actual)
+    if expected.dtype.kind == 'f':
+        # up to the last bits of the compiled math functions
+        return expected.shape == actual.shape and np.allclose(expected, actual, rtol=1e-12, atol=0., equal_nan=True)
+    return np.array_equal(expected, actual)
+
+
+def check(trials: int, seed: int) -> int:
+    assert set(INPUTS) == set(kernels._LOOPS), 'every kernel must have an inputs generator'
+    backend = kernels.set_backend()
+    print('Kernels backend: {0}'.format(backend))
+    rng = np.random.RandomState(seed)
+    failures = 0
+    for name in sorted(kernels._LOOPS):
+        loops = kernels._implementations[name] if backend == 'numba' else kernels._LOOPS[name]
+        for trial in range(trials):
+            args = INPUTS[name](rng)
+            numpy_args = tuple(arg.copy() if isinstance(arg, np.ndarray) else arg for arg in args)
+            expected = kernels._NUMPY[name](*numpy_args)
+            actual = loops(*args)
+            if name in OUTPUT_ARGUMENT:
+                expected, actual = numpy_args[OUTPUT_ARGUMENT[name]], args[OUTPUT_ARGUMENT[name]]
+            if not isinstance(expected, tuple):
+                expected, actual = (expected,), (actual,)
+            if not all(same(e, a) for e, a in zip(expected, actual)):
+                failures += 1
+                print('{0}: trial {1} differs from the numpy version'.format(name, trial))
+    return failures
+
+
+def main():
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    failures = check(trials, seed)
+    print('{0} kernels checked {1} times, {2} failures'.format(len(kernels._LOOPS), trials, failures))
+    sys.exit(1 if failures > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
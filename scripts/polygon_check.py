@@ -0,0 +1,95 @@
+import sys
+import random
+import numpy as np
+from prrt.primitive import PointR2, polygon_contains_point, points_in_polygon, points_in_polygons
+
+# Randomized property checks of the vectorized point in polygon kernels against the scalar version.
+# How to run, from the repository root: python -m scripts.polygon_check [number of polygons] [seed]
+
+
+def random_polygon(rng: random.Random) -> np.ndarray:
+    # star shaped (possibly non convex) polygon, some vertices share their y to stress the ray crossing rule
+    count = rng.randint(3, 12)
+    angles = sorted(rng.uniform(0., 2. * np.pi) for _ in range(count))
+    radii = [rng.uniform(0.2, 3.) for _ in range(count)]
+    center_x, center_y = rng.uniform(-5., 5.), rng.uniform(-5., 5.)
+    vertices = [(center_x + r * np.cos(a), center_y + r * np.sin(a)) for a, r in zip(angles, radii)]
+    if count > 3 and rng.random() < 0.5:
+        vertices[1] = (vertices[1][0], vertices[0][1])
+    if rng.random() < 0.3:
+        # axis aligned rectangle, as the vehicle shapes at theta = 0
+        x_min, y_min = rng.uniform(-5., 0.), rng.uniform(-5., 0.)
+        x_max, y_max = x_min + rng.uniform(0.5, 5.), y_min + rng.uniform(0.5, 5.)
+        vertices = [(x_max, y_min), (x_max, y_max), (x_min, y_max), (x_min, y_min)]
+    return np.array(vertices)
+
+
+def test_points(rng: random.Random, polygon: np.ndarray, count: int) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    :return: x, y of random points, vertices, edge points and points level with the vertices, and a mask of the
+     points known to be on the boundary
+    """
+    x_min, y_min = polygon.min(axis=0) - 1.
+    x_max, y_max = polygon.max(axis=0) + 1.
+    x = [rng.uniform(x_min, x_max) for _ in range(count)]
+    y = [rng.uniform(y_min, y_max) for _ in range(count)]
+    boundary = [False] * count
+    for a, b in zip(polygon, np.roll(polygon, -1, axis=0)):
+        x.append(a[0])
+        y.append(a[1])
+        boundary.append(True)
+        if a[0] == b[0] or a[1] == b[1]:
+            # exactly on an axis aligned edge
+            t = rng.random()
+            x.append(a[0] + t * (b[0] - a[0]) if a[0] != b[0] else a[0])
+            y.append(a[1] + t * (b[1] - a[1]) if a[1] != b[1] else a[1])
+            boundary.append(True)
+        x.append(rng.uniform(x_min, x_max))
+        y.append(a[1])
+        boundary.append(False)
+    return np.array(x), np.array(y), np.array(boundary)
+
+
+def check(polygons_count: int, seed: int) -> int:
+    rng = random.Random(seed)
+    failures = 0
+    polygons = []
+    for i in range(polygons_count):
+        polygon = random_polygon(rng)
+        polygons.append(polygon)
+        x, y, boundary = test_points(rng, polygon, 200)
+        shape = [PointR2(*vertex) for vertex in polygon]
+        scalar = np.array([polygon_contains_point(shape, PointR2(px, py)) for px, py in zip(x, y)])
+        vector = points_in_polygon(x, y, polygon)
+        properties = {'same as scalar': np.array_equal(scalar, vector),
+                      'boundary is inside': vector[boundary].all(),
+                      'start vertex invariant': np.array_equal(vector,
+                                                               points_in_polygon(x, y, np.roll(polygon, 3, axis=0))),
+                      'orientation invariant': np.array_equal(vector, points_in_polygon(x, y, polygon[::-1])),
+                      'outside bounding box': not vector[(x < polygon[:, 0].min() - 1e-6) |
+                                                         (x > polygon[:, 0].max() + 1e-6)].any()}
+        for name, holds in properties.items():
+            if not holds:
+                failures += 1
+                print('Polygon {0}: {1} failed\n{2}'.format(i, name, polygon.tolist()))
+    # many polygons at once, grouped by vertices count
+    x, y, _ = test_points(rng, np.array([[-8., -8.], [8., -8.], [8., 8.], [-8., 8.]]), 500)
+    for count in set(len(polygon) for polygon in polygons):
+        group = np.array([polygon for polygon in polygons if len(polygon) == count])
+        expected = np.array([points_in_polygon(x, y, polygon) for polygon in group])
+        if not np.array_equal(points_in_polygons(x, y, group), expected):
+            failures += 1
+            print('points_in_polygons differs from points_in_polygon for {0} vertices polygons'.format(count))
+    return failures
+
+
+def main():
+    polygons_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    failures = check(polygons_count, seed)
+    print('{0} polygons checked, {1} failures'.format(polygons_count, failures))
+    sys.exit(1 if failures > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()